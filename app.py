@@ -1,3 +1,4 @@
+import asyncio
 import datetime as dt
 import io
 import json
@@ -5,31 +6,47 @@ import logging
 from pathlib import Path
 import urllib.parse
 
-import dotenv
-import openai
 from pyprojroot import here
 from shiny import App, reactive, render, ui
 
-from scripts.app_config import APP_LLM
-from scripts.chat_utils import _init_stream
-from scripts.chroma_utils import ChromaDBPipeline
+from scripts.app_config import (
+    APP_LLM,
+    FACET_MAX_GROUPS,
+    MODERATION_FAIL_OPEN,
+    SINGLE_CALL_EXTRACTION,
+    WARM_UP_ON_START,
+)
+from scripts.chat_utils import (
+    _init_stream, build_completion_params, StreamedCompletion
+)
+from scripts.chroma_utils import new_chroma_pipeline
+from scripts.circuit_breaker import DependencyUnavailable, get_breaker
 from scripts.custom_components import (
-    feedback_tab, more_info_tab, inputs_with_popovers
+    feedback_tab, more_info_tab, inputs_with_popovers, results_table
 )
 from scripts.custom_tools import (
+    CountRepos,
     DraftEmail,
-    ExplainTools,
     ExportDataToTSV,
     ExtractKeywordEntities,
     ShouldDraftEmail,
     ShouldExplainTools,
     ShouldExtractKeywords,
+    draft_email_toolbox,
+    extraction_toolbox,
+    single_call_toolbox,
     toolbox,
     WipeChat,
     )
+from scripts.explanation_cache import (
+    cacheable_explanation, get_tool_explanation_cache, tool_explainer_params
+)
+from scripts.history import HistoryManager
 from scripts.icons import question_circle
 from scripts.moderations import check_moderation
 from scripts.prompts import (
+    ASSISTANT_UNAVAILABLE_MSG,
+    COUNTS_UNAVAILABLE_MSG,
     DRAFT_EMAIL_PROMPT,
     EMAIL_COMPLETION_MSG,
     EMAIL_SYS_PROMPT,
@@ -37,29 +54,36 @@ from scripts.prompts import (
     EXTRACTION_SYS_PROMPT,
     EXPORT_FILENM,
     EXPORT_MSG,
-    TOOL_EXPLAINER_PROMPT,
-    TOOL_EXPLAINER_SYS_PROMPT,
-    TOOLS_MISUSE_DEFENCE,
+    MODERATION_UNAVAILABLE_MSG,
+    NO_RAW_RESULTS_MSG,
+    ORCHESTRATOR_SYS_PROMPT,
+    RAW_RESULTS_MSG,
+    SEARCH_UNAVAILABLE_MSG,
+    SINGLE_CALL_ORCHESTRATOR_SYS_PROMPT,
     )
+from scripts.startup import (
+    get_data_vintage, get_facet_index, get_openai_client, start_warm_up
+)
 from scripts.string_utils import sanitise_string
+from scripts.tool_registry import ToolRegistry
+from scripts.turn_metrics import TurnMetrics
 
 # Before ==================================================================
-secrets = dotenv.dotenv_values(here(".env"))
 app_dir = Path(__file__).parent
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[logging.FileHandler(here("logs/app.log"))],
     )
-stream = [] # Orchestrator stream                  
-extraction_stream = [] # Keyword extraction stream
-tool_explainer_stream = []
-draft_email_stream = []
-_init_stream(_stream=stream)
+if SINGLE_CALL_EXTRACTION:
+    orchestrator_sys_prompt = SINGLE_CALL_ORCHESTRATOR_SYS_PROMPT
+    orchestrator_toolbox = single_call_toolbox
+else:
+    orchestrator_sys_prompt = ORCHESTRATOR_SYS_PROMPT
+    orchestrator_toolbox = toolbox
 
-openai_client = openai.OpenAI(api_key=secrets["OPENAI_KEY"])
-chroma_pipeline = ChromaDBPipeline()
-chroma_pipeline.get_data_vintage()
-vintage = chroma_pipeline.data_vintage
+# heavy resources load lazily, see scripts.startup
+if WARM_UP_ON_START:
+    start_warm_up()
 
 # Startup ends ============================================================
 
@@ -96,7 +120,7 @@ app_ui = ui.page_fillable(
     ui.markdown(
         """**Public code** repositories in ministryofjustice and
         moj-analytical-services GitHub organisations are included."""),
-    ui.p(f"Data last updated: {vintage}"),
+    ui.p("Data last updated: ", ui.output_text("data_vintage", inline=True)),
     ui.card(  
     ui.layout_sidebar(
         ui.sidebar(
@@ -168,6 +192,16 @@ app_ui = ui.page_fillable(
 
 
 def server(input, output, session):
+    # each session holds its own chat streams
+    stream = [] # Orchestrator stream
+    extraction_stream = [] # Keyword extraction stream
+    tool_explainer_stream = []
+    draft_email_stream = []
+    _init_stream(_stream=stream, sys=orchestrator_sys_prompt)
+    history = HistoryManager()
+    openai_client = get_openai_client()
+    chroma_pipeline = new_chroma_pipeline() # vector store is opened on search
+    explanation_cache = get_tool_explanation_cache() # shared by sessions
 
     chat = ui.Chat(
         id="chat",
@@ -181,24 +215,384 @@ def server(input, output, session):
     async def clear_chats():
         """Erase all user & assistant response content from chat stream"""
         # wipe to sys & welcome msg only
-        _init_stream(_stream=stream)
+        _init_stream(_stream=stream, sys=orchestrator_sys_prompt)
+        wipe_export_table()
+        await chat.clear_messages()
+        await chat.append_message(stream[-1])
+
+
+    tools = ToolRegistry()
+
+
+    async def search_repos(
+        keywords:list,
+        sanitised_prompt:str,
+        sampling_params:dict,
+        turn_metrics:TurnMetrics,
+        ):
+        """Query the vector store with keywords & summarise the results."""
+        # Pydantic will raise if keywords violate schema rules
+        extracted_terms = ExtractKeywordEntities(
+            keywords=[sanitise_string(kwd) for kwd in keywords]
+            )
+        ui.notification_show(
+            ("Searching database for keywords:"
+            f" {', '.join(extracted_terms.keywords)}")
+            )
+        try:
+            # Nomic, chromadb & the retrieval service block, so search in a
+            # worker thread, leaving the event loop to other sessions
+            search = await asyncio.to_thread(
+                chroma_pipeline.execute_pipeline,
+                keywords=extracted_terms.keywords,
+                n_results=input.selected_n(),
+                distance_threshold=input.dist_thresh(),
+                sanitised_prompt=sanitised_prompt
+            )
+        except DependencyUnavailable as e:
+            await fall_back(SEARCH_UNAVAILABLE_MSG, "search", e, turn_metrics)
+            return
+        # this search's results, other tool calls may search too
+        ui_results = search["ui_results"]
+        summarise_this = search["summary_prompt"]
+        if (n_removed := search["total_removed"]) > 0:
+            ui.notification_show(
+                f"{n_removed} results were removed."
+                )
+        if len(search["results"]) == 0:
+            ui.notification_show(
+                "No results shown, increase distance threshold"
+                )
+        history.register_results(
+            summarise_this, search["results_reference"]
+            )
+        stream.append(summarise_this)
+        turn_metrics.record_compaction(history.compact(stream))
+        try:
+            summary = await start_orchestrator(sampling_params, turn_metrics)
+            turn_metrics.mark_first_token(summary.first_token_at)
+            await stream_to_chat(summary)
+        except DependencyUnavailable as e:
+            # show the ranked results without a summary
+            await fall_back(
+                RAW_RESULTS_MSG if ui_results else NO_RAW_RESULTS_MSG,
+                "summary",
+                e,
+                turn_metrics,
+                )
+        # queued by ui.Chat until the streamed summary has finished
+        if ui_results:
+            await chat.append_message(
+                {
+                    "role": "assistant",
+                    "content": results_table(ui_results)
+                    })
+
+
+    async def start_orchestrator(
+        sampling_params:dict, turn_metrics:TurnMetrics
+        ) -> StreamedCompletion:
+        """
+        Stream the orchestrator's response to the chat stream.
+
+        Chunks are read until text arrives or the tool calls are complete,
+        within the OpenAI timeout, see `scripts.circuit_breaker`. Later text
+        chunks are each waited for at most the same timeout.
+        """
+        params = build_completion_params(
+            stream,
+            tools=orchestrator_toolbox,
+            stream=True,
+            **sampling_params
+            )
+
+        async def start():
+            return await StreamedCompletion(
+                await turn_metrics.timed_call(
+                    "orchestrator",
+                    openai_client.chat.completions.create,
+                    **params
+                    ),
+                on_usage=lambda usage: turn_metrics.record_usage(
+                    "orchestrator", usage
+                    ),
+                chunk_timeout=get_breaker("openai").timeout,
+                ).start()
+
+        return await get_breaker("openai").call_async(start)
+
+
+    async def fall_back(
+        msg:str,
+        step:str,
+        error:DependencyUnavailable,
+        turn_metrics:TurnMetrics,
+        ):
+        """Tell the user a step is unavailable & record the fallback."""
+        turn_metrics.record_fallback(step, error.reason)
+        await chat.append_message(msg)
+        stream.append({"role": "assistant", "content": msg})
+
+
+    async def stream_to_chat(completion:StreamedCompletion):
+        """Stream a text response into the chat, then into the stream."""
+        await chat.append_message_stream(
+            completion.text_chunks(
+                on_complete=lambda content: stream.append(
+                    {"role": "assistant", "content": content}
+                    )
+                )
+            )
+
+
+    @tools.register(ExtractKeywordEntities)
+    async def extract_keyword_entities(
+        tool_args:ExtractKeywordEntities, **turn
+        ):
+        """Single call mode, keywords arrive with the tool call."""
+        await search_repos(keywords=tool_args.keywords, **turn)
+
+
+    @tools.register(ShouldExtractKeywords)
+    async def should_extract_keywords(
+        tool_args:ShouldExtractKeywords, **turn
+        ):
+        """Hand the user's prompt to the extraction agent, then search."""
+        # start a new extraction stream
+        _init_stream(
+            _stream=extraction_stream,
+            sys=EXTRACTION_SYS_PROMPT,
+            wlcm=None
+            )
+        extraction_stream.append(
+            {"role": "user", "content": turn["sanitised_prompt"]}
+            )
+        extraction_params = build_completion_params(
+            extraction_stream, tools=extraction_toolbox, temperature=0.0
+        )
+        try:
+            extraction_resp = await get_breaker("openai").call_async(
+                turn["turn_metrics"].timed_call,
+                "extraction",
+                openai_client.chat.completions.create,
+                **extraction_params
+            )
+        except DependencyUnavailable as e:
+            # search with the whole prompt rather than its keywords
+            turn["turn_metrics"].record_fallback("extraction", e.reason)
+            await search_repos(keywords=[turn["sanitised_prompt"]], **turn)
+            return
+
+        if (msg := extraction_resp.choices[0].message.content):
+            sanitised_msg = sanitise_string(msg)
+            await chat.append_message(sanitised_msg)
+            stream.append(
+                {"role": "assistant", "content": sanitised_msg}
+                )
+        else:
+            kwds = extraction_resp.choices[0].message.tool_calls[0].function.arguments
+            await search_repos(
+                keywords=ExtractKeywordEntities.model_validate_json(
+                    kwds
+                    ).keywords,
+                **turn,
+            )
+
+
+    @tools.register(CountRepos)
+    async def count_repos(tool_args:CountRepos, **turn):
+        """Count repos exactly from the facet index, without a model call."""
+        from scripts.facet_index import format_facet_answer
+
+        filters = tool_args.model_dump()
+        try:
+            answer = get_facet_index().query(**filters)
+        except FileNotFoundError:
+            logging.exception("No facet index to count repos from")
+            answer = None
+        logging.info(f"Repo counts for {filters}: {answer}")
+        content = sanitise_string(
+            format_facet_answer(answer, filters, FACET_MAX_GROUPS)
+            ) if answer else COUNTS_UNAVAILABLE_MSG
+        await chat.append_message(content)
+        stream.append({"role": "assistant", "content": content})
+
+
+    @tools.register(ExportDataToTSV)
+    async def export_data_to_tsv(tool_args:ExportDataToTSV, **turn):
+        """Trigger the download button if there are results to export."""
+        if tool_args.export:
+            dat = chroma_pipeline.export_table
+            if len(dat) == 0:
+                await chat.append_message(
+                    "No results found, please ask for repos first."
+                )
+            else:
+                await session.send_custom_message(
+                    "clickButton", "download_df"
+                    )
+                await chat.append_message(EXPORT_MSG)
+
+
+    @tools.register(WipeChat, exclusive=True)
+    async def wipe_chat(tool_args:WipeChat, **turn):
+        """Reset the chat & discard cached results."""
+        ui.notification_show(
+            "Resetting chat & discarding results"
+            )
+        reset_chat()
         wipe_export_table()
         await chat.clear_messages()
         await chat.append_message(stream[-1])
 
 
+    @tools.register(ShouldExplainTools)
+    async def should_explain_tools(tool_args:ShouldExplainTools, **turn):
+        """Explain the available tools, from cache where possible."""
+        style_guide = tool_args.style_guidance
+        ui.notification_show(
+            f"Asking for tool explanation with style guidance: {style_guide}"
+            )
+        tool_explanation = explanation_cache.get(style_guide)
+        if tool_explanation is None:
+            # the cache is shared by sessions, so the user's sampling
+            # parameters are not used
+            explainer_params = tool_explainer_params(style_guide)
+            tool_explainer_stream[:] = explainer_params["messages"]
+            try:
+                tool_explanation_resp = await get_breaker(
+                    "openai"
+                    ).call_async(
+                    turn["turn_metrics"].timed_call,
+                    "tool_explainer",
+                    openai_client.chat.completions.create,
+                    **explainer_params
+                )
+            except DependencyUnavailable as e:
+                await fall_back(
+                    ASSISTANT_UNAVAILABLE_MSG,
+                    "tool_explainer",
+                    e,
+                    turn["turn_metrics"],
+                    )
+                return
+            tool_explanation = cacheable_explanation(tool_explanation_resp)
+            if tool_explanation is not None:
+                explanation_cache.set(style_guide, tool_explanation)
+                # kept for restarts & the other workers' next start
+                await asyncio.to_thread(explanation_cache.save)
+            else:
+                # cut short or empty, so shown to this user but not cached
+                logging.warning("Tool explanation incomplete, not cached")
+                tool_explanation = (
+                    tool_explanation_resp.choices[0].message.content
+                    or ASSISTANT_UNAVAILABLE_MSG
+                    )
+        else:
+            logging.info("Tool explanation served from cache")
+        toolbox_manual = {
+            "role": "assistant",
+            "content": tool_explanation,
+            }
+        await chat.append_message(toolbox_manual)
+        stream.append(toolbox_manual)
+
+
+    @tools.register(ShouldDraftEmail)
+    async def should_draft_email(tool_args:ShouldDraftEmail, **turn):
+        """Draft an Email to the maintainers from the chat log."""
+        if not tool_args.use_tool:
+            return
+        ui.notification_show("Drafting your Email.")
+        _init_stream(
+            _stream=draft_email_stream,
+            sys=EMAIL_SYS_PROMPT,
+            wlcm=None
+        )
+        draft_prompt = DRAFT_EMAIL_PROMPT.format(
+            chat_log=stream[2:] # ignore sys & wlcm prompts
+            )
+        draft_email_stream.append(
+            {"role": "user", "content": draft_prompt}
+            )
+        draft_email_params = build_completion_params(
+            draft_email_stream,
+            tools=draft_email_toolbox,
+            **turn["sampling_params"]
+        )
+        try:
+            draft_email_resp = await get_breaker("openai").call_async(
+                turn["turn_metrics"].timed_call,
+                "draft_email",
+                openai_client.chat.completions.create,
+                **draft_email_params
+            )
+        except DependencyUnavailable as e:
+            await fall_back(
+                ASSISTANT_UNAVAILABLE_MSG,
+                "draft_email",
+                e,
+                turn["turn_metrics"],
+                )
+            return
+        args = json.loads(
+            draft_email_resp.choices[0].message.tool_calls[0].function.arguments
+            )
+        draft_email = DraftEmail(
+            subject = urllib.parse.quote(args["subject"]),
+            body = urllib.parse.quote(args["body"]),
+        )
+        href = EMAIL_TEMPLATE.format(
+            subject=draft_email.subject,
+            body=draft_email.body
+            )
+        link = ui.tags.a(
+            "Click to launch your default Email app.",
+            {"href": href, "target": "_blank"}
+            )
+        _modal = ui.modal(  
+            link, 
+            title="Here is your draft Email.",  
+            easy_close=True,  
+        )
+        await chat.append_message(EMAIL_COMPLETION_MSG)
+        stream.append(
+            {
+                "role": "assistant",
+                "content": EMAIL_COMPLETION_MSG
+            }
+        )
+        # Open the URL in a modal window, note that presenting this link
+        # in chat UI is incorrectly formatted, even when url-encoded. Also
+        # tried webbrowser.open_new but is server-side only and will not
+        # work when hosted.
+        ui.modal_show(_modal)
+
+
     @chat.on_user_submit
     async def respond():
         """A callback to run when the user submits a message."""
+        turn_metrics = TurnMetrics()
         sanitised_prompt = sanitise_string(chat.user_input())
         logging.info("User submitted prompt =============================")
         logging.info(f"Santised user input: {sanitised_prompt}")
         logging.info("Moderating prompt =================================")
-        flagged_prompt = await check_moderation(
-            prompt=sanitised_prompt, openai_client=openai_client
-            )
+        try:
+            flagged_prompt = await get_breaker("moderation").call_async(
+                check_moderation,
+                prompt=sanitised_prompt,
+                openai_client=openai_client,
+                )
+        except DependencyUnavailable as e:
+            turn_metrics.record_fallback("moderation", e.reason)
+            # None refuses the prompt, unmoderated
+            flagged_prompt = sanitised_prompt if MODERATION_FAIL_OPEN else None
         logging.info(f"Moderation outcome: {flagged_prompt}")
-        if flagged_prompt != sanitised_prompt:
+        if flagged_prompt is None:
+            await chat.append_message(MODERATION_UNAVAILABLE_MSG)
+            logging.info(f"Unmoderated prompt refused: {sanitised_prompt}")
+            del sanitised_prompt
+        elif flagged_prompt != sanitised_prompt:
             await chat.append_message({
                 "role": "assistant",
                 "content": ("Your message may violate OpenAI's usage "
@@ -211,263 +605,52 @@ def server(input, output, session):
         else:
             # prompt has passed moderation
             stream.append({"role": "user", "content": sanitised_prompt})
+            turn_metrics.record_compaction(history.compact(stream))
             #  Meta summary -----------------------------------------------
-            completions_params = {
-                "model": APP_LLM,
-                "messages": stream,
-                "stream": False,
-                "tools": toolbox,
+            sampling_params = {
                 "max_completion_tokens": input.max_tokens(),
                 "presence_penalty": input.pres_pen(),
                 "frequency_penalty": input.freq_pen(),
                 "temperature": input.temp(),
             }
-            response = openai_client.chat.completions.create(
-                **completions_params
-            )
+            # text is streamed as it arrives, tool calls are buffered
+            try:
+                resp = await start_orchestrator(sampling_params, turn_metrics)
+            except DependencyUnavailable as e:
+                await fall_back(
+                    ASSISTANT_UNAVAILABLE_MSG, "orchestrator", e, turn_metrics
+                    )
+                resp = None
             # implement conditional flow dependent upon whether a tool call
-            resp = response.choices[0]
-            if (refusal := resp.message.refusal):
+            if resp is None:
+                pass # the user has been told the assistant is unavailable
+
+            elif (refusal := resp.refusal):
                 sanitised_refusal = sanitise_string(refusal)
                 await chat.append_message(sanitised_refusal)
                 stream.append(
                     {"role": "assistant", "content": sanitised_refusal}
                     )
 
-            elif (msg := resp.message.content):
-                sanitised_msg = sanitise_string(msg)
-                await chat.append_message(sanitised_msg)
-                stream.append(
-                    {"role": "assistant", "content": sanitised_msg}
+            elif resp.is_text:
+                turn_metrics.mark_first_token(resp.first_token_at)
+                await stream_to_chat(resp)
+
+            elif resp.tool_calls:
+                # independent tool calls run concurrently
+                await tools.dispatch(
+                    resp.tool_calls,
+                    sanitised_prompt=sanitised_prompt,
+                    sampling_params=sampling_params,
+                    turn_metrics=turn_metrics,
                     )
 
-            elif (tool_call := resp.message.tool_calls):
-                function_name = tool_call[0].function.name
-                args = json.loads(tool_call[0].function.arguments)
-                sanitised_func_nm = sanitise_string(function_name)
-
-                if sanitised_func_nm == "ShouldExtractKeywords":
-                    # pydantic defence
-                    extract_this = ShouldExtractKeywords(
-                        use_tool=args["use_tool"],
-                        )
-                    # start a new extraction stream
-                    _init_stream(
-                        _stream=extraction_stream,
-                        sys=EXTRACTION_SYS_PROMPT,
-                        wlcm=None
-                        )
-                    extraction_stream.append(
-                        {"role": "user", "content": sanitised_prompt}
-                        )
-                    extraction_params = {
-                        "model": APP_LLM,
-                        "messages": extraction_stream,
-                        "stream": False,
-                        "tools": [
-                            openai.pydantic_function_tool(
-                                ExtractKeywordEntities
-                                ),
-                            ],
-                        "temperature": 0.0,
-                    }
-                    extraction_resp = openai_client.chat.completions.create(
-                        **extraction_params
-                    )
-
-                    if (msg := extraction_resp.choices[0].message.content):
-                        sanitised_msg = sanitise_string(msg)
-                        await chat.append_message(sanitised_msg)
-                        stream.append(
-                            {"role": "assistant", "content": sanitised_msg}
-                            )
-                    else:
-                        kwds = extraction_resp.choices[0].message.tool_calls[0].function.arguments
-                        sanitised_kwds = [
-                            sanitise_string(kwd) for kwd in
-                            json.loads(kwds)["keywords"]
-                        ]
-                        # Pydantic will raise if keywords violate schema rules
-                        extracted_terms = ExtractKeywordEntities(
-                            keywords=sanitised_kwds
-                            )
-                        ui.notification_show(
-                            ("Searching database for keywords:"
-                            f" {', '.join(extracted_terms.keywords)}")
-                            )
-                        summarise_this = chroma_pipeline.execute_pipeline(
-                            keywords=extracted_terms.keywords,
-                            n_results=input.selected_n(),
-                            distance_threshold=input.dist_thresh(),
-                            sanitised_prompt=sanitised_prompt
-                        )
-                        if (n_removed := chroma_pipeline.total_removed) > 0:
-                            ui.notification_show(
-                                f"{n_removed} results were removed."
-                                )
-                        if len(chroma_pipeline.results) == 0:
-                            ui.notification_show(
-                                "No results shown, increase distance threshold"
-                                )
-                        stream.append(summarise_this)
-                        response = openai_client.chat.completions.create(
-                            **completions_params
-                            )
-                        meta_resp = {
-                            "role": "assistant",
-                            "content": response.choices[0].message.content
-                            }
-                        await chat.append_message(response)
-                        await chat.append_message(
-                            {
-                                "role": "assistant",
-                                "content": chroma_pipeline.chat_ui_results
-                                })
-                        stream.append(meta_resp)
-
-                elif sanitised_func_nm == "ExportDataToTSV":
-                    should_export = args["export"]
-                    if should_export:
-                        dat = chroma_pipeline.export_table
-                        if len(dat) == 0:
-                            await chat.append_message(
-                                "No results found, please ask for repos first."
-                            )
-                        else:
-                            # pydantic raises if doesn't conform to spec
-                            ExportDataToTSV(export=should_export)
-                            await session.send_custom_message(
-                                "clickButton", "download_df"
-                                )
-                            await chat.append_message(EXPORT_MSG)
-
-                elif sanitised_func_nm == "WipeChat":
-                    ui.notification_show(
-                        "Resetting chat & discarding results"
-                        )
-                    # pydantic defence
-                    WipeChat(use_tool=args["use_tool"])
-                    reset_chat()
-                    wipe_export_table()
-                    await chat.clear_messages()
-                    await chat.append_message(stream[-1])
-                    
-                elif sanitised_func_nm == "ShouldExplainTools":
-                    style_guide = args["style_guidance"]
-                    ui.notification_show(
-                        f"Asking for tool explanation with style guidance: {style_guide}"
-                        )
-                    # pydantic defence
-                    should_explain_tools = ShouldExplainTools(
-                        use_tool=args["use_tool"],
-                        style_guidance=style_guide,
-                        )
-                    _init_stream(
-                        _stream=tool_explainer_stream,
-                        sys=TOOL_EXPLAINER_SYS_PROMPT,
-                        wlcm=None
-                        )
-                    explain_prompt = {
-                        "role": "user",
-                        "content": TOOL_EXPLAINER_PROMPT.format(
-                            style_guide=style_guide,
-                            TOOLS_MISUSE_DEFENCE=TOOLS_MISUSE_DEFENCE,
-                            ),
-                        }
-                    tool_explainer_stream.append(explain_prompt)
-                    tool_explainer_params = {
-                        "model": APP_LLM,
-                        "messages": tool_explainer_stream,
-                        "stream": False,
-                        "max_completion_tokens": input.max_tokens(),
-                        "presence_penalty": input.pres_pen(),
-                        "frequency_penalty": input.freq_pen(),
-                        "temperature": input.temp(),
-                    }
-                    tool_explanation_resp = openai_client.chat.completions.create(
-                        **tool_explainer_params
-                    )
-                    tool_explanation = tool_explanation_resp.choices[0].message.content
-                    toolbox_manual = {
-                        "role": "assistant",
-                        "content": tool_explanation,
-                        }
-                    await chat.append_message(toolbox_manual)
-                    stream.append(toolbox_manual)
-
-                elif sanitised_func_nm == "ShouldDraftEmail":
-                    # pydantic defence
-                    should_draft_email = ShouldDraftEmail(
-                        use_tool=args["use_tool"],
-                        )
-                    if should_draft_email:
-                        ui.notification_show("Drafting your Email.")
-                        _init_stream(
-                            _stream=draft_email_stream,
-                            sys=EMAIL_SYS_PROMPT,
-                            wlcm=None
-                        )
-                        draft_prompt = DRAFT_EMAIL_PROMPT.format(
-                            chat_log=stream[2:] # ignore sys & wlcm prompts
-                            )
-                        draft_email_stream.append(
-                            {"role": "user", "content": draft_prompt}
-                            )
-                        draft_email_params = {
-                            "model": APP_LLM,
-                            "messages": draft_email_stream,
-                            "stream": False,
-                            "max_completion_tokens": input.max_tokens(),
-                            "presence_penalty": input.pres_pen(),
-                            "frequency_penalty": input.freq_pen(),
-                            "temperature": input.temp(),
-                            "tools": [
-                                openai.pydantic_function_tool(
-                                    DraftEmail
-                                    ),
-                                ],
-                        }
-                        draft_email_resp = openai_client.chat.completions.create(
-                            **draft_email_params
-                        )
-                        args = json.loads(
-                            draft_email_resp.choices[0].message.tool_calls[0].function.arguments
-                            )
-                        draft_email = DraftEmail(
-                            subject = urllib.parse.quote(args["subject"]),
-                            body = urllib.parse.quote(args["body"]),
-                        )
-                        href = EMAIL_TEMPLATE.format(
-                            subject=draft_email.subject,
-                            body=draft_email.body
-                            )
-                        link = ui.tags.a(
-                            "Click to launch your default Email app.",
-                            {"href": href, "target": "_blank"}
-                            )
-                        _modal = ui.modal(  
-                            link, 
-                            title="Here is your draft Email.",  
-                            easy_close=True,  
-                        )
-                        await chat.append_message(EMAIL_COMPLETION_MSG)
-                        stream.append(
-                            {
-                                "role": "assistant",
-                                "content": EMAIL_COMPLETION_MSG
-                            }
-                        )
-                        # Open the URL in a modal window, note that
-                        # presenting this link in chat UI is incorrectly
-                        # formatted, even when url-encoded. Also tried
-                        # webbrowser.open_new but is server-side only and
-                        # will not work when hosted.
-                        ui.modal_show(_modal)
+        turn_metrics.log()
 
 
     def reset_chat():
-        """Call this when session flushes to wipe messages to scratch"""
-        _init_stream(_stream=stream)
+        """Call this to wipe messages to scratch"""
+        _init_stream(_stream=stream, sys=orchestrator_sys_prompt)
     
 
     def wipe_export_table():
@@ -475,6 +658,12 @@ def server(input, output, session):
         chroma_pipeline.reset_export_table()
 
 
+    @render.text
+    async def data_vintage():
+        # may ask the retrieval service, so kept off the event loop
+        return await asyncio.to_thread(get_data_vintage)
+
+
     @render.download(filename=EXPORT_FILENM)
     def download_df():
         """Output current export table to tsv"""
@@ -485,7 +674,6 @@ def server(input, output, session):
         ui.notification_show(EXPORT_MSG)
 
 
-    session.on_flush(reset_chat, once=False)
     session.on_flushed(wipe_export_table, once=True)
     session.on_ended(wipe_export_table)
 
@@ -0,0 +1,146 @@
+"""Time CountRepos queries against the facet index, and the index load.
+
+Builds a FacetIndex over synthetic repo metadata, then times queries
+answered from the precomputed counts and those that mask the columns,
+checking each against the same count by pandas:
+
+* counts: language, archived status & org filters, as precomputed.
+* grouped: the same, grouped by org.
+* topic: a topic filter, grouped by language.
+* recency: repos not updated in a year, grouped by year last updated.
+
+Usage:
+    python -m benchmarks.facet_query --n-repos 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+QUERIES = {
+    "counts": {
+        "org_nm": "moj-analytical-services",
+        "programming_language": "python",
+        "is_archived": True,
+    },
+    "grouped": {
+        "programming_language": "python",
+        "is_archived": True,
+        "group_by": "org_nm",
+    },
+    "topic": {"topic": "data", "group_by": "programming_language"},
+    "recency": {"not_updated_within_days": 365, "group_by": "updated_year"},
+}
+NOW = 1_760_000_000 # fixed, so runs are comparable
+
+
+def synthetic_metadata(n_repos:int, seed:int=42):
+    """Repo facet columns, with a few topics per repo."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    topics = np.array(["data", "hmpps", "terraform", "python", "ml", "api"])
+    return pd.DataFrame({
+        "org_nm": rng.choice(
+            ["ministryofjustice", "moj-analytical-services"], n_repos
+            ),
+        "programming_language": rng.choice(
+            ["Python", "R", "HCL", "Ruby", "TypeScript", None], n_repos
+            ),
+        "is_archived": rng.random(n_repos) < 0.3,
+        "updated_at": pd.to_datetime(
+            rng.integers(1_400_000_000, NOW, n_repos), unit="s"
+            ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "topics": [
+            list(rng.choice(topics, rng.integers(0, 4), replace=False))
+            for _ in range(n_repos)
+        ],
+    })
+
+
+def pandas_count(df, query:dict) -> int:
+    """The count of a query by pandas, to check the index."""
+    import pandas as pd
+
+    mask = np.ones(len(df), dtype=bool)
+    if query.get("org_nm"):
+        mask &= df["org_nm"].str.lower() == query["org_nm"].lower()
+    if query.get("programming_language"):
+        mask &= df["programming_language"].fillna("").str.lower() == (
+            query["programming_language"].lower()
+            )
+    if query.get("is_archived") is not None:
+        mask &= df["is_archived"] == query["is_archived"]
+    if query.get("topic"):
+        mask &= df["topics"].apply(lambda topics: query["topic"] in topics)
+    if query.get("not_updated_within_days") is not None:
+        updated_at = pd.to_datetime(df["updated_at"], utc=True).dt.as_unit(
+            "s"
+            ).astype("int64")
+        mask &= updated_at < NOW - query["not_updated_within_days"] * 86_400
+    return int(mask.sum())
+
+
+def main():
+    from scripts.facet_index import FacetIndex
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-repos", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=1_000)
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    args = parser.parse_args()
+
+    df = synthetic_metadata(args.n_repos)
+    start = time.perf_counter()
+    index = FacetIndex.from_frame(df)
+    build_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_pth = os.path.join(tmp_dir, "facets.npz")
+        index.save(index_pth)
+        index_bytes = os.path.getsize(index_pth)
+        start = time.perf_counter()
+        index = FacetIndex.load(index_pth)
+        load_seconds = time.perf_counter() - start
+
+    report = []
+    for nm, query in QUERIES.items():
+        answer = index.query(now=NOW, **query)
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            index.query(now=NOW, **query)
+        report.append({
+            "query": nm,
+            "microseconds": round(
+                (time.perf_counter() - start) / args.repeats * 1e6, 1
+                ),
+            "count": answer["count"],
+            "exact": answer["count"] == pandas_count(df, query),
+        })
+
+    print(
+        f"{args.n_repos} repos, index {index_bytes / 1024:.0f}KB, built in "
+        f"{build_seconds:.3f}s, loaded in {load_seconds * 1e3:.1f}ms"
+    )
+    for result in report:
+        print(
+            f"  {result['query']:<8} {result['microseconds']:>8.1f}us, "
+            f"{result['count']} repos, exact: {result['exact']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "index_bytes": index_bytes,
+                "build_seconds": build_seconds,
+                "load_seconds": load_seconds,
+                "queries": report,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
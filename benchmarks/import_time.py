@@ -0,0 +1,102 @@
+"""Profile the import time of the app to catch cold start regressions.
+
+Imports the target module in fresh interpreters with `python -X importtime`
+and reports the median cumulative import time plus the slowest top-level
+packages. Exits non-zero if `--max-seconds` is exceeded, so it can gate CI.
+
+Usage:
+    python -m benchmarks.import_time --repeats 5 --max-seconds 2.0
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+from pyprojroot import here
+
+LINE_PAT = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def profile_import(module:str) -> dict:
+    """Import `module` in a fresh interpreter & parse the importtime log.
+
+    Returns cumulative import time in microseconds for each top-level
+    import, keyed by module name, plus the target module's own total.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    top_level = {}
+    for line in proc.stderr.splitlines():
+        match = LINE_PAT.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # importtime indents nested imports by two spaces per level
+        depth = (len(indent) - 1) // 2
+        if depth <= 1:
+            top_level[name] = int(cumulative)
+    return top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Fail if the median import time exceeds this many seconds",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.repeats)]
+    totals = [run[args.module] / 1e6 for run in runs]
+    median_total = statistics.median(totals)
+    # median cumulative time per dependency imported by the target
+    deps = {
+        nm: statistics.median(run.get(nm, 0) for run in runs) / 1e6
+        for nm in runs[-1] if nm != args.module
+    }
+    slowest = sorted(deps.items(), key=lambda kv: kv[1], reverse=True)
+
+    print(f"Median import time for {args.module}: {median_total:.3f}s")
+    print(f"Runs: {', '.join(f'{t:.3f}' for t in totals)}")
+    print(f"Slowest {args.top} imports:")
+    for nm, secs in slowest[:args.top]:
+        print(f"  {nm:<40} {secs:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "module": args.module,
+                    "median_seconds": median_total,
+                    "runs": totals,
+                    "slowest": dict(slowest[:args.top]),
+                },
+                f,
+                indent=2,
+            )
+
+    if args.max_seconds is not None and median_total > args.max_seconds:
+        print(
+            f"FAIL: median import time {median_total:.3f}s exceeds "
+            f"{args.max_seconds:.3f}s"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Load test the Shiny app with concurrent headless chat sessions.
+
+Each session opens the app's websocket, as a browser would, and replays
+prompts from a JSONL file into the chat. A turn ends once the assistant's
+last message has arrived and the session has been quiet for `--settle`
+seconds. Reports per-turn latency percentiles, time to first streamed chunk
+and errors. Run the app against `benchmarks.stub_server` to load test
+without live OpenAI & Nomic endpoints.
+
+Usage:
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 \\
+        --sessions 10 --prompts requests.jsonl --turns 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Union
+
+import websockets
+
+from scripts.custom_components import NUMERIC_PARAMS
+
+CHAT_ID = "chat"
+PROMPT_FIELDS = ["prompt", "title", "body"]
+
+
+def read_prompts(pth:str, field:Union[str, None]=None) -> list:
+    """Read prompts from a JSONL file, one per line."""
+    prompts = []
+    with open(pth) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                prompts.append(record)
+                continue
+            nm = field or next(
+                (fld for fld in PROMPT_FIELDS if record.get(fld)), None
+            )
+            if nm is None:
+                raise KeyError(f"No prompt field found in: {line[:80]}")
+            prompts.append(record[nm])
+    return prompts
+
+
+def websocket_url(url:str) -> str:
+    """The app's websocket endpoint for a http(s) app URL."""
+    return url.replace("http", "ws", 1).rstrip("/") + "/websocket/"
+
+
+def _chat_message(msg:dict) -> Union[dict, None]:
+    """Return an assistant chat message or chunk, if `msg` is one."""
+    chat_msg = msg.get("custom", {}).get("shinyChatMessage")
+    if not chat_msg or chat_msg.get("id") != CHAT_ID:
+        return None
+    if not chat_msg.get("handler", "").startswith("shiny-chat-append"):
+        return None
+    obj = chat_msg.get("obj") or {}
+    return obj if obj.get("role") == "assistant" else None
+
+
+def _error(msg:dict) -> Union[str, None]:
+    """Return an error description, if `msg` reports one."""
+    if msg.get("errors"):
+        return json.dumps(msg["errors"])[:200]
+    notification = msg.get("notification") or {}
+    message = notification.get("message") or {}
+    if notification.get("type") == "show" and message.get("type") == "error":
+        return str(message.get("html"))[:200]
+    return None
+
+
+async def run_turn(ws, prompt:str, settle:float, timeout:float) -> dict:
+    """Submit one prompt & time the response."""
+    started = time.perf_counter()
+    first_chunk = None
+    last_message = None
+    in_stream = False
+    errors = []
+    await ws.send(json.dumps({
+        "method": "update",
+        "data": {f"{CHAT_ID}_user_input": prompt},
+    }))
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed > timeout:
+            errors.append(f"Timed out after {timeout}s")
+            break
+        # once a message has arrived, wait only for stragglers
+        wait = timeout - elapsed
+        if last_message is not None and not in_stream:
+            wait = min(wait, settle)
+        try:
+            raw = await asyncio.wait_for(ws.recv(), timeout=wait)
+        except asyncio.TimeoutError:
+            if last_message is None or in_stream:
+                continue
+            break
+        now = time.perf_counter()
+        msg = json.loads(raw)
+        if (err := _error(msg)):
+            # the turn has failed, stop once the session is quiet
+            errors.append(err)
+            last_message = now
+        if (obj := _chat_message(msg)) is None:
+            continue
+        if first_chunk is None:
+            first_chunk = now
+        if obj.get("chunk_type") == "message_start":
+            in_stream = True
+        elif obj.get("chunk_type") == "message_end":
+            in_stream = False
+        last_message = now
+    return {
+        "latency": (last_message or time.perf_counter()) - started,
+        "first_chunk": (
+            first_chunk - started if first_chunk is not None else None
+        ),
+        "errors": errors,
+    }
+
+
+async def run_session(
+    session_n:int,
+    url:str,
+    prompts:list,
+    settle:float,
+    timeout:float,
+    ) -> list:
+    """Open a chat session & replay `prompts` in order."""
+    turns = []
+    init_inputs = {param["id"]: param["value"] for param in NUMERIC_PARAMS}
+    try:
+        async with websockets.connect(
+            websocket_url(url), max_size=None
+            ) as ws:
+            await ws.send(json.dumps({"method": "init", "data": init_inputs}))
+            # let the welcome message & initial outputs arrive
+            try:
+                while True:
+                    await asyncio.wait_for(ws.recv(), timeout=settle)
+            except asyncio.TimeoutError:
+                pass
+            for prompt in prompts:
+                turn = await run_turn(ws, prompt, settle, timeout)
+                turn["session"] = session_n
+                turns.append(turn)
+    except Exception as e:
+        turns.append({
+            "session": session_n,
+            "latency": None,
+            "first_chunk": None,
+            "errors": [f"{type(e).__name__}: {e}"],
+        })
+    return turns
+
+
+def percentiles(values:list) -> dict:
+    """p50, p90, p95 & p99 of `values`, in seconds."""
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {p: round(values[0], 3) for p in ["p50", "p90", "p95", "p99"]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {f"p{p}": round(cuts[p - 1], 3) for p in [50, 90, 95, 99]}
+
+
+async def load_test(args) -> dict:
+    prompts = read_prompts(args.prompts, args.field)
+    n_turns = args.turns or len(prompts)
+    # sessions start at different prompts, so they don't move in lockstep
+    session_prompts = [
+        [prompts[(i + j) % len(prompts)] for j in range(n_turns)]
+        for i in range(args.sessions)
+    ]
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        run_session(i, args.url, session_prompts[i], args.settle, args.timeout)
+        for i in range(args.sessions)
+    ])
+    wall_time = time.perf_counter() - started
+    turns = [turn for session in results for turn in session]
+    completed = [t for t in turns if t["latency"] is not None]
+    failed = [t for t in turns if t["errors"]]
+    return {
+        "sessions": args.sessions,
+        "turns": len(turns),
+        "failed_turns": len(failed),
+        "wall_time": round(wall_time, 3),
+        "turns_per_second": round(len(completed) / wall_time, 3),
+        "latency": percentiles(sorted(t["latency"] for t in completed)),
+        "first_chunk": percentiles(sorted(
+            t["first_chunk"] for t in completed
+            if t["first_chunk"] is not None
+        )),
+        "errors": [
+            {"session": t["session"], "errors": t["errors"]} for t in failed
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--prompts", default="requests.jsonl")
+    parser.add_argument(
+        "--field",
+        default=None,
+        help=f"JSONL field holding the prompt, default first of {PROMPT_FIELDS}",
+    )
+    parser.add_argument(
+        "--turns",
+        type=int,
+        default=None,
+        help="Prompts per session, defaults to every prompt in the file",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=1.0,
+        help="Quiet seconds after the last message that end a turn",
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(load_test(args))
+    print(
+        f"{report['sessions']} sessions, {report['turns']} turns in "
+        f"{report['wall_time']:.1f}s ({report['turns_per_second']} turns/s)"
+    )
+    print(f"Turn latency (s): {report['latency']}")
+    print(f"First chunk (s): {report['first_chunk']}")
+    print(f"Failed turns: {report['failed_turns']}")
+    for failure in report["errors"][:10]:
+        print(f"  session {failure['session']}: {failure['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
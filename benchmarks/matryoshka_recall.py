@@ -0,0 +1,101 @@
+"""Measure recall, latency & memory at each Matryoshka dimensionality.
+
+Truncates the same embeddings & queries to each of 768, 512, 256 and 128
+dimensions, as `02_create_vector_store.py` and the Nomic API do, and
+reports recall@k against the full 768 dimension results, index size and
+query latency of a float32 flat index at each size. Run with `--index-pth`
+on a full dimensionality flat index of real nomic-embed-text-v1.5
+embeddings for representative recall. The synthetic default has no
+Matryoshka structure, so understates the recall of truncated embeddings.
+
+Usage:
+    python -m benchmarks.matryoshka_recall --n-records 20000 --k 5
+    python -m benchmarks.matryoshka_recall \\
+        --index-pth data/nomic-embeddings/flat/moj-github-2024-11-01
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.quantisation_recall import (
+    clustered_embeddings, evaluate, make_queries
+)
+from scripts.flat_index import FlatIndex, write_flat_index
+from scripts.matryoshka import (
+    FULL_DIMENSIONALITY, MATRYOSHKA_DIMS, truncate_embeddings
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-records", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--dims", type=int, nargs="+", default=MATRYOSHKA_DIMS
+    )
+    parser.add_argument(
+        "--index-pth",
+        default=None,
+        help="Benchmark the embeddings of an existing full dimension index",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    args = parser.parse_args()
+
+    if args.index_pth:
+        embeddings = np.asarray(
+            FlatIndex(args.index_pth).embeddings, dtype=np.float32
+            )
+    else:
+        embeddings = clustered_embeddings(args.n_records, FULL_DIMENSIONALITY)
+    queries = make_queries(embeddings, args.queries)
+    n_records = len(embeddings)
+    ids = [str(i) for i in range(n_records)]
+    report = []
+    exact = None
+    with tempfile.TemporaryDirectory() as build_dir:
+        for dim in sorted(args.dims, reverse=True):
+            index_pth = os.path.join(build_dir, str(dim))
+            write_flat_index(
+                index_pth,
+                ids=ids,
+                embeddings=truncate_embeddings(embeddings, dim),
+                documents=ids,
+                metadatas=[{"n": i} for i in range(n_records)],
+            )
+            index = FlatIndex(index_pth)
+            dim_queries = truncate_embeddings(queries, dim)
+            if exact is None:
+                # recall is measured against the largest dimensionality
+                exact = [
+                    index.search(query, n_results=args.k)[0][0]
+                    for query in dim_queries
+                ]
+            report.append({
+                "dimensionality": dim,
+                "index_mb": round(index.embeddings.nbytes / 1024**2, 2),
+                **evaluate(index, dim_queries, exact, args.k),
+            })
+
+    print(f"{n_records} records, {args.queries} queries, k={args.k}")
+    for result in report:
+        print(
+            f"  {result['dimensionality']:>4} dims "
+            f"recall@{args.k} {result['recall_at_k']:.3f}, "
+            f"index {result['index_mb']:.1f}MB, "
+            f"p50 {result['query_p50_ms']:.2f}ms, "
+            f"p95 {result['query_p95_ms']:.2f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
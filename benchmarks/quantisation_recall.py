@@ -0,0 +1,164 @@
+"""Measure the recall@k trade-off of quantised flat indexes.
+
+Builds float32, int8 and binary flat indexes from the same embeddings and
+reports, for each, recall@k against the exact float32 results, resident
+index size and query latency. Quantised indexes are measured with & without
+the full precision re-rank. Embeddings are synthetic clusters, so that near
+neighbours are meaningful, or the rows of an existing flat index with
+`--index-pth`, queried by perturbed copies of its own rows.
+
+Usage:
+    python -m benchmarks.quantisation_recall --n-records 20000 --k 5
+    python -m benchmarks.quantisation_recall \\
+        --index-pth data/nomic-embeddings/flat/moj-github-2024-11-01
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from scripts.flat_index import (
+    QUANTISATIONS, FlatIndex, normalise_rows, write_flat_index
+)
+
+
+def clustered_embeddings(
+    n_records:int, dim:int, n_clusters:int=200, spread:float=0.5, seed:int=42
+    ) -> np.ndarray:
+    """Unit vectors scattered around random centres, like topic clusters."""
+    rng = np.random.default_rng(seed)
+    centres = normalise_rows(rng.standard_normal((n_clusters, dim)))
+    labels = rng.integers(0, n_clusters, n_records)
+    noise = rng.standard_normal((n_records, dim)) * spread / np.sqrt(dim)
+    return normalise_rows(centres[labels] + noise)
+
+
+def make_queries(
+    embeddings:np.ndarray, n_queries:int, noise:float=0.5, seed:int=0
+    ) -> np.ndarray:
+    """Perturbed copies of random rows, standing in for keyword queries."""
+    rng = np.random.default_rng(seed)
+    rows = embeddings[rng.integers(0, len(embeddings), n_queries)]
+    jitter = rng.standard_normal(rows.shape) * noise / np.sqrt(rows.shape[1])
+    return normalise_rows(rows + jitter)
+
+
+def recall_at_k(found:np.ndarray, exact:np.ndarray) -> float:
+    """Mean share of the exact top k found, per query."""
+    return float(np.mean([
+        len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)
+    ]))
+
+
+def evaluate(
+    index:FlatIndex, queries:np.ndarray, exact:np.ndarray, k:int
+    ) -> dict:
+    """Recall@k & per query latency of `index`."""
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        indices, _ = index.search(query, n_results=k)
+        latencies.append(time.perf_counter() - start)
+        found.append(indices[0])
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "recall_at_k": round(recall_at_k(found, exact), 4),
+        "query_p50_ms": round(cuts[49] * 1e3, 3),
+        "query_p95_ms": round(cuts[94] * 1e3, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-records", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--rerank-factors",
+        type=int,
+        nargs="+",
+        default=[1, 4, 10, 20],
+        help="Candidates per result re-ranked at full precision, 1 is none",
+    )
+    parser.add_argument(
+        "--index-pth",
+        default=None,
+        help="Benchmark the embeddings of an existing flat index",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    args = parser.parse_args()
+
+    if args.index_pth:
+        embeddings = np.asarray(
+            FlatIndex(args.index_pth).embeddings, dtype=np.float32
+            )
+    else:
+        embeddings = clustered_embeddings(args.n_records, args.dim)
+    queries = make_queries(embeddings, args.queries)
+    n_records = len(embeddings)
+    ids = [str(i) for i in range(n_records)]
+    report = []
+    with tempfile.TemporaryDirectory() as build_dir:
+        for quantisation in [None] + QUANTISATIONS:
+            index_pth = os.path.join(build_dir, quantisation or "float32")
+            write_flat_index(
+                index_pth,
+                ids=ids,
+                embeddings=embeddings,
+                documents=ids,
+                metadatas=[{"n": i} for i in range(n_records)],
+                quantisation=quantisation,
+            )
+            index = FlatIndex(index_pth)
+            if quantisation is None:
+                exact = [
+                    index.search(query, n_results=args.k)[0][0]
+                    for query in queries
+                ]
+                resident = index.embeddings
+            else:
+                resident = index.codes
+            # quantised indexes keep only their codes in memory
+            resident_mb = resident.nbytes / 1024**2
+            for factor in args.rerank_factors if quantisation else [None]:
+                if factor:
+                    index.rerank_factor = factor
+                result = evaluate(index, queries, exact, args.k)
+                report.append({
+                    "index": quantisation or "float32",
+                    "rerank_factor": factor,
+                    "resident_mb": round(resident_mb, 2),
+                    **result,
+                })
+
+    print(
+        f"{n_records} records x {embeddings.shape[1]} dims, "
+        f"{args.queries} queries, k={args.k}"
+    )
+    for result in report:
+        rerank = (
+            f"re-rank x{result['rerank_factor']:<3}"
+            if result["rerank_factor"] else "exact       "
+        )
+        print(
+            f"  {result['index']:<8} {rerank} "
+            f"recall@{args.k} {result['recall_at_k']:.3f}, "
+            f"resident {result['resident_mb']:.1f}MB, "
+            f"p50 {result['query_p50_ms']:.2f}ms, "
+            f"p95 {result['query_p95_ms']:.2f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Compare single file & split snapshot reads on load time and memory.
+
+Writes the same synthetic repo metadata, with README-sized text, as a
+single parquet file, the layout before `scripts.snapshot`, and as a
+snapshot directory. Each read runs in a fresh interpreter so resident
+memory is measured from a cold start:
+
+* legacy-full: `pd.read_parquet` of the single file, as builds used to.
+* snapshot-build: the columns `02_create_vector_store.py` reads.
+* snapshot-meta: a few metadata columns, without READMEs or summaries.
+* snapshot-ids: every column of a handful of repos, as a lookup.
+
+Usage:
+    python -m benchmarks.snapshot_load --n-repos 5000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from pyprojroot import here
+
+from benchmarks.vector_backends import _rss_mb
+
+LEGACY_NM = "repo-metadata-2024-01-01T00_00_00.000000.parquet"
+SNAPSHOT_NM = "repo-metadata-2024-01-01T00_00_00.000000"
+META_COLS = ["name", "html_url", "is_archived", "org_nm", "updated_at"]
+LOOKUP_IDS = [10_000, 10_001, 10_002, 10_003, 10_004]
+READS = ["legacy-full", "snapshot-build", "snapshot-meta", "snapshot-ids"]
+
+
+def synthetic_metadata(n_repos:int, seed:int=42):
+    """Repo metadata with long, variable length READMEs."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    words = np.array(["deploy", "service", "python", "terraform", "data"])
+    return pd.DataFrame({
+        "id": rng.permutation(n_repos) + 10_000,
+        "name": [f"repo-{i}" for i in range(n_repos)],
+        "html_url": [f"https://github.com/org/repo-{i}" for i in range(n_repos)],
+        "description": [f"Description of repo {i}" for i in range(n_repos)],
+        "is_private": False,
+        "is_archived": rng.random(n_repos) < 0.1,
+        "programming_language": "Python",
+        "updated_at": "2024-01-01T00:00:00Z",
+        "org_nm": "ministryofjustice",
+        "readme": [
+            " ".join(rng.choice(words, rng.integers(200, 3_000)))
+            for _ in range(n_repos)
+        ],
+        "ai_summary": [" ".join(rng.choice(words, 80)) for _ in range(n_repos)],
+    })
+
+
+def measure(read:str, data_dir:str) -> None:
+    """Run one read, in a fresh interpreter."""
+    import pandas as pd
+    import pyarrow.parquet # noqa: F401, imported ahead of the baseline
+    from scripts.snapshot import VECTOR_STORE_COLS, read_snapshot
+
+    snapshot_pth = os.path.join(data_dir, SNAPSHOT_NM)
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    if read == "legacy-full":
+        df = pd.read_parquet(os.path.join(data_dir, LEGACY_NM))
+    elif read == "snapshot-build":
+        df = read_snapshot(snapshot_pth, columns=VECTOR_STORE_COLS)
+    elif read == "snapshot-meta":
+        df = read_snapshot(snapshot_pth, columns=META_COLS)
+    else:
+        df = read_snapshot(snapshot_pth, ids=LOOKUP_IDS)
+    print(json.dumps({
+        "read": read,
+        "seconds": round(time.perf_counter() - start, 4),
+        "rss_mb": round(_rss_mb() - rss_before, 1),
+        "rows": len(df),
+        "columns": len(df.columns),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-repos", type=int, default=5_000)
+    parser.add_argument("--reads", nargs="+", default=READS)
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.data_dir)
+        return
+
+    from scripts.snapshot import write_snapshot
+
+    repo_metadata = synthetic_metadata(args.n_repos)
+    report = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        repo_metadata.to_parquet(os.path.join(data_dir, LEGACY_NM))
+        write_snapshot(repo_metadata, os.path.join(data_dir, SNAPSHOT_NM))
+        disk_mb = {
+            "legacy": os.path.getsize(os.path.join(data_dir, LEGACY_NM)),
+            "snapshot": sum(
+                os.path.getsize(os.path.join(data_dir, SNAPSHOT_NM, f))
+                for f in os.listdir(os.path.join(data_dir, SNAPSHOT_NM))
+            ),
+        }
+        for read in args.reads:
+            proc = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.snapshot_load",
+                    "--measure", read,
+                    "--data-dir", data_dir,
+                ],
+                cwd=here(),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            report.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(
+        f"{args.n_repos} repos, on disk: single file "
+        f"{disk_mb['legacy'] / 1024**2:.1f}MB, snapshot "
+        f"{disk_mb['snapshot'] / 1024**2:.1f}MB"
+    )
+    for result in report:
+        print(
+            f"  {result['read']:<15} {result['seconds']:.3f}s, "
+            f"rss {result['rss_mb']:.0f}MB, "
+            f"{result['rows']} rows x {result['columns']} columns"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"disk_bytes": disk_mb, "reads": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
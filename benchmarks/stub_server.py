@@ -0,0 +1,437 @@
+"""A local stand-in for the OpenAI & Nomic APIs, for load testing the app.
+
+Serves deterministic chat completions (text or tool calls, streamed or not),
+moderations and text embeddings with configurable latency, so that the app
+can be exercised without live endpoints or API costs. Also serves the Nomic
+user & token refresh endpoints the nomic client calls, and synthetic org
+repos for the GitHub GraphQL ingestion query. Point the app & pipeline at it
+with the following `.env` entries:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+    ATLAS_API_PATH=http://127.0.0.1:8001
+    NOMIC_KEY=nk-stub
+    GITHUB_GRAPHQL_URL=http://127.0.0.1:8001/graphql
+
+An `nk-` API key logs in to Nomic without a request. The nomic client
+exchanges any other key at the token refresh endpoint, which it always
+calls over https, so that needs a TLS proxy in front of the stub.
+
+Usage:
+    python -m benchmarks.stub_server --port 8001 --latency 0.5
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+import uvicorn
+
+from scripts.prompts import RESP_EVALUATION_PROMPT, STOP_WORDS
+
+# the summary prompt sent with database results always opens with this
+SUMMARY_MARKER = " ".join(RESP_EVALUATION_PROMPT.split())[:50]
+# tools the orchestrator is steered to, by words in the user's prompt
+TOOL_ROUTES = [
+    (re.compile(r"\bemail\b", re.I), ["ShouldDraftEmail", "DraftEmail"]),
+    (re.compile(r"\b(export|download)\b", re.I), ["ExportDataToTSV"]),
+    (re.compile(r"\b(reset|wipe|clear)\b", re.I), ["WipeChat"]),
+    (
+        re.compile(r"\b(tools|explain|what can you do)\b", re.I),
+        ["ShouldExplainTools"],
+    ),
+]
+SEARCH_TOOLS = ["ExtractKeywordEntities", "ShouldExtractKeywords"]
+
+
+class StubConfig:
+    """Latency & embedding settings, set from the command line."""
+
+    latency = 0.5
+    token_latency = 0.02
+    embedding_latency = 0.1
+    dimensionality = 768
+    repos_per_org = 250
+    token_lifetime = 3_600 # seconds before Nomic access tokens expire
+
+
+def _words(text:str) -> list:
+    return re.findall(r"[A-Za-z][\w-]{3,}", text or "")
+
+
+def _keywords(text:str, max_keywords:int=3) -> list:
+    """Deterministic 'extraction', the first few non stopwords."""
+    keywords = []
+    for word in _words(text):
+        word = word.lower()
+        if word not in STOP_WORDS and word not in keywords:
+            keywords.append(word)
+    return keywords[:max_keywords]
+
+
+def _tool_args(tool:dict, prompt:str) -> dict:
+    """Fill a tool's required arguments from its JSON schema."""
+    schema = tool["function"].get("parameters", {})
+    args = {}
+    for nm, prop in schema.get("properties", {}).items():
+        if prop.get("type") == "boolean":
+            args[nm] = True
+        elif prop.get("type") == "array":
+            args[nm] = _keywords(prompt) or ["python"]
+        elif nm == "style_guidance":
+            # the default style, so explanations are served from cache
+            args[nm] = ""
+        else:
+            args[nm] = f"Stub {nm} for: {' '.join(_words(prompt)[:8])}"
+    return args
+
+
+def choose_tool(messages:list, tools:list):
+    """
+    Pick the tool call a model might make, or None to respond with text.
+
+    Summary prompts carrying database results are always answered with
+    text. Otherwise words in the last user message route to a tool, and any
+    other prompt searches the database if a search tool is offered.
+    """
+    if not tools or messages[-1]["role"] != "user":
+        return None
+    prompt = messages[-1].get("content") or ""
+    if SUMMARY_MARKER in " ".join(prompt.split()):
+        return None
+    offered = {tool["function"]["name"]: tool for tool in tools}
+    if len(offered) == 1:
+        # single tool agents, eg extraction & draft Email, always use it
+        return next(iter(offered.values()))
+    for pattern, nms in TOOL_ROUTES:
+        if pattern.search(prompt):
+            for nm in nms:
+                if nm in offered:
+                    return offered[nm]
+    for nm in SEARCH_TOOLS:
+        if nm in offered and _keywords(prompt):
+            return offered[nm]
+    return None
+
+
+def _text_reply(messages:list) -> str:
+    prompt = messages[-1].get("content") or ""
+    return (
+        "This is a stub response, repeated deterministically for a prompt "
+        f"of {len(_words(prompt))} words. " * 3
+    ).strip()
+
+
+def _usage(messages:list, completion:str) -> dict:
+    prompt_tokens = sum(
+        len(str(msg.get("content") or "").split()) for msg in messages
+    )
+    completion_tokens = len(completion.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        # the system prompt is static, so assume it would be cached
+        "prompt_tokens_details": {
+            "cached_tokens": len(str(messages[0].get("content")).split())
+        },
+    }
+
+
+def _chunk(completion_id:str, model:str, delta:dict, finish=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "delta": delta, "finish_reason": finish}
+        ],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def chat_completions(request:Request):
+    """Mimic `POST /v1/chat/completions`."""
+    body = await request.json()
+    messages = body["messages"]
+    model = body.get("model", "stub")
+    tool = choose_tool(messages, body.get("tools"))
+    completion_id = "chatcmpl-" + hashlib.sha1(
+        json.dumps(messages, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:24]
+    await asyncio.sleep(StubConfig.latency)
+
+    if tool:
+        tool_call = {
+            "id": "call_" + completion_id[-12:],
+            "type": "function",
+            "function": {
+                "name": tool["function"]["name"],
+                "arguments": json.dumps(
+                    _tool_args(tool, messages[-1].get("content"))
+                    ),
+            },
+        }
+        message = {"role": "assistant", "content": None,
+                   "tool_calls": [tool_call]}
+        completion = tool_call["function"]["arguments"]
+        finish_reason = "tool_calls"
+    else:
+        completion = _text_reply(messages)
+        message = {"role": "assistant", "content": completion}
+        finish_reason = "stop"
+    usage = _usage(messages, completion)
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    async def events():
+        yield _chunk(completion_id, model, {"role": "assistant"})
+        if tool:
+            yield _chunk(
+                completion_id,
+                model,
+                {"tool_calls": [{**tool_call, "index": 0}]},
+            )
+        else:
+            for word in re.findall(r"\S+\s*", completion):
+                await asyncio.sleep(StubConfig.token_latency)
+                yield _chunk(completion_id, model, {"content": word})
+        yield _chunk(completion_id, model, {}, finish=finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def moderations(request:Request):
+    """Mimic `POST /v1/moderations`, nothing is ever flagged."""
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [
+        body["input"]
+    ]
+    await asyncio.sleep(StubConfig.latency / 5)
+    return JSONResponse({
+        "id": "modr-stub",
+        "model": body.get("model", "omni-moderation-latest"),
+        "results": [
+            {"flagged": False, "categories": {}, "category_scores": {}}
+            for _ in inputs
+        ],
+    })
+
+
+def embed_text(text:str, dimensionality:int) -> list:
+    """A deterministic unit vector, seeded by the text."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+    rng = random.Random(seed)
+    vec = [rng.gauss(0, 1) for _ in range(dimensionality)]
+    norm = math.sqrt(sum(v * v for v in vec))
+    return [v / norm for v in vec]
+
+
+async def nomic_embed_text(request:Request):
+    """Mimic Nomic Atlas `POST /v1/embedding/text`."""
+    body = await request.json()
+    dims = body.get("dimensionality") or StubConfig.dimensionality
+    await asyncio.sleep(StubConfig.embedding_latency)
+    texts = body["texts"]
+    n_tokens = sum(len(text.split()) for text in texts)
+    return JSONResponse({
+        "embeddings": [embed_text(text, dims) for text in texts],
+        "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        "model": body.get("model"),
+    })
+
+
+async def openai_embeddings(request:Request):
+    """Mimic `POST /v1/embeddings`."""
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [
+        body["input"]
+    ]
+    dims = body.get("dimensions") or StubConfig.dimensionality
+    await asyncio.sleep(StubConfig.embedding_latency)
+    n_tokens = sum(len(text.split()) for text in texts)
+    return JSONResponse({
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i,
+             "embedding": embed_text(text, dims)}
+            for i, text in enumerate(texts)
+        ],
+        "model": body.get("model"),
+        "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+    })
+
+
+def _jwt_segment(obj:dict) -> str:
+    encoded = base64.urlsafe_b64encode(json.dumps(obj).encode("utf-8"))
+    return encoded.rstrip(b"=").decode("ascii")
+
+
+async def nomic_token_refresh(request:Request):
+    """Mimic Nomic `GET /v1/user/token/refresh/{token}`, used at login."""
+    await asyncio.sleep(StubConfig.latency / 5)
+    # the client decodes the token, unverified, for its expiry
+    claims = {
+        "sub": "stub-user",
+        "exp": int(time.time()) + StubConfig.token_lifetime,
+    }
+    access_token = ".".join([
+        _jwt_segment({"alg": "HS256", "typ": "JWT"}),
+        _jwt_segment(claims),
+        _jwt_segment({"stub": request.path_params["token"][-4:]}),
+    ])
+    return JSONResponse({"access_token": access_token})
+
+
+async def nomic_user(request:Request):
+    """Mimic Nomic `GET /v1/user`, called as each client is created."""
+    if not request.headers.get("authorization", "").startswith("Bearer "):
+        return JSONResponse({"detail": "Not authenticated"}, status_code=401)
+    org = {
+        "organization_id": "stub-org",
+        "nickname": "stub",
+        "user_id": "stub-user",
+        "access_role": "OWNER",
+        "plan_type": None,
+    }
+    return JSONResponse({
+        "sub": "stub-user",
+        "default_organization": org["organization_id"],
+        "organizations": [org],
+    })
+
+
+def stub_repo(org_nm:str, i:int) -> dict:
+    """A deterministic GraphQL repository node, some without a README."""
+    node = {
+        "databaseId": int(
+            hashlib.sha256(f"{org_nm}/{i}".encode("utf-8")).hexdigest()[:8], 16
+            ),
+        "name": f"repo-{i:05d}",
+        "url": f"https://github.com/{org_nm}/repo-{i:05d}",
+        "description": f"Stub repo {i} of {org_nm}" if i % 5 else None,
+        "isPrivate": False,
+        "isArchived": i % 7 == 0,
+        "updatedAt": "2024-01-01T00:00:00Z",
+        "primaryLanguage": {"name": "Python"} if i % 3 else None,
+        "repositoryTopics": {
+            "nodes": [{"topic": {"name": t}} for t in ["stub", f"t{i % 4}"]]
+        },
+    }
+    # READMEs under the first or second candidate path, or none
+    if i % 10:
+        node[f"readme{i % 2}"] = {"text": f"# repo-{i:05d}\n\nA stub README."}
+    return node
+
+
+async def github_graphql(request:Request):
+    """Mimic GitHub `POST /graphql` for the org repos ingestion query."""
+    variables = (await request.json())["variables"]
+    await asyncio.sleep(StubConfig.latency / 5)
+    start = int(variables.get("cursor") or 0)
+    stop = min(start + variables["pageSize"], StubConfig.repos_per_org)
+    return JSONResponse({"data": {
+        "organization": {"repositories": {
+            "totalCount": StubConfig.repos_per_org,
+            "pageInfo": {
+                "hasNextPage": stop < StubConfig.repos_per_org,
+                "endCursor": str(stop),
+            },
+            "nodes": [
+                stub_repo(variables["org"], i) for i in range(start, stop)
+            ],
+        }},
+        "rateLimit": {"cost": 1, "remaining": 4999, "resetAt": None},
+    }})
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/moderations", moderations, methods=["POST"]),
+    Route("/v1/embeddings", openai_embeddings, methods=["POST"]),
+    Route("/v1/embedding/text", nomic_embed_text, methods=["POST"]),
+    Route("/v1/user", nomic_user, methods=["GET"]),
+    Route(
+        "/v1/user/token/refresh/{token}",
+        nomic_token_refresh,
+        methods=["GET"],
+        ),
+    Route("/graphql", github_graphql, methods=["POST"]),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=StubConfig.latency,
+        help="Seconds before a completion responds or starts streaming",
+    )
+    parser.add_argument(
+        "--token-latency",
+        type=float,
+        default=StubConfig.token_latency,
+        help="Seconds between streamed text chunks",
+    )
+    parser.add_argument(
+        "--embedding-latency",
+        type=float,
+        default=StubConfig.embedding_latency,
+    )
+    parser.add_argument(
+        "--dimensionality",
+        type=int,
+        default=StubConfig.dimensionality,
+        help="Embedding size, match the vector store being queried",
+    )
+    parser.add_argument(
+        "--repos-per-org",
+        type=int,
+        default=StubConfig.repos_per_org,
+        help="Repos served to the GraphQL ingestion query for each org",
+    )
+    args = parser.parse_args()
+    StubConfig.latency = args.latency
+    StubConfig.token_latency = args.token_latency
+    StubConfig.embedding_latency = args.embedding_latency
+    StubConfig.dimensionality = args.dimensionality
+    StubConfig.repos_per_org = args.repos_per_org
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
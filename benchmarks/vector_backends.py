@@ -0,0 +1,214 @@
+"""Compare vector store backends on load time, memory and query latency.
+
+Builds a chromadb collection and a flat index from the same synthetic unit
+vectors, then opens & queries each backend in a fresh interpreter so that
+load time and resident memory are measured from a cold start. Queries are
+batches of keyword embeddings, as the app sends them. Backends that cannot
+be imported are skipped.
+
+Usage:
+    python -m benchmarks.vector_backends --n-records 20000 --queries 200
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from pyprojroot import here
+
+from scripts.flat_index import normalise_rows, write_flat_index
+
+COLLECTION_NM = "bench"
+BACKENDS = ["chroma", "flat-float32", "flat-float16"]
+
+
+def synthetic_corpus(n_records:int, dim:int, seed:int=42) -> dict:
+    """Random unit vectors with app-like documents & metadata."""
+    rng = np.random.default_rng(seed)
+    embeddings = normalise_rows(rng.standard_normal((n_records, dim)))
+    return {
+        "ids": [str(i) for i in range(n_records)],
+        "embeddings": embeddings,
+        "documents": [f"Name: repo-{i}, url: https://github.com/org/repo-{i}"
+                      for i in range(n_records)],
+        "metadatas": [
+            {
+                "is_private": False,
+                "is_archived": bool(i % 7 == 0),
+                "programming_language": "Python",
+                "updated_at": 1.7e9 + i,
+                "org_nm": "ministryofjustice",
+            }
+            for i in range(n_records)
+        ],
+    }
+
+
+def build(backend:str, corpus:dict, build_dir:str) -> bool:
+    """Write `corpus` with `backend`, returning False if unavailable."""
+    if backend == "chroma":
+        try:
+            import chromadb
+        except ImportError:
+            return False
+        client = chromadb.PersistentClient(
+            path=os.path.join(build_dir, "chroma")
+            )
+        collection = client.create_collection(name=COLLECTION_NM)
+        # chromadb limits the size of a single add
+        for start in range(0, len(corpus["ids"]), 5_000):
+            stop = start + 5_000
+            collection.add(
+                ids=corpus["ids"][start:stop],
+                embeddings=corpus["embeddings"][start:stop].tolist(),
+                documents=corpus["documents"][start:stop],
+                metadatas=corpus["metadatas"][start:stop],
+            )
+        return True
+    write_flat_index(
+        os.path.join(build_dir, backend),
+        ids=corpus["ids"],
+        embeddings=corpus["embeddings"],
+        documents=corpus["documents"],
+        metadatas=corpus["metadatas"],
+        dtype=backend.split("-")[1],
+    )
+    return True
+
+
+def _rss_mb() -> float:
+    """Resident memory of this process, in MB, including mapped pages."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        # peak rather than current residency, where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(
+    backend:str, build_dir:str, dim:int, n_queries:int, batch:int, k:int
+    ) -> None:
+    """Open & query one backend, run in a fresh interpreter."""
+    rng = np.random.default_rng(0)
+    queries = [
+        normalise_rows(rng.standard_normal((batch, dim))).tolist()
+        for _ in range(n_queries)
+    ]
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(
+            path=os.path.join(build_dir, "chroma")
+            ).get_collection(COLLECTION_NM)
+    else:
+        from scripts.flat_index import FlatIndex
+        collection = FlatIndex(os.path.join(build_dir, backend))
+    load_seconds = time.perf_counter() - start
+    rss_loaded = _rss_mb()
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=query, n_results=k)
+        latencies.append(time.perf_counter() - start)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(json.dumps({
+        "backend": backend,
+        "load_seconds": round(load_seconds, 4),
+        "rss_after_load_mb": round(rss_loaded - rss_before, 1),
+        "rss_after_queries_mb": round(_rss_mb() - rss_before, 1),
+        "query_p50_ms": round(cuts[49] * 1e3, 3),
+        "query_p95_ms": round(cuts[94] * 1e3, 3),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-records", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--batch", type=int, default=3, help="Keyword embeddings per query"
+    )
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument(
+        "--output", default=None, help="Optional path for a JSON report"
+    )
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--build-dir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(
+            args.measure,
+            args.build_dir,
+            args.dim,
+            args.queries,
+            args.batch,
+            args.k,
+        )
+        return
+
+    corpus = synthetic_corpus(args.n_records, args.dim)
+    report = []
+    with tempfile.TemporaryDirectory() as build_dir:
+        for backend in args.backends:
+            if not build(backend, corpus, build_dir):
+                print(f"Skipping {backend}, not installed")
+                continue
+            disk_mb = sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(build_dir)
+                for f in files
+                if os.path.relpath(root, build_dir).split(os.sep)[0]
+                == backend
+            ) / 1024**2
+            proc = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.vector_backends",
+                    "--measure", backend,
+                    "--build-dir", build_dir,
+                    "--dim", str(args.dim),
+                    "--queries", str(args.queries),
+                    "--batch", str(args.batch),
+                    "--k", str(args.k),
+                ],
+                cwd=here(),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            result["disk_mb"] = round(disk_mb, 1)
+            report.append(result)
+
+    print(
+        f"{args.n_records} records x {args.dim} dims, {args.queries} "
+        f"queries of {args.batch} embeddings, k={args.k}"
+    )
+    for result in report:
+        print(
+            f"  {result['backend']:<13} load {result['load_seconds']:.3f}s, "
+            f"rss {result['rss_after_queries_mb']:.0f}MB, "
+            f"disk {result['disk_mb']:.0f}MB, "
+            f"p50 {result['query_p50_ms']:.2f}ms, "
+            f"p95 {result['query_p95_ms']:.2f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
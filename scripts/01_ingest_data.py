@@ -1,4 +1,19 @@
-"""Ingest repo metadata & summarise with pipeline_config.REPO_LLM"""
+"""Ingest repo metadata & summarise with pipeline_config.REPO_LLM
+
+Repo metadata, topics & READMEs are fetched per repo from the GitHub REST
+API, or in bulk from the GraphQL API with `--backend graphql`. An optional
+GITHUB_GRAPHQL_URL in .env points GraphQL ingestion at another endpoint, eg
+`benchmarks.stub_server`. REST responses are cached on disk & revalidated
+with conditional requests, so unchanged READMEs & topics are not
+downloaded again.
+
+Orgs are listed in .env as ORG_NMS & ingested concurrently. `--orgs`
+refreshes only the orgs given, carrying the others over from the latest
+snapshot, eg to refresh one large org.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import datetime
 from time import sleep
 
@@ -9,39 +24,114 @@ import pandas as pd
 from pyprojroot import here
 from requests import HTTPError
 
-from scripts.pipeline_config import REPO_LLM
-from scripts.prompts import REPO_SUMMARY_PROMPT, REPO_SUMMARY_SYS_PROMPT
-from scripts.string_utils import sanitise_string
+from scripts.github_graphql import (
+    GITHUB_GRAPHQL_URL, HTTPTransport, get_orgs_repos
+)
+from scripts.http_cache import install_conditional_cache
+from scripts.pipeline_config import (
+    GITHUB_HTTP_CACHE_PTH, INGEST_ORG_WORKERS, SUMMARY_README_TOKENS
+)
+from scripts.pipeline_stages import org_names, summarise_repo
+from scripts.readme_normalise import ReadmeNormaliser
+from scripts.snapshot import latest_snapshot_pth, read_snapshot, write_snapshot
 
 def ingest():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backend",
+        choices=["rest", "graphql"],
+        default="rest",
+        help="Fetch repo details per repo over REST or in bulk over GraphQL"
+        )
+    parser.add_argument(
+        "--record-graphql",
+        default=None,
+        help="Append GraphQL responses to this JSONL file, for replay"
+        )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="Download every REST response, ignoring the on-disk cache"
+        )
+    parser.add_argument(
+        "--orgs",
+        nargs="+",
+        default=None,
+        help="Refresh only these of the configured orgs, keeping the "
+        "others' repos from the latest snapshot"
+        )
+    args = parser.parse_args()
 
     # configure -----------------------------------------------------------
     secrets = dotenv.dotenv_values(here(".env"))
     github_pat = secrets["GITHUB_PAT"]
     user_agent = secrets["AGENT"]
-    org_nms = [secrets["ORG_NM1"], secrets["ORG_NM2"]]
+    org_nms = org_names(secrets)
     openai_key = secrets["OPENAI_KEY"]
-
+    carried = None
+    if args.orgs:
+        if (unknown := set(args.orgs) - set(org_nms)):
+            parser.error(f"--orgs not configured in .env: {sorted(unknown)}")
+        org_nms = [org_nm for org_nm in org_nms if org_nm in args.orgs]
+        # repos of the other orgs, not fetched or summarised again
+        carried = read_snapshot(latest_snapshot_pth())
+        carried = carried[~carried["org_nm"].isin(org_nms)]
+
+    if args.backend == "graphql":
+        # repo metadata, topics & READMEs, 100 repos per request ----------
+        transport = HTTPTransport(
+            github_pat,
+            user_agent,
+            url=secrets.get("GITHUB_GRAPHQL_URL") or GITHUB_GRAPHQL_URL,
+            record_pth=args.record_graphql,
+        )
+        repo_metadata = get_orgs_repos(
+            org_nms, transport, max_workers=INGEST_ORG_WORKERS
+            )
+        print(
+            f"Ingested {len(repo_metadata)} repos in "
+            f"{transport.n_requests} GraphQL requests"
+        )
+    else:
+        http_cache = nullcontext()
+        if not args.no_http_cache:
+            http_cache = install_conditional_cache(GITHUB_HTTP_CACHE_PTH)
+        with http_cache as cache_adapter:
+            repo_metadata = ingest_rest(github_pat, user_agent, org_nms)
+        if cache_adapter:
+            print(cache_adapter.summary())
+
+    summarise_and_write(repo_metadata, openai_key, carried=carried)
+
+
+def ingest_rest(github_pat:str, user_agent:str, org_nms:list):
+    """Repo metadata, topics & READMEs over REST, orgs concurrently."""
+    with ThreadPoolExecutor(
+        max_workers=min(len(org_nms), INGEST_ORG_WORKERS)
+        ) as executor:
+        orgs = list(executor.map(
+            lambda org_nm: ingest_org_rest(github_pat, user_agent, org_nm),
+            org_nms,
+            ))
+    return pd.concat(orgs)
+
+
+def ingest_org_rest(github_pat:str, user_agent:str, org_nm:str):
+    """An org's repo metadata, topics & READMEs, a request per repo each."""
+    # a client per org, as orgs are ingested on separate threads
     github_client = GithubClient(
         github_pat=github_pat, user_agent=user_agent)
 
-    # get repo lists ------------------------------------------------------
-    org1 = github_client.get_org_repos(org_nms[0], public_only=True)
-    org2 = github_client.get_org_repos(org_nms[1], public_only=True)
+    # get repo list -------------------------------------------------------
+    repo_metadata = github_client.get_org_repos(org_nm, public_only=True)
 
     # append the topics from each repo ------------------------------------
-    topics1 = github_client.get_all_repo_metadata(
-        html_urls=org1["html_url"],
-        metadata="topics",
-    )
-    topics2 = github_client.get_all_repo_metadata(
-        html_urls=org2["html_url"],
+    all_topics = github_client.get_all_repo_metadata(
+        html_urls=repo_metadata["html_url"],
         metadata="topics",
     )
-    
+
     # munge tables --------------------------------------------------------
-    repo_metadata = pd.concat([org1, org2], ignore_index=True)
-    all_topics = pd.concat([topics1, topics2], ignore_index=True)
     # README: there's inconsistency in column labelling here, need to look
     # into it in ainexus_backend:
     # https://github.com/ministryofjustice/rd-service-catalogue/issues/35
@@ -62,51 +152,32 @@ def ingest():
             readmes.append("None")
 
     repo_metadata["readme"] = readmes
+    return repo_metadata
 
+
+def summarise_and_write(repo_metadata, openai_key:str, carried=None) -> None:
+    """Summarise repos with REPO_LLM & snapshot them, with any `carried`."""
     # AI summarises repos -------------------------------------------------
     openai_client = openai.OpenAI(api_key=openai_key)
-    system_prompt = {
-        "role": "system",
-        "content": REPO_SUMMARY_SYS_PROMPT.replace("\n", " ").replace("  ", "")
-    }
-    stream = [system_prompt]
-
+    # READMEs are condensed for the prompt, the snapshot keeps them whole
+    normaliser = ReadmeNormaliser(SUMMARY_README_TOKENS)
     ai_summaries = []
     for i, row in repo_metadata.iterrows():
-                repo_deets = f"""
-                Name: {row['name']},\n
-                url: {row['html_url']},\n
-                Description: {row['description']},\n
-                Is Private: {row['is_private']},\n
-                Is Archived: {row['is_archived']},\n
-                Programming Language: {row['programming_language']},\n
-                Topics: {row['topics']},\n
-                README: {row['readme']}
-
-                """
-                repo_content = {
-                "role": "user",
-                "content": sanitise_string(REPO_SUMMARY_PROMPT.format(repo_deets=repo_deets))
-                }
-                stream.append(repo_content)
-                model_resp = openai_client.chat.completions.create(
-                    model=REPO_LLM,
-                    messages=stream,
-                    temperature=0.0,
-                )
-                ai_summary = model_resp.choices[0].message.content
-                # rm summary to avoid growing context for next iter
-                stream.pop()
-                ai_summaries.append(ai_summary)
-                sleep(0.3)
+        ai_summaries.append(
+            summarise_repo(openai_client, row, normaliser=normaliser)
+            )
+        sleep(0.3)
+    print(f"Summary prompts: {normaliser.summary()}")
 
     repo_metadata["ai_summary"] = ai_summaries
+    if carried is not None:
+        repo_metadata = pd.concat(
+            [repo_metadata.reset_index(drop=True), carried], ignore_index=True
+            )
 
-
-    # write to parquet ----------------------------------------------------
+    # write snapshot ------------------------------------------------------
     now = datetime.datetime.today().isoformat().replace(":", "_")
-    filenm = f"repo-metadata-{now}.parquet"
-    repo_metadata.to_parquet(here(f"data/{filenm}"))
+    write_snapshot(repo_metadata, here(f"data/repo-metadata-{now}"))
 
 if __name__ == "__main__":
     ingest()
@@ -1,8 +1,7 @@
 """Create a collection in vector store labelled with data vintage."""
 import argparse
 import datetime as dt
-import glob
-import re
+import os
 
 from ai_nexus_backend.github_api import GithubClient
 import chromadb 
@@ -14,8 +13,79 @@ from pyprojroot import here
 from requests import HTTPError
 import tiktoken
 
-from scripts.pipeline_config import EMBEDDINGS_MODEL
-from scripts.string_utils import sanitise_string
+from scripts.embedding_spec import MODEL_KEY
+from scripts.facet_index import FACET_INDEX_KEY, store_facet_index
+from scripts.flat_index import (
+    FLAT_INDEX_DIR, QUANTISATIONS, FlatIndex, write_flat_index
+)
+from scripts.matryoshka import MATRYOSHKA_DIMS, truncate_embeddings
+from scripts.pipeline_config import (
+    DOCUMENT_PREFIX,
+    EMBED_README_TOKENS,
+    EMBEDDINGS_DIMENSIONALITY,
+    EMBEDDINGS_MODEL,
+    VECTOR_STORE_PTH,
+)
+from scripts.pipeline_stages import (
+    collection_name,
+    document_embedding_spec,
+    format_document,
+    format_metadata,
+    prune_collections,
+    retained_collections,
+    verify_collection,
+)
+from scripts.snapshot import (
+    VECTOR_STORE_COLS, latest_snapshot_pth, read_snapshot, snapshot_vintage
+)
+from scripts.readme_normalise import ReadmeNormaliser
+from scripts.sharded_collection import SHARDS_KEY, shard_name
+from scripts.vector_store_manifest import read_manifest, write_manifest
+
+
+def _write_collection(
+    chroma_client,
+    collection_nm:str,
+    ids:list,
+    embeddings,
+    documents:list,
+    metadatas:list,
+    spec:dict,
+    args:argparse.Namespace,
+    ) -> dict:
+    """Write & verify a collection or flat index, return its manifest entry."""
+    entry = {
+        "collection_nm": collection_nm,
+        "n_records": len(ids),
+        "backend": args.backend,
+    }
+    if args.backend == "flat":
+        index_dir = os.path.join(FLAT_INDEX_DIR, collection_nm)
+        write_flat_index(
+            os.path.join(VECTOR_STORE_PTH, index_dir),
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            dtype=args.dtype,
+            quantisation=args.quantise,
+            metadata=spec,
+        )
+        entry["index_dir"] = index_dir
+        entry["quantisation"] = args.quantise
+        collection = FlatIndex(os.path.join(VECTOR_STORE_PTH, index_dir))
+    else:
+        collection = chroma_client.create_collection(
+            name=collection_nm, metadata=spec
+            )
+        collection.add(
+            ids=ids,
+            metadatas=metadatas,
+            documents=documents,
+            embeddings=embeddings.tolist()
+            )
+    verify_collection(collection, ids, embeddings, spec)
+    return entry
 
 
 def embed():
@@ -26,60 +96,89 @@ def embed():
         action="store_true",
         help="Estimate the cost of embedding the documents"
         )
+    parser.add_argument(
+        "--backend",
+        choices=["chroma", "flat"],
+        default="chroma",
+        help="Write a chromadb collection or a memory-mapped flat index"
+        )
+    parser.add_argument(
+        "--dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Embedding precision for the flat index backend, float16 "
+        "halves the disk but queries take about 4x as long"
+        )
+    parser.add_argument(
+        "--quantise",
+        choices=QUANTISATIONS,
+        default=None,
+        help="Search the flat index by quantised codes, re-ranking the "
+        "top candidates at full precision"
+        )
+    parser.add_argument(
+        "--dimensionality",
+        type=int,
+        choices=MATRYOSHKA_DIMS,
+        default=EMBEDDINGS_DIMENSIONALITY,
+        help="Matryoshka dimensionality of the stored embeddings, must "
+        "match EMBEDDINGS_DIMENSIONALITY in app_config.py"
+        )
+    parser.add_argument(
+        "--alongside",
+        action="store_true",
+        help="Record the live collection as the previous one, served to "
+        "app processes configured for its embedding model, eg while "
+        "migrating embedding models"
+        )
+    parser.add_argument(
+        "--shard-by-org",
+        action="store_true",
+        help="Write a collection per org, searched in parallel by the app"
+        )
+    parser.add_argument(
+        "--orgs",
+        nargs="+",
+        default=None,
+        help="With --shard-by-org, rebuild only these orgs' shards, keeping "
+        "the others from the live collection"
+        )
 
     # Parse the arguments
     args = parser.parse_args()
+    if args.quantise and args.backend != "flat":
+        parser.error("--quantise requires --backend flat")
+    if args.orgs and not args.shard_by_org:
+        parser.error("--orgs requires --shard-by-org")
+    spec = document_embedding_spec(args.dimensionality)
+    previous = read_manifest(VECTOR_STORE_PTH)
+    if args.orgs and not (
+        previous and previous.get(SHARDS_KEY)
+        and all(previous.get(k) == v for k, v in spec.items())
+        ):
+        parser.error(
+            "--orgs needs a live sharded collection with the same embedding "
+            "spec to keep the other orgs' shards from"
+            )
     # pull embeddings model if needed
     ollama.pull(EMBEDDINGS_MODEL)
 
-    # bring in the latest version of the data only
-    latest_pth = max(glob.glob(str(here("data/*.parquet"))))
-    latest_dat = pd.read_parquet(latest_pth)
+    # bring in the latest version of the data only, & only the columns used
+    latest_pth = latest_snapshot_pth()
+    latest_dat = read_snapshot(latest_pth, columns=VECTOR_STORE_COLS)
+    if args.orgs:
+        latest_dat = latest_dat[latest_dat["org_nm"].isin(args.orgs)]
     # get the vintage in order to label the collection later
-    date_pat = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}.\d{6}")
-    match = date_pat.search(latest_pth)
-    vintage = match[0] 
+    vintage = snapshot_vintage(latest_pth)
     # format documents for embedding & storage. chromadb IDs must be string
-    ids = latest_dat["id"].astype(str).to_list() 
+    ids = latest_dat["id"].astype(str).to_list()
     metas = []
     documents = []
-    target_metas = [
-        "is_private",
-        "is_archived",
-        "programming_language",
-        "updated_at",
-        "org_nm"
-        ]
+    normaliser = ReadmeNormaliser(EMBED_README_TOKENS)
     for i, row in latest_dat.iterrows():
-        ts = dt.datetime.strptime(
-            row["updated_at"], "%Y-%m-%dT%H:%M:%SZ"
-        ).timestamp()
-        # metadata must be str, int, float or bool, will not tolerate None             
-        metas.append(
-            {
-                "is_private": bool(row["is_private"]),
-                "is_archived": bool(row["is_archived"]),
-                "programming_language": str(row["programming_language"]),
-                "updated_at": ts,
-                "org_nm": row["org_nm"],
-            }
-        )
-        documents.append(
-            sanitise_string(
-                f"""
-                search_document: 
-                Name: {row['name']},\n
-                url: {row['html_url']},\n
-                Description: {row['description']},\n
-                README: {row['readme']},\n
-                AI Summary: {row['ai_summary']}
-
-                """
-            ))
-
-    documents = [
-        doc.replace("\n", " ").replace("  ", "").strip() for doc in documents
-        ]
+        metas.append(format_metadata(row))
+        documents.append(format_document(row, normaliser=normaliser))
+    print(f"Embedded documents: {normaliser.summary()}")
 
     # Estimate cost =======================================================
     if args.est_cost:
@@ -100,25 +199,88 @@ def embed():
     # Calculate embeddings ================================================
 
     ollama_response = ollama.embed(model=EMBEDDINGS_MODEL, input=documents)
+    # truncate & renormalise as the Nomic API does for query embeddings
+    embeddings = truncate_embeddings(
+        ollama_response.embeddings, args.dimensionality
+        )
 
     # Vector store ========================================================
-    chroma_client = chromadb.PersistentClient(
-        path=str(here("data/nomic-embeddings")),
-        settings=chromadb.config.Settings(allow_reset=True),
-        )
-    chroma_client.reset()
-    collection = chroma_client.create_collection(
-        name=f"moj-github-{vintage}")
-    collection.add(
-        ids=ids,
-        metadatas=metas,
-        documents=[
-            doc.replace("search_document: ", "") for doc in documents
-            ],
-        embeddings=ollama_response.embeddings
+    # the new collection is built alongside the live one, never over it, so
+    # the app keeps serving until the manifest switches over
+    built_at = dt.datetime.now()
+    collection_nm = collection_name(vintage, built_at)
+    documents = [doc.replace(DOCUMENT_PREFIX, "") for doc in documents]
+    manifest = {
+        "collection_nm": collection_nm,
+        "vintage": vintage,
+        "n_records": len(ids),
+        "built_at": built_at.isoformat(),
+        "backend": args.backend,
+        **spec,
+    }
+    if args.alongside and previous:
+        # used by app processes still configured for the previous embedder
+        manifest["previous"] = {
+            k: previous[k]
+            for k in ["collection_nm", "backend", "index_dir", SHARDS_KEY]
+            if k in previous
+        }
+    chroma_client = chromadb.PersistentClient(path=str(VECTOR_STORE_PTH))
+    if args.shard_by_org:
+        # a collection per org, so one org can be rebuilt on its own
+        shards = [
+            shard for shard in (previous or {}).get(SHARDS_KEY, [])
+            if args.orgs and shard["org_nm"] not in args.orgs
+        ]
+        org_nms = sorted({meta["org_nm"] for meta in metas})
+        for i, org_nm in enumerate(org_nms):
+            rows = [
+                j for j, meta in enumerate(metas) if meta["org_nm"] == org_nm
+            ]
+            shard = _write_collection(
+                chroma_client,
+                shard_name(collection_nm, i),
+                ids=[ids[j] for j in rows],
+                embeddings=embeddings[rows],
+                documents=[documents[j] for j in rows],
+                metadatas=[metas[j] for j in rows],
+                spec=spec,
+                args=args,
+                )
+            shards.append({"org_nm": org_nm, **shard})
+        manifest[SHARDS_KEY] = shards
+        manifest["n_records"] = sum(shard["n_records"] for shard in shards)
+    else:
+        manifest.update(_write_collection(
+            chroma_client,
+            collection_nm,
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metas,
+            spec=spec,
+            args=args,
+            ))
+    # counts of the repos this collection was built from, for CountRepos
+    if (facet_pth := store_facet_index(latest_pth, collection_nm)):
+        manifest[FACET_INDEX_KEY] = facet_pth
+    # the app reads the live collection & vintage label from the manifest,
+    # written atomically, so this is the switch over
+    write_manifest(manifest, vector_store_pth=VECTOR_STORE_PTH)
+    print(
+        f"Switched to {collection_nm}, embedded with {spec[MODEL_KEY]} at "
+        f"{args.dimensionality} dimensions"
         )
-    collection.peek()
+    for shard in manifest.get(SHARDS_KEY, []):
+        print(
+            f"  {shard['org_nm']}: {shard['collection_nm']}, "
+            f"{shard['n_records']} records"
+            )
 
+    # sessions may still be searching the collection just replaced, so it
+    # is kept until the next build
+    keep = retained_collections(manifest, previous)
+    prune_collections(chroma_client, VECTOR_STORE_PTH, keep)
 
 if __name__ == "__main__":
     embed()
@@ -0,0 +1,49 @@
+"""Generate tool explanations ahead of deployment & write them to file."""
+import argparse
+
+import openai
+
+from scripts.explanation_cache import (
+    cacheable_explanation, get_tool_explanation_cache, tool_explainer_params
+)
+from scripts.startup import get_openai_kwargs
+
+
+def prewarm():
+    parser = argparse.ArgumentParser(
+        description="Cache tool explanations for common style guidance."
+        )
+    parser.add_argument(
+        "--style",
+        action="append",
+        default=[],
+        help="Style guidance to prewarm in addition to the default",
+        )
+    args = parser.parse_args()
+
+    # the app's client settings, so this can run against a stub or proxy
+    openai_client = openai.OpenAI(**get_openai_kwargs())
+    cache = get_tool_explanation_cache()
+    n_cached = int(cache.prewarm(openai_client))
+    n_skipped = 0
+    for style in args.style:
+        if cache.get(style) is not None:
+            continue
+        resp = openai_client.chat.completions.create(
+            **tool_explainer_params(style)
+        )
+        explanation = cacheable_explanation(resp)
+        if explanation is None:
+            print(f"Explanation for style {style!r} was incomplete, skipped")
+            n_skipped += 1
+            continue
+        cache.set(style, explanation)
+        n_cached += 1
+    cache.save()
+    print(
+        f"Cached {n_cached} new tool explanations to {cache.cache_pth}, "
+        f"{n_skipped} skipped"
+        )
+
+if __name__ == "__main__":
+    prewarm()
@@ -1,3 +1,83 @@
+import os
+import tempfile
+
+from pyprojroot import here
+
 EMBEDDINGS_MODEL = "nomic-embed-text-v1.5"
+# Matryoshka dimensionality of query embeddings, one of 768, 512, 256 or 128.
+# Must match the vector store, built with the same dimensionality.
+EMBEDDINGS_DIMENSIONALITY = 768
+# Nomic task type of query embeddings, paired with the document prefix
+QUERY_TASK_TYPE = "search_query"
+# query embeddings from concurrent searches are sent to Nomic together,
+# batched over this window or up to this many keywords
+EMBED_BATCH_WINDOW_MS = 5
+EMBED_BATCH_MAX_SIZE = 64
+# query embeddings of recent keywords are kept, so repeated searches skip
+# Nomic & still work while it is down
+EMBED_CACHE_SIZE = 4_096
+# threads shared by every sharded collection in a process, querying shards
+SHARD_QUERY_WORKERS = 8
 APP_LLM = "gpt-4o-2024-11-20"
+# When True, the orchestrator calls ExtractKeywordEntities directly. Set to
+# False to restore the ShouldExtractKeywords -> extraction agent flow.
+SINGLE_CALL_EXTRACTION = True
+
+# Open the vector store & log in to Nomic in a background thread at start
+# up, rather than on the first search
+WARM_UP_ON_START = True
+
+# AI summaries are cut to this many words in the results sent to APP_LLM
+RESULT_SUMMARY_WORDS = 40
+
+# CountRepos answers list at most this many groups, largest first
+FACET_MAX_GROUPS = 15
+
+# Orchestrator chat history compaction
+HISTORY_TOKEN_BUDGET = 8_000
+HISTORY_KEEP_TURNS = 2 # most recent turns are never compacted
+
+# Tool explanations are cached per style guidance. The default explanation
+# is generated at start up if not found in the cache file. The multi-worker
+# launcher, scripts.serve, generates it once for all of its workers & sets
+# the environment variable so that the workers skip it.
+PREWARM_TOOL_EXPLANATION = True
+TOOL_EXPLANATION_PREWARMED_ENV = "GITHUB_CHAT_TOOL_EXPLANATION_PREWARMED"
+TOOL_EXPLANATION_PREWARMED = bool(
+    os.environ.get(TOOL_EXPLANATION_PREWARMED_ENV)
+    )
+TOOL_EXPLANATION_CACHE_PTH = here("data/tool-explanations.json")
+TOOL_EXPLANATION_CACHE_SIZE = 64
+# Explanations are shared by every session, so are generated with fixed
+# sampling rather than the user's
+TOOL_EXPLAINER_SAMPLING = {"temperature": 0.0}
+
+# Remote retrieval, see scripts.retrieval_service. When either environment
+# variable is set, the app queries the retrieval service rather than opening
+# the vector store itself. The multi-worker launcher, scripts.serve, sets
+# the socket path for each app worker.
+RETRIEVAL_SOCKET_ENV = "GITHUB_CHAT_RETRIEVAL_SOCKET"
+RETRIEVAL_SOCKET_PTH = os.environ.get(RETRIEVAL_SOCKET_ENV)
+RETRIEVAL_URL_ENV = "GITHUB_CHAT_RETRIEVAL_URL"
+RETRIEVAL_URL = os.environ.get(RETRIEVAL_URL_ENV)
+DEFAULT_RETRIEVAL_SOCKET_PTH = os.path.join(
+    tempfile.gettempdir(), "github-chat-retrieval.sock"
+)
 
+# Seconds each external dependency may take before the call fails & the chat
+# falls back, see scripts.circuit_breaker. For OpenAI, the time to the first
+# streamed token or the full response.
+DEPENDENCY_TIMEOUTS = {
+    "openai": 30.0,
+    "moderation": 5.0,
+    "nomic": 10.0,
+    "retrieval": 30.0,
+}
+# A dependency's breaker opens after this many consecutive failures, then
+# refuses calls for BREAKER_RESET_SECONDS before letting a trial call through
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+# threads running blocking calls that cannot time out themselves, eg nomic's
+BREAKER_CALL_WORKERS = 8
+# When moderation is unavailable, prompts are refused unless this is True
+MODERATION_FAIL_OPEN = False
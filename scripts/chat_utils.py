@@ -1,6 +1,18 @@
 """Utilities for handling chat stream"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Union
 
-from scripts.prompts import ORCHESTRATOR_SYS_PROMPT, WELCOME_MSG
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from openai.types.completion_usage import CompletionUsage
+
+from scripts.app_config import APP_LLM
+from scripts.prompts import (
+    ORCHESTRATOR_SYS_PROMPT, STREAM_INTERRUPTED_MSG, WELCOME_MSG
+)
+from scripts.string_utils import sanitise_string
 
 
 def _init_stream(
@@ -16,3 +28,243 @@ def _init_stream(
     _stream.append({"role": "system", "content": sys})
     if wlcm:
         _stream.append({"role": "assistant", "content": wlcm})
+
+
+def build_completion_params(
+    messages:list,
+    tools:Union[list, None]=None,
+    stream:bool=False,
+    model:str=APP_LLM,
+    **sampling,
+    ) -> dict:
+    """
+    Assemble chat completion parameters in a fixed order.
+
+    The provider caches prompt prefixes, which only helps if each agent's
+    static content (tool schemas, system prompt & welcome message) is sent
+    byte-identical on every call, with anything that varies at the end. So
+    all agents build their parameters here rather than ad hoc.
+
+    Parameters
+    ----------
+    messages : list
+        The messages to send, starting with the agent's system prompt.
+        Copied, so that later changes to a chat stream cannot alter a
+        request that has already been built.
+    tools : Union[list, None], optional
+        Tool schemas, built once at import in `scripts.custom_tools`.
+    stream : bool, optional
+        Whether to stream the response. Streamed responses are asked to
+        include token usage in their final chunk.
+    model : str, optional
+        The model to call.
+    **sampling
+        Sampling parameters such as temperature, added in sorted order.
+        None values are left out.
+
+    Returns
+    -------
+    dict
+        Keyword arguments for `openai_client.chat.completions.create`.
+    """
+    params = {"model": model}
+    if tools:
+        params["tools"] = tools
+    params["messages"] = list(messages)
+    params["stream"] = stream
+    if stream:
+        params["stream_options"] = {"include_usage": True}
+    for key in sorted(sampling):
+        if sampling[key] is not None:
+            params[key] = sampling[key]
+    return params
+
+
+class StreamedCompletion:
+    """
+    Route a streamed chat completion to either text or tool calls.
+
+    Text deltas are passed on as soon as they arrive. Tool call deltas are
+    fragments of the function name and JSON arguments, so these are
+    buffered until the stream ends and then exposed in the same form as a
+    non-streamed response's `message.tool_calls`. Each chunk is waited for
+    at most `chunk_timeout`, so a stalled stream cannot hang the session.
+
+    Attributes
+    ----------
+    tool_calls : list
+        Complete `ChatCompletionMessageToolCall` objects, populated once
+        the stream has been consumed.
+    refusal : Union[str, None]
+        The model's refusal, if any.
+    content : str
+        The full text response, populated as text chunks are consumed.
+    first_token_at : Union[float, None]
+        `time.perf_counter()` value when the first text chunk arrived.
+    chunk_timeout : Union[float, None]
+        Seconds to wait for each chunk, or None to wait indefinitely.
+    interrupted : bool
+        True if the text stream stalled & was cut short.
+    usage : Union[CompletionUsage, None]
+        Token usage, sent in the final chunk when the request set
+        `stream_options={"include_usage": True}`.
+
+    Methods
+    -------
+    start() -> StreamedCompletion
+        Consume chunks until text arrives or the stream ends.
+    text_chunks(on_complete: Callable) -> AsyncIterator[str]
+        Yield sanitised text chunks for `ui.Chat.append_message_stream`.
+    """
+
+    def __init__(
+        self,
+        chunks:AsyncIterator,
+        on_usage:Union[Callable[[CompletionUsage], None], None]=None,
+        chunk_timeout:Union[float, None]=None,
+        ):
+        self._chunks = chunks.__aiter__()
+        self._on_usage = on_usage
+        self.chunk_timeout = chunk_timeout
+        self.interrupted = False
+        self._first_text = None
+        self._tool_call_parts = {}
+        self.tool_calls = []
+        self.refusal = None
+        self.content = ""
+        self.first_token_at = None
+        self.usage = None
+
+    @property
+    def is_text(self) -> bool:
+        """True if the model has started to respond with text."""
+        return self._first_text is not None
+
+    async def start(self) -> "StreamedCompletion":
+        """
+        Consume chunks until text arrives or the stream ends.
+
+        Returns
+        -------
+        StreamedCompletion
+            This instance, so that calls can be chained.
+
+        Raises
+        ------
+        TimeoutError
+            If a chunk took longer than `chunk_timeout`.
+        """
+        async for chunk in self._timed_chunks():
+            if chunk.usage:
+                self._record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.refusal:
+                self.refusal = (self.refusal or "") + delta.refusal
+            if delta.tool_calls:
+                self._buffer_tool_calls(delta.tool_calls)
+            if delta.content:
+                self._first_text = delta.content
+                self.first_token_at = time.perf_counter()
+                return self
+        self._assemble_tool_calls()
+        return self
+
+    async def text_chunks(
+        self, on_complete:Union[Callable[[str], None], None]=None
+        ) -> AsyncIterator[str]:
+        """
+        Yield sanitised text chunks, starting with the one seen in start().
+
+        A chunk taking longer than `chunk_timeout` ends the response with
+        STREAM_INTERRUPTED_MSG rather than raising, as the chat consumes
+        these in the background.
+
+        Parameters
+        ----------
+        on_complete : Union[Callable[[str], None], None], optional
+            Called with the full sanitised response once the stream is
+            exhausted, eg to append the response to the chat stream.
+
+        Yields
+        ------
+        str
+            Sanitised text chunks.
+        """
+        if self._first_text is not None:
+            first_chunk = sanitise_string(self._first_text)
+            self.content += first_chunk
+            yield first_chunk
+        try:
+            async for chunk in self._timed_chunks():
+                if chunk.usage:
+                    self._record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.tool_calls:
+                    self._buffer_tool_calls(delta.tool_calls)
+                if delta.content:
+                    text = sanitise_string(delta.content)
+                    self.content += text
+                    yield text
+        except TimeoutError:
+            logging.warning(
+                f"Response stream stalled for {self.chunk_timeout}s, "
+                "cut short"
+                )
+            self.interrupted = True
+            text = f" {STREAM_INTERRUPTED_MSG}"
+            self.content += text
+            yield text
+        self._assemble_tool_calls()
+        if self.tool_calls:
+            logging.warning(
+                "Tool calls following a text response were ignored: "
+                f"{[tc.function.name for tc in self.tool_calls]}"
+                )
+        if on_complete:
+            on_complete(self.content)
+
+    async def _timed_chunks(self) -> AsyncIterator:
+        """The remaining chunks, each waited for at most `chunk_timeout`."""
+        while True:
+            try:
+                yield await asyncio.wait_for(
+                    self._chunks.__anext__(), self.chunk_timeout
+                    )
+            except StopAsyncIteration:
+                return
+
+    def _record_usage(self, usage:CompletionUsage) -> None:
+        """Keep the usage chunk & pass it on, eg to `TurnMetrics`."""
+        self.usage = usage
+        if self._on_usage:
+            self._on_usage(usage)
+
+    def _buffer_tool_calls(self, tool_call_deltas:list) -> None:
+        """Accumulate tool call fragments by their index."""
+        for tc in tool_call_deltas:
+            part = self._tool_call_parts.setdefault(
+                tc.index, {"id": None, "name": "", "arguments": ""}
+                )
+            if tc.id:
+                part["id"] = tc.id
+            if tc.function and tc.function.name:
+                part["name"] += tc.function.name
+            if tc.function and tc.function.arguments:
+                part["arguments"] += tc.function.arguments
+
+    def _assemble_tool_calls(self) -> None:
+        """Convert buffered fragments into complete tool call objects."""
+        self.tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=part["id"],
+                type="function",
+                function=Function(
+                    name=part["name"], arguments=part["arguments"]
+                    ),
+                )
+            for _, part in sorted(self._tool_call_parts.items())
+        ]
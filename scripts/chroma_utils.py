@@ -1,26 +1,68 @@
-"""Utilities for working with chromadb"""
+"""Utilities for working with chromadb
+
+chromadb, nomic and pandas are slow to import, so they are imported on
+first use rather than when the app starts.
+"""
 from collections import OrderedDict
 import datetime
+from functools import lru_cache
 from itertools import islice
+import logging
+import os
 from pathlib import Path
 import re
+import threading
 from typing import List, Union
 
-import chromadb
-import dotenv
-from nomic import embed, login
-import pandas as pd
-from pyprojroot import here
-
-from scripts.app_config import EMBEDDINGS_MODEL
+from scripts.app_config import (
+    EMBEDDINGS_DIMENSIONALITY,
+    EMBEDDINGS_MODEL,
+    QUERY_TASK_TYPE,
+    RESULT_SUMMARY_WORDS,
+    RETRIEVAL_SOCKET_PTH,
+    RETRIEVAL_URL,
+)
+from scripts.circuit_breaker import get_breaker
+from scripts.embedding_batcher import get_embedding_batcher
+from scripts.embedding_spec import check_embedding_spec
 from scripts.pipeline_config import VECTOR_STORE_PTH
+from scripts.sharded_collection import SHARDS_KEY, ShardedCollection
+from scripts.single_flight import SingleFlight, normalise_keywords
+from scripts.startup import get_secrets
 from scripts.string_utils import (
+    format_compact_reference,
     format_results,
     format_evaluation_response,
     get_vintage_from_str,
 )
+from scripts.vector_store_manifest import read_manifest
+
+_client_lock = threading.Lock()
+_nomic_lock = threading.Lock()
+_nomic_token = None
+_nomic_logins = SingleFlight()
+_search_flights = SingleFlight()
+
+
+@lru_cache(maxsize=None)
+def _open_persistent_client(vector_store_pth:str):
+    """Open a chromadb client, importing chromadb on first use."""
+    import chromadb
+    return chromadb.PersistentClient(path=vector_store_pth)
+
 
-secrets = dotenv.dotenv_values(here(".env"))
+def _missing_collection_errors() -> tuple:
+    """Errors querying a collection that a later build has removed."""
+    from chromadb.errors import InvalidCollectionException
+    return (InvalidCollectionException, FileNotFoundError)
+
+
+def get_persistent_client(
+    vector_store_pth:Union[str, Path]=VECTOR_STORE_PTH,
+    ):
+    """Open the chromadb client for a vector store once per process."""
+    with _client_lock:
+        return _open_persistent_client(str(vector_store_pth))
 
 
 class ChromaDBPipeline:
@@ -34,11 +76,16 @@ class ChromaDBPipeline:
     vector_store_pth : str
         Path to the vector store.
     client : chromadb.PersistentClient
-        Persistent client for ChromaDB.
-    nomic_logged_in : bool
-        Flag indicating if logged into Nomic.
-    chat_ui_results: str
-        Formatted db results for presentation in chat UI.
+        Persistent client for ChromaDB, shared by all pipelines using the
+        same vector store and opened on first use.
+    ui_results: list
+        One dictionary of repo details per result, sorted by distance, for
+        rendering in the chat UI.
+    llm_results: str
+        Compact, token-lean db results for summary by the orchestrator.
+    results_reference: str
+        A compact stand-in for the latest results, used when compacting
+        the chat history.
     collection : Optional[chromadb.Collection]
         Current ChromaDB collection.
     collection_nm : Optional[str]
@@ -53,7 +100,7 @@ class ChromaDBPipeline:
         The list of keywords extracted from the user's latest prompt.
     export_table : pd.DataFrame
         Tabular form of results for export to Excel. This will extend as
-        the user makes additional requests.
+        the user makes additional requests. Created on first use.
 
     Methods
     -------
@@ -72,30 +119,66 @@ class ChromaDBPipeline:
     respond_with_db_results(sanitised_prompt: str) -> dict
         Generate a response with database results formatted for user
         interaction.
+    execute_pipeline(
+        keywords: List[str],
+        n_results: int,
+        distance_threshold: float,
+        sanitised_prompt: str
+        ) -> dict
+        Search for keywords & return this search's formatted results.
+    extend_export_table(ui_results: list) -> None
+        Add a search's results to the export table.
     reset_export_table() -> None
         Initialise thre export table, discarding any cached results.
     _login_nomic() -> None
         Log in to Nomic using the provided API key.
+    _follow_manifest() -> None
+        Open the live collection, re-opening it if the manifest switched.
+    _embed_and_query(keywords: List[str], n_results: int) -> tuple
+        Embed keywords & query the collection, shared by identical
+        concurrent searches.
     """
 
     def __init__(
         self,
         vector_store_pth: Union[str, Path]=VECTOR_STORE_PTH,
-        nomic_api_key:str=secrets["NOMIC_KEY"],
+        nomic_api_key:Union[str, None]=None,
         ):
-        self.nomic_api_key = nomic_api_key
+        self.nomic_api_key = nomic_api_key or get_secrets().get("NOMIC_KEY")
         self.vector_store_pth = str(vector_store_pth)
-        self.client = chromadb.PersistentClient(path=self.vector_store_pth)
-        self.nomic_logged_in = False
         self.total_removed = 0
-        self.chat_ui_results = None
+        self.ui_results = []
+        self.llm_results = None
+        self.results_reference = None
         self.collection = None
         self.collection_nm = None
+        # the manifest's live collection when the collection was opened
+        self._manifest_nm = None
         self.data_vintage = None
         self.embeddings = None
         self.results = None
         self.current_keywords = []
-        self.export_table = pd.DataFrame()
+        self._export_table = None
+        # concurrent searches of one session open the collection & extend
+        # the export table in turn
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The shared chromadb client, opened on first use."""
+        return get_persistent_client(self.vector_store_pth)
+
+    @property
+    def export_table(self):
+        """The export table, created on first use."""
+        if self._export_table is None:
+            import pandas as pd
+            self._export_table = pd.DataFrame()
+        return self._export_table
+
+    @export_table.setter
+    def export_table(self, value) -> None:
+        self._export_table = value
 
     def embed_keywords(
         self,
@@ -105,8 +188,13 @@ class ChromaDBPipeline:
         """
         Embed a list of keywords using the specified model.
         This method uses the Nomic Atlas to embed a list of keywords. If
-        the user is not logged in to Nomic, it will log in first before
-        proceeding with the embedding.
+        the process is not logged in to Nomic, it will log in first before
+        proceeding with the embedding. Embeddings are truncated to
+        EMBEDDINGS_DIMENSIONALITY, matching the vector store. Keywords for
+        EMBEDDINGS_MODEL are embedded in batches with those of concurrent
+        searches, or served from the batcher's cache, see
+        `scripts.embedding_batcher`. Calls to Nomic go through its circuit
+        breaker.
 
         Parameters
         ----------
@@ -120,17 +208,28 @@ class ChromaDBPipeline:
         dict
             A dictionary containing the embeddings of the provided
             keywords.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If Nomic failed, timed out or its breaker is open.
         """
         self.current_keywords = keywords
-        if not self.nomic_logged_in:
-            self._login_nomic()
-            self.nomic_logged_in = True
-        # embed with nomic Atlas
-        embeddings = embed.text(
-            texts=keywords,
-            model=model,
-            task_type="search_query",
-        )
+        self._login_nomic()
+        if model == EMBEDDINGS_MODEL:
+            # batched with concurrent searches from other sessions
+            embeddings = {
+                "embeddings": get_embedding_batcher().embed(keywords)
+                }
+        else:
+            from nomic import embed
+            embeddings = get_breaker("nomic").call_bounded(
+                embed.text,
+                texts=keywords,
+                model=model,
+                task_type=QUERY_TASK_TYPE,
+                dimensionality=EMBEDDINGS_DIMENSIONALITY,
+            )
         self.embeddings = embeddings
         return embeddings
 
@@ -140,7 +239,16 @@ class ChromaDBPipeline:
 
         This method fetches the latest Chroma collection by name and
         updates the instance attributes `collection_nm` and `collection`
-        with the name and the collection object respectively.
+        with the name and the collection object respectively. The name is
+        read from the vector store manifest where one exists, otherwise
+        the collections are listed. If the manifest names a flat index
+        backend, `collection` is a `FlatIndex` rather than a chromadb
+        collection. Collections whose embedding model, dimensionality or
+        task prefix differ from the query embeddings are rejected with a
+        ValueError. While migrating between embedding models, the manifest
+        also names the previous collection, which is used instead if it
+        matches the query embeddings. A manifest listing per-org `shards`
+        opens them all as a `ShardedCollection`, searched in parallel.
 
         Parameters
         ----------
@@ -150,10 +258,57 @@ class ChromaDBPipeline:
         -------
         None
         """
-        self.collection_nm = max(self.client.list_collections()).name
-        self.collection = self.client.get_collection(
-            name=self.collection_nm
+        manifest = read_manifest(self.vector_store_pth)
+        self._manifest_nm = manifest["collection_nm"] if manifest else None
+        try:
+            self._open_collection(manifest)
+        except ValueError:
+            if not (manifest and manifest.get("previous")):
+                raise
+            logging.warning(
+                f"{manifest['collection_nm']} does not match the query "
+                f"embeddings, using {manifest['previous']['collection_nm']}"
+                )
+            self._open_collection(manifest["previous"])
+
+    def _open_collection(self, manifest:Union[dict, None]) -> None:
+        """Open & check the collection a manifest entry describes."""
+        if manifest and manifest.get(SHARDS_KEY):
+            # per-org collections, queried in parallel as one
+            self.collection_nm = manifest["collection_nm"]
+            self.collection = ShardedCollection({
+                shard["org_nm"]: self._checked_collection(shard)
+                for shard in manifest[SHARDS_KEY]
+            })
+        else:
+            if manifest:
+                self.collection_nm = manifest["collection_nm"]
+            else:
+                self.collection_nm = max(self.client.list_collections()).name
+            self.collection = self._checked_collection(
+                manifest or {"collection_nm": self.collection_nm}
+                )
+
+    def _checked_collection(self, entry:dict):
+        """Open one collection or flat index & check its embedding spec."""
+        if entry.get("backend") == "flat":
+            # a memory-mapped FlatIndex, queried like a chroma collection
+            from scripts.flat_index import open_flat_index
+            collection = open_flat_index(
+                os.path.join(self.vector_store_pth, entry["index_dir"])
+                )
+        else:
+            collection = self.client.get_collection(
+                name=entry["collection_nm"]
+                )
+        check_embedding_spec(
+            collection.metadata,
+            model=EMBEDDINGS_MODEL,
+            dimensionality=EMBEDDINGS_DIMENSIONALITY,
+            query_task_type=QUERY_TASK_TYPE,
+            collection_nm=entry["collection_nm"],
             )
+        return collection
 
     def get_data_vintage(self) -> str:
         """
@@ -290,7 +445,10 @@ class ChromaDBPipeline:
         Process database results and format them into a response.
 
         This method extracts relevant information from the database
-        results, formats it, and combines it into a summary prompt.
+        results. The full repo details are stored in `ui_results` for
+        rendering, while a compact form of each result is combined into
+        the summary prompt. The export table is extended separately, see
+        `extend_export_table`.
 
         Parameters
         ----------
@@ -313,7 +471,8 @@ class ChromaDBPipeline:
             )
         aisummary_pat = re.compile(r"AI Summary: (.*)", re.IGNORECASE)
         # for each result, extract properties and inject into template
-        ui_resps = []  
+        self.ui_results = []
+        llm_resps = []
         current_time = datetime.datetime.now()
         for k, v in self.results.items():
             doc = v.get("document")
@@ -332,6 +491,7 @@ class ChromaDBPipeline:
             )
             date_out = f"{formatted_date} ({days_ago} days ago)."
             meta_dict = {
+                "repo_id": k,
                 "search_terms": ", ".join(self.current_keywords),
                 "org_nm": metas.get("org_nm"),
                 "repo_nm": nm[0] if nm else None,
@@ -344,18 +504,22 @@ class ChromaDBPipeline:
                 "distance": dist, 
                 "model_summary": ai_summary[0] if ai_summary else None,
             }
-            self.export_table = pd.concat(
-                [self.export_table, pd.DataFrame(meta_dict, index=[0])],
-                ignore_index=True, axis=0,
-            )
-            ui_resp = format_results(
-                db_result=meta_dict,
+            self.ui_results.append(meta_dict)
+            llm_resps.append(
+                format_results(
+                    db_result=meta_dict,
+                    rank=len(llm_resps) + 1,
+                    max_words=RESULT_SUMMARY_WORDS,
+                    )
                 )
-            ui_resps.append(ui_resp)
-        
-        self.export_table.reset_index(drop=True, inplace=True)
-        repo_results = "***".join(ui_resps)
-        self.chat_ui_results = repo_results
+
+        repo_results = "\n".join(llm_resps) or "No results."
+        self.llm_results = repo_results
+        self.results_reference = format_compact_reference(
+            usr_prompt=sanitised_prompt,
+            search_terms=self.current_keywords,
+            repo_nms=[res["repo_nm"] for res in self.ui_results],
+            )
         summary_prompt = format_evaluation_response(
             usr_prompt=sanitised_prompt, res=repo_results
             )
@@ -364,9 +528,59 @@ class ChromaDBPipeline:
             "content": summary_prompt.replace("\n", " ").replace("  ", " ")
             }
 
+    def extend_export_table(self, ui_results:list) -> None:
+        """
+        Add a search's results to the export table.
+
+        Parameters
+        ----------
+        ui_results : list
+            The search's `ui_results`.
+        """
+        if not ui_results:
+            return
+        import pandas as pd
+        with self._lock:
+            self.export_table = pd.concat(
+                [self.export_table, pd.DataFrame(ui_results)],
+                ignore_index=True, axis=0,
+            )
+
     def reset_export_table(self):
         """Initilialise the export table."""
-        self.export_table = pd.DataFrame()
+        self._export_table = None
+
+    def _new_search(self, keywords:List[str]) -> "ChromaDBPipeline":
+        """
+        A pipeline holding one search's results.
+
+        Filtering & formatting work on instance state, so each search gets
+        its own rather than sharing this one with the session's other
+        concurrent searches.
+        """
+        search = ChromaDBPipeline(
+            vector_store_pth=self.vector_store_pth,
+            nomic_api_key=self.nomic_api_key,
+            )
+        search.collection_nm = self.collection_nm
+        search.current_keywords = keywords
+        return search
+
+    def _search_response(
+        self, search:"ChromaDBPipeline", sanitised_prompt:str
+        ) -> dict:
+        """Format a search's filtered results, as `execute_pipeline` does."""
+        summary_prompt = search.respond_with_db_results(
+            sanitised_prompt=sanitised_prompt
+            )
+        self.extend_export_table(search.ui_results)
+        return {
+            "summary_prompt": summary_prompt,
+            "ui_results": search.ui_results,
+            "results": search.results,
+            "total_removed": search.total_removed,
+            "results_reference": search.results_reference,
+        }
 
     def _login_nomic(self) -> None:
         """
@@ -374,7 +588,12 @@ class ChromaDBPipeline:
 
         This method uses the `login` function to authenticate with the
         Nomic API using the API key stored in the `nomic_api_key`
-        attribute of the class.
+        attribute of the class. Login happens once per process and again
+        only if the key changes, concurrent logins with the same key
+        sharing one call. Login is given up after the Nomic timeout, and no
+        lock is held while it runs. An optional ATLAS_API_PATH in the .env
+        file points the nomic client at another server, eg
+        `benchmarks.stub_server`.
 
         Parameters
         ----------
@@ -383,7 +602,71 @@ class ChromaDBPipeline:
         -------
         None
         """
-        login(token=self.nomic_api_key)
+        global _nomic_token
+        with _nomic_lock:
+            if _nomic_token == self.nomic_api_key:
+                return
+        from nomic import login
+        # read by the nomic client from the environment, as it is created
+        # on the first embed
+        if (api_pth := get_secrets().get("ATLAS_API_PATH")):
+            os.environ.setdefault("ATLAS_API_PATH", api_pth)
+        _nomic_logins.do(
+            self.nomic_api_key,
+            lambda: get_breaker("nomic").call_bounded(
+                login, token=self.nomic_api_key
+                ),
+            )
+        with _nomic_lock:
+            _nomic_token = self.nomic_api_key
+
+    def _follow_manifest(self) -> None:
+        """
+        Open the live collection, re-opening it if the manifest switched.
+
+        Builds keep the collection they replace until the following build,
+        so a session finishes its search on the old one & moves on its
+        next. A new live collection that fails the embedding spec check is
+        logged once & the current collection kept.
+        """
+        manifest = read_manifest(self.vector_store_pth)
+        live_nm = manifest["collection_nm"] if manifest else None
+        if self.collection is not None and live_nm == self._manifest_nm:
+            return
+        current = (self.collection, self.collection_nm)
+        try:
+            self.get_latest_chroma_collection()
+        except ValueError:
+            if current[0] is None:
+                raise
+            logging.exception(
+                f"Not switching to {live_nm}, still searching {current[1]}"
+                )
+            self.collection, self.collection_nm = current
+            self._manifest_nm = live_nm
+            return
+        self.get_data_vintage()
+
+    def _embed_and_query(self, keywords:List[str], n_results:int) -> tuple:
+        """Embed keywords & query the collection, returning both."""
+        embeddings = self.embed_keywords(keywords)
+        try:
+            results = self.query_collection(
+                embedded_keywords=embeddings, n_results=n_results
+                )
+        except _missing_collection_errors():
+            # removed since this session opened it, eg by a second build
+            logging.warning(
+                f"{self.collection_nm} no longer exists, reopening the live "
+                "collection"
+                )
+            with self._lock:
+                self.collection = None
+                self._follow_manifest()
+            results = self.query_collection(
+                embedded_keywords=embeddings, n_results=n_results
+                )
+        return embeddings, results
 
     def execute_pipeline(
         self,
@@ -395,10 +678,18 @@ class ChromaDBPipeline:
         """
         Executes the pipeline methods in the correct order.
 
+        Blocks on Nomic & chromadb, so the app runs it in a worker thread.
+        Each call's results are returned rather than left on the pipeline,
+        as one session may run several searches at once. The manifest is
+        read on each call, so sessions move to a new live collection on
+        their next search.
+
         Parameters
         ----------
         keywords : List[str]
             List of keywords to embed.
+        n_results : int
+            Results to return.
         distance_threshold : float
             Distance threshold for filtering results.
         sanitised_prompt: str
@@ -407,18 +698,128 @@ class ChromaDBPipeline:
         Returns
         -------
         dict
-            The response with summary prompt content formatted with db
-            results.
+            This search's `summary_prompt`, the response with summary
+            prompt content formatted with db results, with its
+            `ui_results`, filtered `results`, the number of results removed
+            as `total_removed` & its `results_reference`.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If Nomic failed, timed out or its breaker is open.
         """
-        self._login_nomic()
-        self.embed_keywords(keywords)
-        self.get_latest_chroma_collection()
-        self.get_data_vintage()
-        self.query_collection(n_results=n_results)
-        self.filter_results(
+        with self._lock:
+            self._follow_manifest()
+        # identical searches in flight from other sessions share one embed
+        # & query, each session filtering its own copy
+        _, results = _search_flights.do(
+            (
+                self.vector_store_pth,
+                self.collection_nm,
+                normalise_keywords(keywords),
+                n_results,
+            ),
+            lambda: self._embed_and_query(keywords, n_results),
+            )
+        search = self._new_search(keywords)
+        search.results = results
+        search.filter_results(
             dist_thresh=distance_threshold,
             n_results=n_results
             )
-        return self.respond_with_db_results(
-            sanitised_prompt=sanitised_prompt
+        return self._search_response(search, sanitised_prompt)
+
+
+class RemoteChromaDBPipeline(ChromaDBPipeline):
+    """
+    A ChromaDBPipeline that searches via the retrieval service.
+
+    Used when the app is configured for remote retrieval, eg by the
+    multi-worker launcher `scripts.serve`. Embedding, querying & filtering
+    run in `scripts.retrieval_service`, which holds the vector store once
+    for all its clients. Results are formatted for the chat as before.
+    The retrieval client blocks, so the app calls `execute_pipeline` &
+    `get_data_vintage` from worker threads.
+
+    Attributes
+    ----------
+    retrieval_client : RetrievalClient
+        The shared client for the retrieval service.
+
+    Methods
+    -------
+    get_latest_chroma_collection() -> None
+        Read the live collection name from the service.
+    execute_pipeline(
+        keywords: List[str],
+        n_results: int,
+        distance_threshold: float,
+        sanitised_prompt: str
+        ) -> dict
+        Search via the service & format the results.
+    """
+
+    def __init__(self, retrieval_client=None, **kwargs):
+        super().__init__(**kwargs)
+        if retrieval_client is None:
+            from scripts.retrieval_service import get_retrieval_client
+            retrieval_client = get_retrieval_client()
+        self.retrieval_client = retrieval_client
+
+    def get_latest_chroma_collection(self) -> None:
+        """Read the live collection name from the service."""
+        self.collection_nm = get_breaker("retrieval").call(
+            self.retrieval_client.health
+            )["collection_nm"]
+
+    def execute_pipeline(
+        self,
+        keywords:List[str],
+        n_results:int,
+        distance_threshold:float,
+        sanitised_prompt:str
+        ) -> dict:
+        """
+        Search via the retrieval service & format the results.
+
+        Parameters
+        ----------
+        keywords : List[str]
+            List of keywords to search for.
+        n_results : int
+            Results to return.
+        distance_threshold : float
+            Distance threshold for filtering results.
+        sanitised_prompt: str
+            Processed user's prompt.
+
+        Returns
+        -------
+        dict
+            As `ChromaDBPipeline.execute_pipeline`.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If the service failed, timed out or its breaker is open.
+        """
+        resp = get_breaker("retrieval").call(
+            self.retrieval_client.query,
+            keywords=keywords,
+            n_results=n_results,
+            distance_threshold=distance_threshold,
+        )
+        self.collection_nm = resp["collection_nm"]
+        search = self._new_search(keywords)
+        search.total_removed = resp["total_removed"]
+        search.results = OrderedDict(
+            (res.pop("id"), res) for res in resp["results"]
             )
+        return self._search_response(search, sanitised_prompt)
+
+
+def new_chroma_pipeline() -> ChromaDBPipeline:
+    """A pipeline for one app session, remote if so configured."""
+    if RETRIEVAL_SOCKET_PTH or RETRIEVAL_URL:
+        return RemoteChromaDBPipeline()
+    return ChromaDBPipeline()
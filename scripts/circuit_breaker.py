@@ -0,0 +1,362 @@
+"""Timeouts & circuit breakers for the app's external dependencies.
+
+Every call to OpenAI, the moderation endpoint, Nomic or the retrieval
+service goes through the dependency's CircuitBreaker. A call that takes
+longer than the dependency's timeout, or fails with a transport, timeout or
+API error, raises DependencyUnavailable, which the chat answers with a
+defined fallback rather than an unhandled exception:
+
+    try:
+        flagged = await get_breaker("moderation").call_async(
+            check_moderation, prompt=prompt, openai_client=openai_client
+            )
+    except DependencyUnavailable as e:
+        ...
+
+Other exceptions are bugs on our side, so are raised as they are & not
+counted against the dependency.
+
+After BREAKER_FAILURE_THRESHOLD consecutive failures a breaker opens &
+refuses calls straight away, so sessions stop waiting on a dependency that
+is down. After BREAKER_RESET_SECONDS it lets one trial call through, closing
+again if the trial succeeds. Breakers are shared by every session in a
+process, see `get_breaker`, and their states & counts are written with each
+turn's metrics & served by the retrieval service's /health.
+
+Blocking calls without a timeout of their own, such as nomic's, go through
+`call_bounded`, which waits for them on a shared worker thread.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import inspect
+import logging
+import sys
+import threading
+import time
+from typing import Callable
+
+from scripts.app_config import (
+    BREAKER_CALL_WORKERS,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    DEPENDENCY_TIMEOUTS,
+)
+
+# error types of the dependencies' clients, which are only checked for once
+# the client is imported, so importing this module imports none of them
+_CLIENT_ERRORS = [
+    ("openai", "APIError"),
+    ("httpx", "HTTPError"),
+    ("requests", "RequestException"),
+]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+
+class DependencyUnavailable(RuntimeError):
+    """
+    An external call failed, timed out or was refused by an open breaker.
+
+    Attributes
+    ----------
+    dependency : str
+        The breaker's name, eg "nomic".
+    reason : str
+        One of "open", "timeout" or "error".
+    """
+
+    def __init__(self, dependency:str, reason:str):
+        super().__init__(f"{dependency} unavailable ({reason})")
+        self.dependency = dependency
+        self.reason = reason
+
+
+@lru_cache(maxsize=1)
+def _bounded_executor() -> ThreadPoolExecutor:
+    """Threads for `CircuitBreaker.call_bounded`, started on first use."""
+    return ThreadPoolExecutor(
+        max_workers=BREAKER_CALL_WORKERS, thread_name_prefix="bounded-call"
+        )
+
+
+def _is_timeout(e:BaseException) -> bool:
+    """Timeouts from asyncio, futures, httpx & the OpenAI client."""
+    return isinstance(e, TimeoutError) or "Timeout" in type(e).__name__
+
+
+def _is_dependency_error(e:BaseException) -> bool:
+    """Transport, timeout & API errors, rather than bugs in our code."""
+    errors = [TimeoutError, ConnectionError]
+    for module_nm, error_nm in _CLIENT_ERRORS:
+        if (module := sys.modules.get(module_nm)):
+            errors.append(getattr(module, error_nm))
+    # nomic raises bare Exceptions for its API's error responses
+    return isinstance(e, tuple(errors)) or type(e) is Exception
+
+
+class CircuitBreaker:
+    """
+    Bound the calls to one dependency & stop calling it while it is down.
+
+    Safe to share between threads & sessions.
+
+    Attributes
+    ----------
+    name : str
+        The dependency, eg "openai".
+    timeout : float
+        Seconds a call may take. Async calls are cancelled after it, sync
+        calls must bound their own waits by it.
+    failure_threshold : int
+        Consecutive failures that open the breaker.
+    reset_after : float
+        Seconds an open breaker refuses calls before a trial call.
+    state : str
+        "closed", "open" or "half_open".
+    n_calls : int
+        Calls made through the breaker, including refused calls.
+    n_failures : int
+        Calls that failed or timed out.
+    n_timeouts : int
+        Calls that timed out.
+    n_rejected : int
+        Calls refused while open.
+    n_opened : int
+        Times the breaker has opened.
+
+    Methods
+    -------
+    call(fn: Callable, *args, **kwargs) -> object
+        Run a blocking call through the breaker.
+    call_bounded(fn: Callable, *args, **kwargs) -> object
+        Run a blocking call through the breaker, giving up after `timeout`.
+    call_async(fn: Callable, *args, **kwargs) -> object
+        Await a call through the breaker, cancelling it after `timeout`.
+    stats() -> dict
+        State & counts, for metrics.
+    """
+
+    def __init__(
+        self,
+        name:str,
+        timeout:float,
+        failure_threshold:int=BREAKER_FAILURE_THRESHOLD,
+        reset_after:float=BREAKER_RESET_SECONDS,
+        ):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.n_calls = 0
+        self.n_failures = 0
+        self.n_timeouts = 0
+        self.n_rejected = 0
+        self.n_opened = 0
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state:str) -> None:
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.n_opened += 1
+            logging.warning(
+                f"Circuit breaker for {self.name} opened after "
+                f"{self._consecutive} consecutive failures"
+                )
+        elif state == CLOSED:
+            logging.info(f"Circuit breaker for {self.name} closed")
+        self.state = state
+
+    def _admit(self) -> None:
+        """Raise if the breaker refuses the call."""
+        with self._lock:
+            self.n_calls += 1
+            if self.state == OPEN and (
+                time.monotonic() - self._opened_at >= self.reset_after
+                ):
+                self._set_state(HALF_OPEN)
+            # while half open, one trial call at a time
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trial):
+                self.n_rejected += 1
+                raise DependencyUnavailable(self.name, OPEN)
+            if self.state == HALF_OPEN:
+                self._trial = True
+
+    def _record(self, outcome) -> None:
+        """Record a call's outcome, None if it was cancelled."""
+        with self._lock:
+            self._trial = False
+            if outcome is None:
+                return
+            if outcome == "ok":
+                self._consecutive = 0
+                if self.state != CLOSED:
+                    self._set_state(CLOSED)
+                return
+            self.n_failures += 1
+            self.n_timeouts += outcome == "timeout"
+            self._consecutive += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED
+                and self._consecutive >= self.failure_threshold
+                ):
+                self._set_state(OPEN)
+
+    def call(self, fn:Callable, *args, **kwargs):
+        """
+        Run a blocking call through the breaker.
+
+        Parameters
+        ----------
+        fn : Callable
+            The call, which must give up after `timeout` itself, eg by
+            waiting on a future with `timeout`.
+        *args, **kwargs
+            Passed through to `fn`.
+
+        Returns
+        -------
+        object
+            Whatever `fn` returned.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If the breaker is open, or `fn` timed out or raised a transport
+            or API error.
+        Exception
+            Any other error `fn` raised, not counted as a failure.
+        """
+        self._admit()
+        outcome = None
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except Exception as e:
+            if not _is_dependency_error(e):
+                raise
+            outcome = "timeout" if _is_timeout(e) else "error"
+            logging.warning(f"Call to {self.name} failed: {e!r}")
+            raise DependencyUnavailable(self.name, outcome) from e
+        finally:
+            self._record(outcome)
+
+    def call_bounded(self, fn:Callable, *args, **kwargs):
+        """
+        Run a blocking call through the breaker, giving up after `timeout`.
+
+        For calls that cannot bound their own waits. The call runs on a
+        shared worker thread, which a call that times out holds until it
+        returns, as threads cannot be cancelled.
+
+        Parameters
+        ----------
+        fn : Callable
+            The call, eg `nomic.login`.
+        *args, **kwargs
+            Passed through to `fn`.
+
+        Returns
+        -------
+        object
+            Whatever `fn` returned.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If the breaker is open, or `fn` timed out or raised a transport
+            or API error.
+        Exception
+            Any other error `fn` raised, not counted as a failure.
+        """
+        return self.call(
+            lambda: _bounded_executor().submit(fn, *args, **kwargs).result(
+                timeout=self.timeout
+                )
+            )
+
+    async def call_async(self, fn:Callable, *args, **kwargs):
+        """
+        Await a call through the breaker, cancelling it after `timeout`.
+
+        Parameters
+        ----------
+        fn : Callable
+            Returns the awaitable to bound, eg
+            `openai_client.moderations.create`.
+        *args, **kwargs
+            Passed through to `fn`.
+
+        Returns
+        -------
+        object
+            The awaited result.
+
+        Raises
+        ------
+        DependencyUnavailable
+            If the breaker is open, or the call timed out or raised a
+            transport or API error.
+        Exception
+            Any other error the call raised, not counted as a failure.
+        """
+        self._admit()
+        outcome = None
+        try:
+            result = fn(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, self.timeout)
+            outcome = "ok"
+            return result
+        except Exception as e:
+            if not _is_dependency_error(e):
+                raise
+            outcome = "timeout" if _is_timeout(e) else "error"
+            logging.warning(f"Call to {self.name} failed: {e!r}")
+            raise DependencyUnavailable(self.name, outcome) from e
+        finally:
+            self._record(outcome)
+
+    def stats(self) -> dict:
+        """State & counts, for metrics."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "calls": self.n_calls,
+                "failures": self.n_failures,
+                "timeouts": self.n_timeouts,
+                "rejected": self.n_rejected,
+                "opened": self.n_opened,
+            }
+
+
+def get_breaker(name:str) -> CircuitBreaker:
+    """
+    The process's breaker for a dependency, created on first use.
+
+    Parameters
+    ----------
+    name : str
+        A key of DEPENDENCY_TIMEOUTS, eg "openai".
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, DEPENDENCY_TIMEOUTS[name])
+        return _breakers[name]
+
+
+def breaker_stats() -> dict:
+    """State & counts of every breaker used so far, by dependency."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
@@ -82,11 +82,6 @@ def feedback_tab():
             use of
             <a href=https://docs.github.com/en/graphql target=_blank>GitHub GraphQL API</a>
             could resolve this issue.
-            * The model no longer streams responses, since
-            <a href=https://github.com/ministryofjustice/github-chat/blob/main/CHANGELOG.md#020---2025-01-15  target=_blank>version 0.2.0</a>,
-            the LLM is able to extract key terms from the user's prompts in
-            order to query the vector store. Implementing this feature with
-            streamed responses has proven to be difficult.  
             * This application contains public repo metadata only. We are
             currently examining demand for an internal application that
             would include all MoJ repo metadata.
@@ -95,6 +90,48 @@ def feedback_tab():
     )
 
 
+RESULTS_COLUMNS = [
+    "Repo", "Organisation", "Language", "Archived", "Updated", "AI Summary"
+]
+
+
+def results_table(results:list) -> str:
+    """Render repo results as a single HTML table for the chat UI.
+
+    Built once per search from the structured results, rather than
+    formatting and joining a text template per repo. Text content is
+    escaped by htmltools.
+    """
+    rows = [
+        ui.tags.tr(
+            ui.tags.td(
+                ui.a(
+                    res.get("repo_nm"),
+                    href=res.get("html_url"),
+                    target="_blank",
+                ),
+                ui.br(),
+                ui.tags.small(res.get("repo_desc")),
+            ),
+            ui.tags.td(res.get("org_nm")),
+            ui.tags.td(res.get("programming_language")),
+            ui.tags.td("Yes" if res.get("is_archived") else "No"),
+            ui.tags.td(res.get("updated_at")),
+            ui.tags.td(res.get("model_summary")),
+        )
+        for res in results
+    ]
+    table = ui.tags.table(
+        ui.tags.thead(
+            ui.tags.tr(*[ui.tags.th(col) for col in RESULTS_COLUMNS])
+        ),
+        ui.tags.tbody(*rows),
+        class_="table table-sm results-table",
+    )
+    # single line, so the chat's markdown renderer treats it as one block
+    return table.get_html_string(eol="")
+
+
 NUMERIC_PARAMS = [
     {"id": "selected_n", "label": "n results", "value": 5, "min": 1, "max": None, "step": 1},
     {"id": "dist_thresh", "label": "Distance threshold", "value": 2.0, "min": 0.0, "max": 2.0, "step": 0.1},
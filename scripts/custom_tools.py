@@ -1,5 +1,5 @@
 """Store schemas for defining structured model outputs here."""
-from typing import List
+from typing import List, Literal, Optional
 
 from openai import pydantic_function_tool
 from pydantic import BaseModel
@@ -34,6 +34,49 @@ class ExtractKeywordEntities(BaseModel):
     keywords: List[str]
 
 
+class CountRepos(BaseModel):
+    """Count repos exactly, optionally filtered & broken down by group.
+
+    Use for questions about how many repos there are, or how they break
+    down, rather than which repos are about a subject. For example "How
+    many Python repos are archived in moj-analytical-services?" or "Which
+    languages are used most?". Leave any filter the user has not asked
+    for as null.
+
+    Attributes
+    ----------
+    org_nm: Optional[str]
+        Only repos in this GitHub organisation.
+    programming_language: Optional[str]
+        Only repos in this programming language.
+    is_archived: Optional[bool]
+        True for only archived repos, False for only active repos.
+    topic: Optional[str]
+        Only repos with this GitHub topic.
+    updated_within_days: Optional[int]
+        Only repos updated within this many days.
+    not_updated_within_days: Optional[int]
+        Only repos not updated within this many days, eg stale repos.
+    group_by: Optional[str]
+        Count per organisation, programming language, archived status,
+        topic or year last updated, as well as in total.
+    """
+
+    org_nm: Optional[str]
+    programming_language: Optional[str]
+    is_archived: Optional[bool]
+    topic: Optional[str]
+    updated_within_days: Optional[int]
+    not_updated_within_days: Optional[int]
+    group_by: Optional[Literal[
+        "org_nm",
+        "programming_language",
+        "is_archived",
+        "topic",
+        "updated_year",
+    ]]
+
+
 class ExportDataToTSV(BaseModel):
     """Export cached repo results data to a TSV file.
 
@@ -119,16 +162,40 @@ class DraftEmail(BaseModel):
     body: str
 
 
+# tool schemas are built once at import & shared by every request
+TOOL_SCHEMAS = {
+    tool.__name__: pydantic_function_tool(tool) for tool in [
+        ShouldExtractKeywords,
+        ExtractKeywordEntities,
+        CountRepos,
+        ExportDataToTSV,
+        ShouldExplainTools,
+        WipeChat,
+        ShouldDraftEmail,
+        DraftEmail,
+    ]
+}
+
 toolbox = [
-    pydantic_function_tool(ShouldExtractKeywords),
-    pydantic_function_tool(ShouldExplainTools),
-    pydantic_function_tool(ShouldDraftEmail),
-    pydantic_function_tool(ExportDataToTSV),
-    pydantic_function_tool(WipeChat),
+    TOOL_SCHEMAS["ShouldExtractKeywords"],
+    TOOL_SCHEMAS["CountRepos"],
+    TOOL_SCHEMAS["ShouldExplainTools"],
+    TOOL_SCHEMAS["ShouldDraftEmail"],
+    TOOL_SCHEMAS["ExportDataToTSV"],
+    TOOL_SCHEMAS["WipeChat"],
 ] # these tools are available to the orchestrator agent
 
+single_call_toolbox = [
+    TOOL_SCHEMAS["ExtractKeywordEntities"],
+    *toolbox[1:],
+] # orchestrator extracts keywords itself, saving a round-trip
+
+extraction_toolbox = [TOOL_SCHEMAS["ExtractKeywordEntities"]]
+draft_email_toolbox = [TOOL_SCHEMAS["DraftEmail"]]
+
 toolbox_manual_members = [
     ExtractKeywordEntities,
+    CountRepos,
     ExportDataToTSV,
     ExplainTools,
     WipeChat,
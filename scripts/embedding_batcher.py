@@ -0,0 +1,224 @@
+"""Micro-batch query embeddings from concurrent searches.
+
+Each search embeds a handful of keywords, so under load the app would make
+many small Nomic requests. An EmbeddingBatcher collects the keywords of
+searches arriving within a short window, up to a maximum batch size, embeds
+them in one request & hands each search its own vectors. Keywords repeated
+across searches are embedded once, and the vectors of recent keywords are
+kept, so repeated searches skip Nomic, even while it is down.
+
+Searches wait at most the window for others to join, a few milliseconds,
+against a Nomic round trip of tens. Calls to Nomic go through its circuit
+breaker, so a search waits at most the Nomic timeout. The batcher is shared
+by every `ChromaDBPipeline` in a process, see `get_embedding_batcher`.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Callable, List, Union
+
+from scripts.app_config import (
+    EMBED_BATCH_MAX_SIZE,
+    EMBED_BATCH_WINDOW_MS,
+    EMBED_CACHE_SIZE,
+    EMBEDDINGS_DIMENSIONALITY,
+    EMBEDDINGS_MODEL,
+    QUERY_TASK_TYPE,
+)
+from scripts.circuit_breaker import CircuitBreaker, get_breaker
+
+_batcher_lock = threading.Lock()
+_batcher = None
+
+
+class EmbeddingBatcher:
+    """
+    Embed texts from concurrent callers in shared batches.
+
+    Attributes
+    ----------
+    embed_fn : Callable[[List[str]], list]
+        Embeds a batch of texts, returning a vector per text.
+    window : float
+        Seconds the first request of a batch waits for others to join.
+    max_batch_size : int
+        Texts per batch, sent as soon as a batch reaches it.
+    breaker : Union[CircuitBreaker, None]
+        Bounds each request's wait for its batch by the breaker's timeout
+        & stops requests while it is open.
+    cache_size : int
+        Vectors of recent texts kept, served without a request.
+    n_requests : int
+        Requests embedded.
+    n_batches : int
+        Calls made to `embed_fn`.
+    n_texts : int
+        Texts sent to `embed_fn`, after removing repeats.
+    n_cache_hits : int
+        Texts served from the cache.
+
+    Methods
+    -------
+    embed(texts: List[str]) -> list
+        Embed texts, in a batch with any concurrent requests.
+    stats() -> dict
+        Request, batch & cache counts, for health checks.
+    """
+
+    def __init__(
+        self,
+        embed_fn:Callable[[List[str]], list],
+        window_ms:float=EMBED_BATCH_WINDOW_MS,
+        max_batch_size:int=EMBED_BATCH_MAX_SIZE,
+        breaker:Union[CircuitBreaker, None]=None,
+        cache_size:int=EMBED_CACHE_SIZE,
+        ):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.breaker = breaker
+        self.cache_size = cache_size
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_texts = 0
+        self.n_cache_hits = 0
+        self._cache = OrderedDict()
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+            )
+        self._worker.start()
+
+    def embed(self, texts:List[str]) -> list:
+        """
+        Embed texts, in a batch with any concurrent requests.
+
+        Texts embedded recently are served from the cache, the rest are
+        sent to `embed_fn` through the breaker, if any.
+
+        Parameters
+        ----------
+        texts : List[str]
+            Texts to embed, eg a search's keywords.
+
+        Returns
+        -------
+        list
+            A vector per text, in order.
+
+        Raises
+        ------
+        DependencyUnavailable
+            With a breaker, if it is open, or the batch failed or outlasted
+            the breaker's timeout.
+        Exception
+            Without a breaker, whatever `embed_fn` raised for the batch.
+        """
+        if not texts:
+            return []
+        with self._lock:
+            vectors = {}
+            for text in texts:
+                if text in self._cache:
+                    self._cache.move_to_end(text)
+                    vectors[text] = self._cache[text]
+            self.n_cache_hits += len(vectors)
+        missing = list(dict.fromkeys(t for t in texts if t not in vectors))
+        if missing:
+            if self.breaker is None:
+                embedded = self._submit(missing)
+            else:
+                embedded = self.breaker.call(self._submit, missing)
+            vectors.update(zip(missing, embedded))
+        return [vectors[text] for text in texts]
+
+    def _submit(self, texts:List[str]) -> list:
+        """Queue texts for the next batch & wait for their vectors."""
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result(
+            timeout=self.breaker.timeout if self.breaker else None
+            )
+
+    def _collect(self) -> list:
+        """Wait for a request, then for others to join its batch."""
+        batch = [self._requests.get()]
+        n_texts = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while n_texts < self.max_batch_size:
+            try:
+                request = self._requests.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                    )
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_texts += len(request[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # keywords repeated across searches are embedded once
+            unique = list(dict.fromkeys(
+                text for texts, _ in batch for text in texts
+                ))
+            try:
+                vectors = dict(zip(unique, self.embed_fn(unique)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self.n_requests += len(batch)
+                    self.n_batches += 1
+                    self.n_texts += len(unique)
+            self._remember(vectors)
+            for texts, future in batch:
+                future.set_result([vectors[text] for text in texts])
+
+    def _remember(self, vectors:dict) -> None:
+        """Cache a batch's vectors, dropping the least recently used."""
+        with self._lock:
+            for text, vector in vectors.items():
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Request, batch & cache counts, for health checks."""
+        with self._lock:
+            return {
+                "requests": self.n_requests,
+                "batches": self.n_batches,
+                "texts": self.n_texts,
+                "cache_hits": self.n_cache_hits,
+                "cached": len(self._cache),
+            }
+
+
+def _nomic_embed(texts:List[str]) -> list:
+    """Embed search keywords with Nomic, as the vector store expects."""
+    from nomic import embed
+    return embed.text(
+        texts=texts,
+        model=EMBEDDINGS_MODEL,
+        task_type=QUERY_TASK_TYPE,
+        dimensionality=EMBEDDINGS_DIMENSIONALITY,
+    )["embeddings"]
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """The process's shared batcher of Nomic query embeddings."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher(
+                _nomic_embed, breaker=get_breaker("nomic")
+                )
+        return _batcher
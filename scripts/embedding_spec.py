@@ -0,0 +1,112 @@
+"""Record & verify how a collection's embeddings were made.
+
+Documents are embedded at build time with ollama, queries at run time with
+the Nomic API, configured separately in `pipeline_config.py` and
+`app_config.py`. Search quality silently degrades if the two disagree, so
+each collection records an embedding spec when built, checked against the
+app's configuration when the collection is opened.
+
+The spec is stored in chromadb collection metadata, or flat index metadata,
+and copied to the vector store manifest.
+"""
+from scripts.matryoshka import DIMENSIONALITY_KEY, FULL_DIMENSIONALITY
+
+MODEL_KEY = "embedding_model"
+DOCUMENT_PREFIX_KEY = "document_prefix"
+QUERY_TASK_KEY = "query_task_type"
+# nomic-embed-text task types & the prefix of their paired documents
+NOMIC_TASK_PREFIXES = {
+    "search_query": "search_document: ",
+    "clustering": "clustering: ",
+    "classification": "classification: ",
+}
+# the spec of collections built before it was recorded
+LEGACY_EMBEDDING_SPEC = {
+    MODEL_KEY: "nomic-embed-text-v1.5",
+    DIMENSIONALITY_KEY: FULL_DIMENSIONALITY,
+    DOCUMENT_PREFIX_KEY: "search_document: ",
+    QUERY_TASK_KEY: "search_query",
+}
+
+
+def build_embedding_spec(
+    model:str,
+    dimensionality:int,
+    document_prefix:str,
+    query_task_type:str,
+    ) -> dict:
+    """
+    The embedding spec of a collection, for its metadata.
+
+    Parameters
+    ----------
+    model : str
+        Versioned model name, as the Nomic API names it, eg
+        "nomic-embed-text-v1.5".
+    dimensionality : int
+        Matryoshka dimensionality of the stored embeddings.
+    document_prefix : str
+        Task prefix prepended to documents before embedding.
+    query_task_type : str
+        Nomic task type that queries must be embedded with.
+
+    Returns
+    -------
+    dict
+        Flat metadata, valid as chromadb collection metadata.
+    """
+    return {
+        MODEL_KEY: model,
+        DIMENSIONALITY_KEY: dimensionality,
+        DOCUMENT_PREFIX_KEY: document_prefix,
+        QUERY_TASK_KEY: query_task_type,
+    }
+
+
+def check_embedding_spec(
+    collection_metadata:dict,
+    model:str,
+    dimensionality:int,
+    query_task_type:str,
+    collection_nm:str,
+    ) -> None:
+    """
+    Reject a collection whose embeddings don't match the query embeddings.
+
+    Parameters
+    ----------
+    collection_metadata : dict
+        The collection's metadata, None or missing keys for collections
+        built before the spec was recorded.
+    model : str
+        The model queries are embedded with.
+    dimensionality : int
+        The dimensionality queries are embedded at.
+    query_task_type : str
+        The Nomic task type queries are embedded with.
+    collection_nm : str
+        Named in the error.
+
+    Raises
+    ------
+    ValueError
+        Listing every mismatch between the recorded & query specs.
+    """
+    recorded = {**LEGACY_EMBEDDING_SPEC, **(collection_metadata or {})}
+    expected = {
+        MODEL_KEY: model,
+        DIMENSIONALITY_KEY: dimensionality,
+        DOCUMENT_PREFIX_KEY: NOMIC_TASK_PREFIXES.get(query_task_type),
+        QUERY_TASK_KEY: query_task_type,
+    }
+    mismatches = [
+        f"{key} {recorded[key]!r} != {value!r}"
+        for key, value in expected.items()
+        if recorded[key] != value
+    ]
+    if mismatches:
+        raise ValueError(
+            f"Collection {collection_nm} was embedded differently to "
+            f"queries ({'; '.join(mismatches)}). Update app_config.py to "
+            "match or rebuild the vector store."
+            )
@@ -0,0 +1,268 @@
+"""Cache tool explanations so that repeat requests need no model call.
+
+Explanations are keyed on the normalised style guidance and a hash of the
+toolbox manual, so any change to the tools invalidates the cache. As
+sessions share the cache, explanations are always generated with the fixed
+TOOL_EXPLAINER_SAMPLING rather than the user's sampling parameters, & only
+complete, non-empty responses are cached. The default explanation, with no
+style guidance, can be generated ahead of time with `prewarm()`. The cache
+is saved to TOOL_EXPLANATION_CACHE_PTH whenever an explanation is added,
+merged with the entries saved by other processes, so explanations survive
+restarts.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import re
+import threading
+from typing import Union
+
+from scripts.app_config import (
+    APP_LLM,
+    TOOL_EXPLAINER_SAMPLING,
+    TOOL_EXPLANATION_CACHE_PTH,
+    TOOL_EXPLANATION_CACHE_SIZE,
+)
+from scripts.chat_utils import build_completion_params
+from scripts.prompts import (
+    get_tool_explainer_sys_prompt,
+    get_toolbox_manual,
+    TOOL_EXPLAINER_PROMPT,
+    TOOLS_MISUSE_DEFENCE,
+)
+
+DEFAULT_STYLE = ""
+# style guidance the orchestrator passes when the user gave none
+NULL_GUIDANCE = {
+    "", "none", "n a", "na", "no", "null", "default", "not specified",
+    "no guidance", "no style guidance", "no specific guidance",
+}
+
+
+def normalise_style_guidance(style_guidance:Union[str, None]) -> str:
+    """Lower case, strip punctuation & collapse whitespace."""
+    normalised = re.sub(r"[^\w\s]", " ", (style_guidance or "").lower())
+    normalised = " ".join(normalised.split())
+    return DEFAULT_STYLE if normalised in NULL_GUIDANCE else normalised
+
+
+def tool_explainer_messages(style_guidance:str) -> list:
+    """Build the messages sent to the tool explainer agent."""
+    return [
+        {"role": "system", "content": get_tool_explainer_sys_prompt()},
+        {
+            "role": "user",
+            "content": TOOL_EXPLAINER_PROMPT.format(
+                style_guide=style_guidance,
+                TOOLS_MISUSE_DEFENCE=TOOLS_MISUSE_DEFENCE,
+                ),
+        },
+    ]
+
+
+def tool_explainer_params(style_guidance:str, model:str=APP_LLM) -> dict:
+    """Completion parameters for an explanation, with fixed sampling."""
+    return build_completion_params(
+        tool_explainer_messages(style_guidance),
+        model=model,
+        **TOOL_EXPLAINER_SAMPLING,
+        )
+
+
+def cacheable_explanation(resp) -> Union[str, None]:
+    """
+    The explanation in a response, if it is fit to cache.
+
+    Parameters
+    ----------
+    resp : openai.types.chat.ChatCompletion
+        The tool explainer agent's response.
+
+    Returns
+    -------
+    Union[str, None]
+        The explanation, or None if the response was cut short, filtered
+        or empty.
+    """
+    choice = resp.choices[0]
+    content = choice.message.content
+    if choice.finish_reason != "stop" or not (content or "").strip():
+        return None
+    return content
+
+
+class ToolExplanationCache:
+    """
+    A bounded, thread-safe cache of tool explanations.
+
+    Attributes
+    ----------
+    manual_hash : str
+        SHA-256 of the toolbox manual the explanations describe.
+    max_entries : int
+        Least recently used entries are evicted beyond this size.
+    cache_pth : Union[Path, None]
+        Optional JSON file the cache is loaded from & saved to.
+    hits : int
+        Number of cache hits since start up.
+    misses : int
+        Number of cache misses since start up.
+
+    Methods
+    -------
+    get(style_guidance: str) -> Union[str, None]
+        Return a cached explanation, if any.
+    set(style_guidance: str, explanation: str) -> None
+        Cache an explanation.
+    prewarm(client: openai.OpenAI, model: str) -> bool
+        Generate & cache the default explanation if it is missing.
+    load() -> None
+        Load entries for the current toolbox manual from `cache_pth`.
+    save() -> None
+        Merge the cache into `cache_pth`.
+    """
+
+    def __init__(
+        self,
+        toolbox_manual:str,
+        max_entries:int=TOOL_EXPLANATION_CACHE_SIZE,
+        cache_pth:Union[str, Path, None]=TOOL_EXPLANATION_CACHE_PTH,
+        ):
+        self.manual_hash = hashlib.sha256(
+            toolbox_manual.encode("utf-8")
+            ).hexdigest()
+        self.max_entries = max_entries
+        self.cache_pth = Path(cache_pth) if cache_pth else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, style_guidance:str) -> str:
+        return f"{self.manual_hash}:{normalise_style_guidance(style_guidance)}"
+
+    def get(self, style_guidance:str) -> Union[str, None]:
+        """
+        Return a cached explanation, if any.
+
+        Parameters
+        ----------
+        style_guidance : str
+            The style guidance passed by the orchestrator.
+
+        Returns
+        -------
+        Union[str, None]
+            The cached explanation, or None on a cache miss.
+        """
+        key = self._key(style_guidance)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, style_guidance:str, explanation:str) -> None:
+        """
+        Cache an explanation, evicting the least recently used if full.
+
+        Parameters
+        ----------
+        style_guidance : str
+            The style guidance the explanation was generated with.
+        explanation : str
+            The tool explainer agent's response.
+        """
+        key = self._key(style_guidance)
+        with self._lock:
+            self._entries[key] = explanation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def prewarm(self, client, model:str=APP_LLM) -> bool:
+        """
+        Generate & cache the default explanation if it is missing.
+
+        Parameters
+        ----------
+        client : openai.OpenAI
+            A synchronous client, as this runs outside the event loop at
+            start up or build time.
+        model : str, optional
+            The model used to write the explanation.
+
+        Returns
+        -------
+        bool
+            True if the default explanation was generated & cached.
+        """
+        key = self._key(DEFAULT_STYLE)
+        with self._lock:
+            if key in self._entries:
+                return False
+        resp = client.chat.completions.create(
+            **tool_explainer_params(DEFAULT_STYLE, model=model)
+        )
+        explanation = cacheable_explanation(resp)
+        if explanation is None:
+            logging.warning(
+                "Default tool explanation was incomplete, not prewarmed"
+                )
+            return False
+        self.set(DEFAULT_STYLE, explanation)
+        logging.info("Prewarmed default tool explanation")
+        return True
+
+    def _read_stored(self) -> dict:
+        """Entries in `cache_pth` for the current toolbox manual."""
+        if not self.cache_pth or not self.cache_pth.exists():
+            return {}
+        with open(self.cache_pth) as f:
+            stored = json.load(f)
+        # entries for an outdated toolbox manual are ignored
+        return {
+            key: explanation for key, explanation in stored.items()
+            if key.startswith(f"{self.manual_hash}:")
+        }
+
+    def load(self) -> None:
+        """Load entries for the current toolbox manual from `cache_pth`."""
+        stored = self._read_stored()
+        with self._lock:
+            self._entries.update(stored)
+
+    def save(self) -> None:
+        """
+        Merge the cache into `cache_pth` atomically.
+
+        Entries saved by other processes are kept, up to `max_entries`,
+        with this process's entries taking precedence.
+        """
+        if not self.cache_pth:
+            return
+        entries = OrderedDict(self._read_stored())
+        with self._lock:
+            for key, explanation in self._entries.items():
+                entries[key] = explanation
+                entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        tmp_pth = self.cache_pth.with_suffix(f".json.{os.getpid()}.tmp")
+        with open(tmp_pth, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_pth, self.cache_pth)
+
+
+@lru_cache(maxsize=1)
+def get_tool_explanation_cache() -> ToolExplanationCache:
+    """The process-wide cache, loaded from disk on first use."""
+    cache = ToolExplanationCache(toolbox_manual=get_toolbox_manual())
+    cache.load()
+    return cache
@@ -0,0 +1,583 @@
+"""Exact repo counts by org, language, archived status, topic & recency.
+
+Questions such as "how many Python repos are archived in
+moj-analytical-services?" are about every repo, not the documents nearest
+some keywords, so vector search can't answer them. A FacetIndex holds the
+facet columns of a snapshot as small numpy arrays, categories as integer
+codes and topics as (repo, topic) pairs, and answers counts, group-bys &
+recency filters exactly, without a model call:
+
+    index = FacetIndex.load(live_facet_index_pth())
+    index.query(programming_language="python", is_archived=True,
+                group_by="org_nm")
+
+Counts by org, language & archived status, and by topic, are precomputed
+when the snapshot is written, so queries filtering only on those are
+answered from the counts. Others mask the columns, microseconds for tens of
+thousands of repos. The index is saved in the snapshot directory as
+`facets.npz`. Building a collection also saves the index of its snapshot in
+the vector store, under `facets/`, and records it in the manifest, so the
+app counts the repos of the live collection's vintage & the index is
+deployed with the vector store. To add one for a live collection built
+before this, from the snapshot of its vintage:
+
+    python -m scripts.facet_index [data/repo-metadata-<vintage>]
+"""
+import argparse
+import ast
+import os
+from pathlib import Path
+import time
+from typing import Union
+
+import numpy as np
+
+from scripts.pipeline_config import VECTOR_STORE_PTH
+
+FACET_INDEX_NM = "facets.npz"
+# the vector store's facet indexes, one per collection, & their manifest key
+FACET_INDEX_DIR = "facets"
+FACET_INDEX_KEY = "facet_index"
+FACET_COLS = [
+    "org_nm", "programming_language", "is_archived", "updated_at", "topics"
+]
+# axes of the precomputed counts
+FACET_AXES = ["org_nm", "programming_language", "is_archived"]
+GROUP_BYS = [*FACET_AXES, "topic", "updated_year"]
+UNKNOWN = "Unknown"
+SECONDS_PER_DAY = 86_400
+# `updated_at` & `updated_year` of repos without a last update date
+NO_DATE = np.iinfo(np.int64).min
+NO_YEAR = 0
+
+
+def facet_index_pth(snapshot_pth:Union[str, Path]) -> str:
+    """Path of a snapshot directory's facet index."""
+    return os.path.join(str(snapshot_pth), FACET_INDEX_NM)
+
+
+def _topic_list(topics) -> list:
+    """A repo's topics as a list, whether stored as a list or a string."""
+    if topics is None:
+        return []
+    if isinstance(topics, str):
+        topics = topics.strip()
+        if topics.startswith("["):
+            try:
+                return [str(t) for t in ast.literal_eval(topics)]
+            except (ValueError, SyntaxError):
+                topics = topics.strip("[]")
+        return [t.strip(" '\"") for t in topics.split(",") if t.strip(" '\"")]
+    if isinstance(topics, float):
+        return [] # NaN
+    return [str(t) for t in topics]
+
+
+def _codes(values:list) -> tuple:
+    """Integer codes & sorted labels of categorical values."""
+    labels, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), labels
+
+
+class FacetIndex:
+    """
+    The facet columns of a snapshot, queried exactly.
+
+    Attributes
+    ----------
+    orgs, languages, topics : np.ndarray
+        Labels of each facet's codes, sorted.
+    org, language : np.ndarray
+        Each repo's org & language code.
+    archived : np.ndarray
+        Each repo's archived status.
+    updated_at : np.ndarray
+        Each repo's last update, in seconds since the epoch, or NO_DATE.
+    updated_year : np.ndarray
+        Each repo's year of last update, or NO_YEAR.
+    topic_repos, topic_codes : np.ndarray
+        A (repo, topic code) pair per topic of each repo, sorted by topic,
+        so a topic's repos are a slice.
+    counts : np.ndarray
+        Repos per org, language & archived status, shape
+        (n orgs, n languages, 2), precomputed.
+    topic_counts : np.ndarray
+        Repos per topic, precomputed.
+
+    Methods
+    -------
+    from_frame(df: pd.DataFrame) -> FacetIndex
+        Build an index from snapshot rows, precomputing the counts.
+    load(pth: str) -> FacetIndex
+        Read an index saved by `save`.
+    save(pth: str) -> None
+        Write the index as an uncompressed .npz file.
+    query(...) -> dict
+        Count repos matching filters, optionally grouped.
+    """
+
+    _ARRAYS = [
+        "orgs", "languages", "topics", "org", "language", "archived",
+        "updated_at", "updated_year", "topic_repos", "topic_codes", "counts",
+        "topic_counts",
+    ]
+
+    def __init__(self, **arrays):
+        for nm in self._ARRAYS:
+            setattr(self, nm, arrays[nm])
+        self._topic_starts = np.concatenate(
+            [[0], np.cumsum(self.topic_counts)]
+            )
+        self._lookups = {
+            nm: {str(label).lower(): i for i, label in enumerate(labels)}
+            for nm, labels in [
+                ("org_nm", self.orgs),
+                ("programming_language", self.languages),
+                ("topic", self.topics),
+            ]
+        }
+
+    @property
+    def n_repos(self) -> int:
+        """Repos in the index."""
+        return len(self.org)
+
+    @classmethod
+    def from_frame(cls, df) -> "FacetIndex":
+        """
+        Build an index from snapshot rows, precomputing the counts.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            One row per repo, with FACET_COLS. Snapshots without topics
+            give an index without topics.
+
+        Returns
+        -------
+        FacetIndex
+        """
+        import pandas as pd
+
+        org, orgs = _codes(df["org_nm"].tolist())
+        language, languages = _codes(
+            df["programming_language"].fillna(UNKNOWN).tolist()
+            )
+        archived = df["is_archived"].fillna(False).astype(bool).to_numpy()
+        updated = pd.to_datetime(df["updated_at"], utc=True, errors="coerce")
+        dated = updated.notna().to_numpy()
+        updated_at = np.full(len(df), NO_DATE, dtype=np.int64)
+        updated_at[dated] = updated[dated].dt.as_unit("s").astype("int64")
+        updated_year = np.full(len(df), NO_YEAR, dtype=np.int32)
+        updated_year[dated] = updated[dated].dt.year
+        repo_topics = [
+            sorted(set(_topic_list(topics)))
+            for topics in (
+                df["topics"] if "topics" in df.columns else [None] * len(df)
+            )
+        ]
+        topic_repos = np.repeat(
+            np.arange(len(df), dtype=np.int32),
+            [len(topics) for topics in repo_topics],
+            )
+        topic_codes, topics = _codes(
+            [topic for topics in repo_topics for topic in topics]
+            )
+        by_topic = np.argsort(topic_codes, kind="stable")
+        counts = np.zeros((len(orgs), len(languages), 2), dtype=np.int64)
+        np.add.at(counts, (org, language, archived.astype(np.intp)), 1)
+        return cls(
+            orgs=orgs,
+            languages=languages,
+            topics=topics,
+            org=org,
+            language=language,
+            archived=archived,
+            updated_at=updated_at,
+            updated_year=updated_year,
+            topic_repos=topic_repos[by_topic],
+            topic_codes=topic_codes[by_topic],
+            counts=counts,
+            topic_counts=np.bincount(topic_codes, minlength=len(topics)),
+        )
+
+    @classmethod
+    def load(cls, pth:Union[str, Path]) -> "FacetIndex":
+        """Read an index saved by `save`."""
+        with np.load(str(pth), allow_pickle=False) as arrays:
+            return cls(**{nm: arrays[nm] for nm in cls._ARRAYS})
+
+    def save(self, pth:Union[str, Path]) -> None:
+        """Write the index as an uncompressed .npz file, fast to load."""
+        with open(str(pth), "wb") as f:
+            np.savez(f, **{nm: getattr(self, nm) for nm in self._ARRAYS})
+
+    def _code(self, facet:str, value:str) -> int:
+        """A label's code, ignoring case, or -1 if no repo has it."""
+        return self._lookups[facet].get(str(value).strip().lower(), -1)
+
+    def query(
+        self,
+        org_nm:Union[str, None]=None,
+        programming_language:Union[str, None]=None,
+        is_archived:Union[bool, None]=None,
+        topic:Union[str, None]=None,
+        updated_within_days:Union[int, None]=None,
+        not_updated_within_days:Union[int, None]=None,
+        group_by:Union[str, None]=None,
+        now:Union[float, None]=None,
+        ) -> dict:
+        """
+        Count repos matching filters, optionally grouped.
+
+        Filters left as None match every repo. Labels are matched ignoring
+        case.
+
+        Parameters
+        ----------
+        org_nm : Union[str, None], optional
+            Only repos in this org.
+        programming_language : Union[str, None], optional
+            Only repos in this language.
+        is_archived : Union[bool, None], optional
+            Only archived, or only active, repos.
+        topic : Union[str, None], optional
+            Only repos with this topic.
+        updated_within_days : Union[int, None], optional
+            Only repos updated in the last this many days.
+        not_updated_within_days : Union[int, None], optional
+            Only repos not updated in the last this many days.
+        group_by : Union[str, None], optional
+            One of GROUP_BYS, to count per group as well.
+        now : Union[float, None], optional
+            Seconds since the epoch that recency is measured from.
+            Defaults to the current time.
+
+        Returns
+        -------
+        dict
+            The total `count` of matching repos and, if grouped, `groups`,
+            a list of (label, count) pairs, largest first, without empty
+            groups. Repos with several topics count once per topic. Repos
+            without a last update date match no recency filter & are
+            grouped by year as "Unknown".
+        """
+        if group_by is not None and group_by not in GROUP_BYS:
+            raise ValueError(f"group_by must be one of {GROUP_BYS}")
+        codes = {
+            facet: self._code(facet, value)
+            for facet, value in [
+                ("org_nm", org_nm),
+                ("programming_language", programming_language),
+                ("topic", topic),
+            ] if value is not None
+        }
+        if -1 in codes.values():
+            return {"count": 0, "groups": [] if group_by else None}
+        by_date = not (
+            updated_within_days is None and not_updated_within_days is None
+            )
+        if topic is None and not by_date and group_by in [None, *FACET_AXES]:
+            return self._query_counts(codes, is_archived, group_by)
+        if is_archived is None and not by_date and set(codes) <= {"topic"}:
+            if not codes and group_by == "topic":
+                return {
+                    "count": self.n_repos,
+                    "groups": self._ranked(self.topic_counts, self.topics),
+                }
+            if codes and group_by is None:
+                return {
+                    "count": int(self.topic_counts[codes["topic"]]),
+                    "groups": None,
+                }
+        mask = np.ones(self.n_repos, dtype=bool)
+        if "org_nm" in codes:
+            mask &= self.org == codes["org_nm"]
+        if "programming_language" in codes:
+            mask &= self.language == codes["programming_language"]
+        if is_archived is not None:
+            mask &= self.archived == bool(is_archived)
+        if "topic" in codes:
+            code = codes["topic"]
+            has_topic = np.zeros(self.n_repos, dtype=bool)
+            has_topic[self.topic_repos[
+                self._topic_starts[code]:self._topic_starts[code + 1]
+                ]] = True
+            mask &= has_topic
+        now = time.time() if now is None else now
+        if by_date:
+            # indexes built before NO_DATE hold NaT's int64 value, the same
+            mask &= self.updated_at != NO_DATE
+        if updated_within_days is not None:
+            mask &= self.updated_at >= now - updated_within_days * SECONDS_PER_DAY
+        if not_updated_within_days is not None:
+            mask &= self.updated_at < (
+                now - not_updated_within_days * SECONDS_PER_DAY
+                )
+        return {
+            "count": int(mask.sum()),
+            "groups": self._groups(mask, group_by) if group_by else None,
+        }
+
+    def _query_counts(self, codes:dict, is_archived, group_by) -> dict:
+        """Answer from the precomputed counts."""
+        selected = [np.arange(n) for n in self.counts.shape]
+        if "org_nm" in codes:
+            selected[0] = np.array([codes["org_nm"]])
+        if "programming_language" in codes:
+            selected[1] = np.array([codes["programming_language"]])
+        if is_archived is not None:
+            selected[2] = np.array([int(bool(is_archived))])
+        counts = self.counts[np.ix_(*selected)]
+        if group_by is None:
+            return {"count": int(counts.sum()), "groups": None}
+        axis = FACET_AXES.index(group_by)
+        per_group = np.zeros(self.counts.shape[axis], dtype=np.int64)
+        per_group[selected[axis]] = counts.sum(
+            axis=tuple(a for a in range(3) if a != axis)
+            )
+        return {
+            "count": int(counts.sum()),
+            "groups": self._ranked(per_group, self._labels(group_by)),
+        }
+
+    def _groups(self, mask:np.ndarray, group_by:str) -> list:
+        """Counts per group of the repos in `mask`."""
+        if group_by == "topic":
+            per_group = np.bincount(
+                self.topic_codes[mask[self.topic_repos]],
+                minlength=len(self.topics),
+                )
+            return self._ranked(per_group, self.topics)
+        if group_by == "updated_year":
+            years = self.updated_year[mask]
+            # indexes built before NO_YEAR hold negative years instead
+            dated = years > NO_YEAR
+            first = years[dated].min() if dated.any() else 0
+            per_group = np.bincount(years[dated] - first)
+            labels = np.arange(first, first + len(per_group)).astype(str)
+            return self._ranked(
+                np.append(per_group, np.count_nonzero(~dated)),
+                np.append(labels, UNKNOWN),
+                )
+        values = {
+            "org_nm": self.org,
+            "programming_language": self.language,
+            "is_archived": self.archived.astype(np.intp),
+        }[group_by]
+        labels = self._labels(group_by)
+        return self._ranked(
+            np.bincount(values[mask], minlength=len(labels)), labels
+            )
+
+    def _labels(self, group_by:str) -> np.ndarray:
+        return {
+            "org_nm": self.orgs,
+            "programming_language": self.languages,
+            "is_archived": np.array(["Active", "Archived"]),
+        }[group_by]
+
+    @staticmethod
+    def _ranked(per_group:np.ndarray, labels:np.ndarray) -> list:
+        """Non-empty groups, largest first, then by label."""
+        return sorted(
+            (
+                (str(label), n)
+                for label, n in zip(labels.tolist(), per_group.tolist()) if n
+            ),
+            key=lambda group: (-group[1], group[0]),
+        )
+
+
+def build_facet_index(snapshot_pth:Union[str, Path]) -> FacetIndex:
+    """Build a snapshot's index, reading only its facet columns."""
+    from scripts.snapshot import read_snapshot, snapshot_columns
+
+    available = snapshot_columns(snapshot_pth)
+    return FacetIndex.from_frame(read_snapshot(
+        snapshot_pth, columns=[col for col in FACET_COLS if col in available]
+        ))
+
+
+def write_facet_index(snapshot_pth:Union[str, Path]) -> FacetIndex:
+    """Build & save the index of a snapshot directory."""
+    index = build_facet_index(snapshot_pth)
+    index.save(facet_index_pth(snapshot_pth))
+    return index
+
+
+def load_facet_index(
+    snapshot_pth:Union[str, Path, None]=None
+    ) -> FacetIndex:
+    """
+    The index of a snapshot, built from the snapshot if not saved with it.
+
+    Parameters
+    ----------
+    snapshot_pth : Union[str, Path, None], optional
+        A snapshot directory or single file. Defaults to the latest.
+
+    Returns
+    -------
+    FacetIndex
+    """
+    from scripts.snapshot import latest_snapshot_pth
+
+    snapshot_pth = str(snapshot_pth or latest_snapshot_pth())
+    if os.path.isfile(pth := facet_index_pth(snapshot_pth)):
+        return FacetIndex.load(pth)
+    return build_facet_index(snapshot_pth)
+
+
+def store_facet_index(
+    snapshot_pth:Union[str, Path],
+    collection_nm:str,
+    vector_store_pth:Union[str, Path]=VECTOR_STORE_PTH,
+    ) -> Union[str, None]:
+    """
+    Save a snapshot's index in the vector store, for its collection.
+
+    Parameters
+    ----------
+    snapshot_pth : Union[str, Path]
+        The snapshot the collection was built from.
+    collection_nm : str
+        The collection, which names the index.
+    vector_store_pth : Union[str, Path], optional
+        Path to the vector store directory.
+
+    Returns
+    -------
+    Union[str, None]
+        The index's path relative to the vector store, for the manifest's
+        FACET_INDEX_KEY, or None if it could not be built, as counts are
+        not needed to search.
+    """
+    index_pth = os.path.join(FACET_INDEX_DIR, f"{collection_nm}.npz")
+    try:
+        index = load_facet_index(snapshot_pth)
+        os.makedirs(
+            os.path.join(str(vector_store_pth), FACET_INDEX_DIR),
+            exist_ok=True,
+            )
+        index.save(os.path.join(str(vector_store_pth), index_pth))
+    except Exception as e:
+        print(f"Warning: no facet index for {collection_nm}: {e!r}")
+        return None
+    return index_pth
+
+
+def live_facet_index_pth(
+    vector_store_pth:Union[str, Path]=VECTOR_STORE_PTH,
+    ) -> str:
+    """
+    Path of the live collection's index, from the vector store manifest.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the manifest records no index.
+    """
+    from scripts.vector_store_manifest import read_manifest
+
+    manifest = read_manifest(vector_store_pth)
+    if not (manifest and manifest.get(FACET_INDEX_KEY)):
+        raise FileNotFoundError(
+            f"No facet index recorded in the manifest in {vector_store_pth}"
+            )
+    return os.path.join(str(vector_store_pth), manifest[FACET_INDEX_KEY])
+
+
+def format_facet_answer(answer:dict, filters:dict, max_groups:int) -> str:
+    """
+    A query's answer as markdown, for the chat.
+
+    Parameters
+    ----------
+    answer : dict
+        Returned by `FacetIndex.query`.
+    filters : dict
+        The query's arguments, None where unfiltered.
+    max_groups : int
+        Groups listed, largest first.
+
+    Returns
+    -------
+    str
+    """
+    described = []
+    if filters.get("is_archived") is not None:
+        described.append("archived" if filters["is_archived"] else "active")
+    if filters.get("programming_language"):
+        described.append(filters["programming_language"])
+    criteria = []
+    if filters.get("org_nm"):
+        criteria.append(f"in {filters['org_nm']}")
+    if filters.get("topic"):
+        criteria.append(f"with the topic '{filters['topic']}'")
+    if filters.get("updated_within_days") is not None:
+        criteria.append(
+            f"updated in the last {filters['updated_within_days']} days"
+            )
+    if filters.get("not_updated_within_days") is not None:
+        criteria.append(
+            f"not updated in the last {filters['not_updated_within_days']} "
+            "days"
+            )
+    noun = "repo" if answer["count"] == 1 else "repos"
+    text = " ".join([f"**{answer['count']:,}**", *described, noun, *criteria])
+    lines = [f"{text}."]
+    if answer["groups"]:
+        heading = filters["group_by"].replace("_nm", "").replace("_", " ")
+        lines += ["", f"| {heading.capitalize()} | Repos |", "|---|---:|"]
+        lines += [
+            f"| {label} | {n:,} |" for label, n in answer["groups"][:max_groups]
+        ]
+        if (n_more := len(answer["groups"]) - max_groups) > 0:
+            lines.append(f"| {n_more:,} more | |")
+    return "\n".join(lines)
+
+
+def main():
+    from scripts.snapshot import latest_snapshot_pth, snapshot_vintage
+    from scripts.vector_store_manifest import read_manifest, write_manifest
+
+    parser = argparse.ArgumentParser(
+        description="Write the facet index of the live collection"
+        )
+    parser.add_argument(
+        "pth", nargs="?", default=None,
+        help="The snapshot directory the live collection was built from, "
+        "defaults to the latest",
+        )
+    args = parser.parse_args()
+    snapshot_pth = str(args.pth or latest_snapshot_pth())
+    if not os.path.isdir(snapshot_pth):
+        parser.error(
+            f"{snapshot_pth} is a single file snapshot, convert it with "
+            "`python -m scripts.snapshot` first"
+            )
+    manifest = read_manifest()
+    if not manifest:
+        parser.error(f"No vector store manifest in {VECTOR_STORE_PTH}")
+    if (vintage := snapshot_vintage(snapshot_pth)) != manifest.get("vintage"):
+        parser.error(
+            f"{snapshot_pth} is of vintage {vintage}, the live collection "
+            f"of {manifest.get('vintage')}"
+            )
+    start = time.perf_counter()
+    index = write_facet_index(snapshot_pth)
+    index_pth = store_facet_index(snapshot_pth, manifest["collection_nm"])
+    if index_pth is None:
+        raise SystemExit(1)
+    write_manifest({**manifest, FACET_INDEX_KEY: index_pth})
+    print(
+        f"Wrote {index_pth} for {manifest['collection_nm']}, "
+        f"{index.n_repos} repos, {len(index.orgs)} orgs, "
+        f"{len(index.languages)} languages, {len(index.topics)} topics in "
+        f"{time.perf_counter() - start:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""A memory-mapped flat vector index, an alternative backend to chromadb.
+
+For a corpus of a few thousand to tens of thousands of repos, an exact
+search over a single embedding matrix is fast enough and avoids chromadb's
+start up and per-query overheads. The index is a directory holding:
+
+* `embeddings.npy`, the unit-normalised embeddings as float32 or float16,
+opened with `np.load(mmap_mode="r")` so pages are shared between processes.
+float16 halves the disk & page cache, but each search upcasts the rows it
+scores, so queries take about 4x as long.
+* `records.parquet`, the ids, documents and metadata in columnar form, in
+row groups of RECORD_GROUP_ROWS. Only the ids are held in memory, the
+documents & metadata of results are read by their row groups.
+* Optionally, quantised codes of the embeddings, int8 (4x smaller than
+float32) or binary (32x smaller), with `index.json` describing them. The
+codes are held in memory & searched first, then the best candidates are
+re-ranked with their full precision rows, read from the memory map.
+
+`FlatIndex.query()` mirrors `chromadb.Collection.query()`, so
+`ChromaDBPipeline` works with either backend. Distances are squared L2
+between unit vectors, `2 - 2 * cosine similarity`, the same scale as a
+default chromadb collection, so distance thresholds carry over.
+"""
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import threading
+from typing import List, Union
+
+import numpy as np
+
+from scripts.matryoshka import DIMENSIONALITY_KEY
+from scripts.pipeline_config import QUANTISED_RERANK_FACTOR
+
+EMBEDDINGS_NM = "embeddings.npy"
+RECORDS_NM = "records.parquet"
+INDEX_META_NM = "index.json"
+CODES_NM = "codes.npy"
+FLAT_INDEX_DIR = "flat"
+QUANTISATIONS = ["int8", "binary"]
+# rows of the matrix scored at a time, bounds memory for float16 indexes
+SEARCH_CHUNK_ROWS = 16_384
+# records per parquet row group, the least read for one result
+RECORD_GROUP_ROWS = 64
+# bits set in each byte value, counting bits where numpy < 2 has no
+# np.bitwise_count
+_BYTE_POPCOUNT = np.unpackbits(
+    np.arange(256, dtype=np.uint8)[:, None], axis=1
+    ).sum(axis=1, dtype=np.uint8)
+
+
+def _bitwise_count(codes:np.ndarray) -> np.ndarray:
+    """Bits set in each byte of uint8 codes."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes)
+    return _BYTE_POPCOUNT[codes]
+
+
+def normalise_rows(embeddings:np.ndarray) -> np.ndarray:
+    """Scale each row to unit length, leaving zero rows unchanged."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def quantise(matrix:np.ndarray, quantisation:str) -> tuple:
+    """
+    Quantise unit-normalised embeddings.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        Unit-normalised embeddings, one per row.
+    quantisation : str
+        "int8", symmetric scaling to [-127, 127], or "binary", the sign of
+        each dimension packed 8 to a byte.
+
+    Returns
+    -------
+    tuple
+        The codes & a dictionary of the parameters needed to quantise
+        queries in the same way.
+    """
+    if quantisation == "int8":
+        scale = 127 / float(np.abs(matrix).max() or 1)
+        codes = np.round(matrix * scale).astype(np.int8)
+        return codes, {"scale": scale}
+    if quantisation == "binary":
+        return np.packbits(matrix > 0, axis=1), {}
+    raise ValueError(f"Unknown quantisation: {quantisation}")
+
+
+def _top_k(scores:np.ndarray, k:int) -> tuple:
+    """Column indices & scores of the `k` highest scores in each row."""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return (
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+def write_flat_index(
+    index_pth:Union[str, Path],
+    ids:list,
+    embeddings,
+    documents:list,
+    metadatas:list,
+    dtype:str="float32",
+    quantisation:Union[str, None]=None,
+    metadata:Union[dict, None]=None,
+    ) -> None:
+    """
+    Write a flat index to `index_pth`.
+
+    Parameters
+    ----------
+    index_pth : Union[str, Path]
+        Directory to write the index to, created if needed.
+    ids : list
+        Record ids, as strings.
+    embeddings : array-like
+        One embedding per record, normalised before writing.
+    documents : list
+        One document per record.
+    metadatas : list
+        One metadata dictionary per record.
+    dtype : str, optional
+        "float32", or "float16" to halve the size of the matrix.
+    quantisation : Union[str, None], optional
+        Also write "int8" or "binary" codes, searched in place of the
+        full precision matrix.
+    metadata : Union[dict, None], optional
+        Index level metadata, eg the embedding spec, as chromadb
+        collection metadata.
+    """
+    import pandas as pd
+
+    os.makedirs(index_pth, exist_ok=True)
+    matrix = normalise_rows(embeddings)
+    np.save(os.path.join(index_pth, EMBEDDINGS_NM), matrix.astype(dtype))
+    index_meta = {
+        **(metadata or {}),
+        "dtype": dtype,
+        "quantisation": quantisation,
+        DIMENSIONALITY_KEY: matrix.shape[1],
+    }
+    if quantisation:
+        codes, index_meta["quantisation_params"] = quantise(
+            matrix, quantisation
+            )
+        np.save(os.path.join(index_pth, CODES_NM), codes)
+    with open(os.path.join(index_pth, INDEX_META_NM), "w") as f:
+        json.dump(index_meta, f, indent=2)
+    records = pd.DataFrame(metadatas)
+    records.insert(0, "document", documents)
+    records.insert(0, "id", ids)
+    # small row groups, so a result's record is read without its neighbours
+    records.to_parquet(
+        os.path.join(index_pth, RECORDS_NM),
+        index=False,
+        row_group_size=RECORD_GROUP_ROWS,
+        )
+
+
+class FlatIndex:
+    """
+    An exact cosine similarity search over a memory-mapped matrix.
+
+    Attributes
+    ----------
+    index_pth : str
+        Directory holding the index files.
+    name : str
+        The index directory name, the collection name it was built as.
+    embeddings : np.memmap
+        The unit-normalised embedding matrix, one row per record.
+    quantisation : Union[str, None]
+        "int8" or "binary" if the index is searched by quantised codes.
+    codes : Union[np.ndarray, None]
+        The quantised codes, held in memory.
+    rerank_factor : int
+        Candidates per result found with the codes & re-ranked at full
+        precision.
+    ids : list
+        Record ids, in row order.
+
+    Methods
+    -------
+    count() -> int
+        Number of records in the index.
+    metadata -> dict
+        Index metadata, as `chromadb.Collection.metadata`.
+    records(rows: List[int]) -> list
+        The documents & metadata of rows, read from their row groups.
+    search(query_embeddings, n_results: int) -> tuple
+        Row indices & distances of the nearest records to each query.
+    query(query_embeddings, n_results: int, include: list) -> dict
+        Search in the form returned by `chromadb.Collection.query()`.
+    """
+
+    def __init__(
+        self,
+        index_pth:Union[str, Path],
+        rerank_factor:int=QUANTISED_RERANK_FACTOR,
+        ):
+        import pyarrow.parquet as pq
+
+        self.index_pth = str(index_pth)
+        self.name = os.path.basename(os.path.normpath(self.index_pth))
+        self.embeddings = np.load(
+            os.path.join(self.index_pth, EMBEDDINGS_NM), mmap_mode="r"
+            )
+        self.index_meta = self._read_index_meta()
+        self.quantisation = self.index_meta.get("quantisation")
+        self.codes = None
+        self.rerank_factor = rerank_factor
+        if self.quantisation:
+            self.codes = np.load(os.path.join(self.index_pth, CODES_NM))
+        # metadata only, row groups are read as results need them
+        self._records = pq.ParquetFile(
+            os.path.join(self.index_pth, RECORDS_NM)
+            )
+        self._records_lock = threading.Lock()
+        self.ids = [
+            str(_id) for _id in
+            self._records.read(columns=["id"]).column("id").to_pylist()
+        ]
+        group_rows = [
+            self._records.metadata.row_group(i).num_rows
+            for i in range(self._records.num_row_groups)
+        ]
+        self._group_rows = np.array(group_rows)
+        self._group_starts = np.cumsum([0] + group_rows[:-1])
+
+    def _read_index_meta(self) -> dict:
+        pth = os.path.join(self.index_pth, INDEX_META_NM)
+        # indexes written before quantisation have no index.json
+        if not os.path.exists(pth):
+            return {}
+        with open(pth) as f:
+            return json.load(f)
+
+    def count(self) -> int:
+        """Number of records in the index."""
+        return len(self.ids)
+
+    @property
+    def metadata(self) -> dict:
+        """Index metadata, as `chromadb.Collection.metadata`."""
+        return {DIMENSIONALITY_KEY: self.embeddings.shape[1], **self.index_meta}
+
+    def records(self, rows:List[int]) -> list:
+        """
+        The documents & metadata of rows, read from their row groups.
+
+        Parameters
+        ----------
+        rows : List[int]
+            Row indices, eg from `search()`.
+
+        Returns
+        -------
+        list
+            A dictionary per row, in order, of its document & metadata
+            fields.
+        """
+        if not len(rows):
+            return []
+        groups = np.searchsorted(self._group_starts, rows, side="right") - 1
+        needed = np.unique(groups)
+        # where each needed group starts in the table read
+        read_starts = dict(zip(
+            needed.tolist(),
+            np.cumsum(self._group_rows[needed]) - self._group_rows[needed],
+            ))
+        take = [
+            read_starts[group] + row - self._group_starts[group]
+            for row, group in zip(rows, groups.tolist())
+        ]
+        columns = [nm for nm in self._records.schema_arrow.names if nm != "id"]
+        # a ParquetFile is not safe to read from concurrently
+        with self._records_lock:
+            table = self._records.read_row_groups(
+                needed.tolist(), columns=columns
+                )
+        return table.take(take).to_pylist()
+
+    def _exact_scores(self, queries:np.ndarray) -> np.ndarray:
+        # score in chunks, so float16 rows are upcast a chunk at a time
+        return np.concatenate([
+            np.asarray(
+                self.embeddings[start:start + SEARCH_CHUNK_ROWS],
+                dtype=np.float32,
+                ) @ queries.T
+            for start in range(0, self.count(), SEARCH_CHUNK_ROWS)
+        ]).T
+
+    def _quantised_scores(self, queries:np.ndarray) -> np.ndarray:
+        """Approximate scores, higher is nearer, from the codes."""
+        if self.quantisation == "binary":
+            query_codes = np.packbits(queries > 0, axis=1)
+            # fewer differing bits is nearer, so negate the Hamming distance
+            return -np.stack([
+                _bitwise_count(self.codes ^ code).sum(axis=1, dtype=np.int32)
+                for code in query_codes
+            ])
+        scale = self.index_meta["quantisation_params"]["scale"]
+        query_codes = np.round(queries * scale).astype(np.float32)
+        return np.concatenate([
+            np.asarray(
+                self.codes[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32
+                ) @ query_codes.T
+            for start in range(0, self.count(), SEARCH_CHUNK_ROWS)
+        ]).T
+
+    def _rerank(
+        self, queries:np.ndarray, candidates:np.ndarray, n_results:int
+        ) -> tuple:
+        """Re-score candidates at full precision, reading only their rows."""
+        indices, similarity = [], []
+        for query, rows in zip(queries, candidates):
+            rows = np.sort(rows) # sequential reads from the memory map
+            exact = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+            top, top_scores = _top_k(exact[None, :], n_results)
+            indices.append(rows[top[0]])
+            similarity.append(top_scores[0])
+        return np.stack(indices), np.stack(similarity)
+
+    def search(self, query_embeddings, n_results:int) -> tuple:
+        """
+        Row indices & distances of the nearest records to each query.
+
+        Parameters
+        ----------
+        query_embeddings : array-like
+            One or more query embeddings, normalised before scoring.
+        n_results : int
+            Nearest records to return per query.
+
+        Returns
+        -------
+        tuple
+            Arrays of row indices & distances, each of shape
+            (n_queries, n_results), nearest first. Distances are always
+            full precision, including for quantised indexes.
+        """
+        queries = normalise_rows(np.atleast_2d(query_embeddings))
+        n_results = min(n_results, self.count())
+        if self.quantisation:
+            n_candidates = min(self.count(), n_results * self.rerank_factor)
+            candidates, _ = _top_k(
+                self._quantised_scores(queries), n_candidates
+                )
+            indices, similarity = self._rerank(queries, candidates, n_results)
+        else:
+            indices, similarity = _top_k(
+                self._exact_scores(queries), n_results
+                )
+        # clip rounding error, an exact match is distance 0
+        return indices, np.clip(2 - 2 * similarity, 0, None)
+
+    def query(
+        self,
+        query_embeddings,
+        n_results:int=10,
+        include:list=["documents", "distances", "metadatas"],
+        ) -> dict:
+        """
+        Search in the form returned by `chromadb.Collection.query()`.
+
+        Parameters
+        ----------
+        query_embeddings : array-like
+            One or more query embeddings.
+        n_results : int, optional
+            Nearest records to return per query.
+        include : list, optional
+            Any of "documents", "distances" & "metadatas".
+
+        Returns
+        -------
+        dict
+            ids plus the included fields, each a list per query.
+        """
+        indices, distances = self.search(query_embeddings, n_results)
+        results = {"ids": [[self.ids[i] for i in row] for row in indices]}
+        if "documents" in include or "metadatas" in include:
+            records = self.records(indices.ravel().tolist())
+            rows = [
+                records[i * indices.shape[1]:(i + 1) * indices.shape[1]]
+                for i in range(indices.shape[0])
+            ]
+        if "documents" in include:
+            results["documents"] = [
+                [record.pop("document") for record in row] for row in rows
+            ]
+        if "distances" in include:
+            results["distances"] = distances.tolist()
+        if "metadatas" in include:
+            results["metadatas"] = [
+                [{k: v for k, v in record.items() if k != "document"}
+                 for record in row]
+                for row in rows
+            ]
+        return results
+
+
+@lru_cache(maxsize=None)
+def open_flat_index(index_pth:str) -> FlatIndex:
+    """Open a flat index once per process."""
+    return FlatIndex(index_pth)
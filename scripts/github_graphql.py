@@ -0,0 +1,374 @@
+"""Bulk ingestion of org repo metadata through the GitHub GraphQL API.
+
+The REST ingestion makes one request per repo for topics and another for
+the README. A GraphQL query returns both, with the repo metadata, for up
+to 100 repos at a time, so an org of a few thousand repos is paged through
+in tens of requests rather than thousands.
+
+Requests go through a transport, a callable taking a query & variables and
+returning the decoded response, so ingestion can run against the live API,
+a fake endpoint such as `benchmarks.stub_server`, or recorded responses:
+
+    transport = HTTPTransport(github_pat, user_agent)
+    repo_metadata = get_orgs_repos(["ministryofjustice"], transport)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Iterator, List, Union
+
+import requests
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+PAGE_SIZE = 100 # the GraphQL API's maximum
+MAX_TOPICS = 20
+# the REST /readme endpoint finds any README, GraphQL needs an exact path
+README_PTHS = ["README.md", "readme.md", "README.rst", "README", "Readme.md"]
+# the columns the REST ingestion produces & later steps read
+REPO_COLUMNS = [
+    "id",
+    "name",
+    "html_url",
+    "description",
+    "is_private",
+    "is_archived",
+    "programming_language",
+    "updated_at",
+    "org_nm",
+    "topics",
+    "readme",
+]
+MISSING_README = "None" # as the REST ingestion records a missing README
+
+_README_FIELDS = "\n".join(
+    f'readme{i}: object(expression: "HEAD:{pth}") {{ ... on Blob {{ text }} }}'
+    for i, pth in enumerate(README_PTHS)
+)
+REPOS_QUERY = f"""
+query OrgRepos(
+  $org: String!, $cursor: String, $pageSize: Int!, $privacy: RepositoryPrivacy
+) {{
+  organization(login: $org) {{
+    repositories(
+      first: $pageSize,
+      after: $cursor,
+      privacy: $privacy,
+      orderBy: {{field: NAME, direction: ASC}}
+    ) {{
+      totalCount
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{
+        databaseId
+        name
+        url
+        description
+        isPrivate
+        isArchived
+        updatedAt
+        primaryLanguage {{ name }}
+        repositoryTopics(first: {MAX_TOPICS}) {{ nodes {{ topic {{ name }} }} }}
+        {_README_FIELDS}
+      }}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+"""
+
+
+class GraphQLError(RuntimeError):
+    """The GraphQL API returned errors in place of, or with, its data."""
+
+
+class HTTPTransport:
+    """
+    Post GraphQL queries over HTTP, optionally recording the responses.
+
+    Attributes
+    ----------
+    url : str
+        The GraphQL endpoint, the GitHub API or a fake.
+    n_requests : int
+        Requests made, including retries, from any thread.
+    record_pth : Union[str, None]
+        A JSONL file each response is appended to, for `ReplayTransport`.
+
+    Methods
+    -------
+    __call__(query: str, variables: dict) -> dict
+        Run a query, retrying server errors with backoff & smaller pages.
+    """
+
+    def __init__(
+        self,
+        github_pat:str,
+        user_agent:str,
+        url:str=GITHUB_GRAPHQL_URL,
+        record_pth:Union[str, Path, None]=None,
+        max_retries:int=3,
+        timeout:float=60.0,
+        ):
+        self.url = url
+        self.record_pth = str(record_pth) if record_pth else None
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"bearer {github_pat}",
+            "User-Agent": user_agent,
+        })
+
+    def __call__(self, query:str, variables:dict) -> dict:
+        """
+        Run a query, retrying 502s, 503s & timeouts with backoff.
+
+        GitHub answers pages of large READMEs it cannot render in time with
+        a 502, so 502s & timeouts are retried with half the `pageSize`.
+        Paging follows the returned cursor, so a short page is continued
+        by the next request. Responses are recorded under the variables
+        asked for, so a replay pages through them the same way.
+        """
+        sent = dict(variables)
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                self.n_requests += 1
+            try:
+                resp = self._session.post(
+                    self.url,
+                    json={"query": query, "variables": sent},
+                    timeout=self.timeout,
+                    )
+            except requests.Timeout:
+                if attempt == self.max_retries:
+                    raise
+                resp = None
+            if resp is not None and resp.status_code not in (502, 503):
+                resp.raise_for_status()
+                body = resp.json()
+                if self.record_pth:
+                    with self._lock, open(self.record_pth, "a") as f:
+                        f.write(json.dumps(
+                            {"variables": variables, "response": body}
+                            ) + "\n")
+                return body
+            if attempt == self.max_retries:
+                resp.raise_for_status()
+            if (resp is None or resp.status_code == 502) and (
+                sent.get("pageSize", 1) > 1
+                ):
+                sent["pageSize"] //= 2
+                logging.warning(
+                    f"GraphQL page timed out, retrying {sent['pageSize']} "
+                    "repos"
+                    )
+            time.sleep(2 ** attempt)
+
+
+class ReplayTransport:
+    """
+    Serve responses recorded by `HTTPTransport`, for offline tests.
+
+    Attributes
+    ----------
+    n_requests : int
+        Requests served.
+
+    Methods
+    -------
+    __call__(query: str, variables: dict) -> dict
+        The recorded response to the same variables.
+    """
+
+    def __init__(self, record_pth:Union[str, Path]):
+        self.n_requests = 0
+        self._responses = {}
+        with open(record_pth) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._responses[self._key(record["variables"])] = (
+                        record["response"]
+                    )
+
+    @staticmethod
+    def _key(variables:dict) -> str:
+        return json.dumps(variables, sort_keys=True)
+
+    def __call__(self, query:str, variables:dict) -> dict:
+        """The recorded response to the same variables."""
+        self.n_requests += 1
+        try:
+            return self._responses[self._key(variables)]
+        except KeyError:
+            raise KeyError(f"No recorded response for {variables}")
+
+
+def _repo_record(node:dict, org_nm:str) -> dict:
+    """A GraphQL repository node as a row of the REST ingestion."""
+    readme = next(
+        (
+            node[f"readme{i}"]["text"] for i in range(len(README_PTHS))
+            if (node.get(f"readme{i}") or {}).get("text") is not None
+        ),
+        MISSING_README,
+    )
+    return {
+        "id": node["databaseId"],
+        "name": node["name"],
+        "html_url": node["url"],
+        "description": node["description"],
+        "is_private": node["isPrivate"],
+        "is_archived": node["isArchived"],
+        "programming_language": (node.get("primaryLanguage") or {}).get(
+            "name"
+            ),
+        "updated_at": node["updatedAt"],
+        "org_nm": org_nm,
+        "topics": [
+            topic["topic"]["name"]
+            for topic in node["repositoryTopics"]["nodes"]
+        ],
+        "readme": readme,
+    }
+
+
+def iter_org_repos(
+    org_nm:str,
+    transport:Callable[[str, dict], dict],
+    public_only:bool=True,
+    page_size:int=PAGE_SIZE,
+    ) -> Iterator[dict]:
+    """
+    Page through an org's repos, with topics & READMEs, as pages arrive.
+
+    Parameters
+    ----------
+    org_nm : str
+        The org login.
+    transport : Callable[[str, dict], dict]
+        Runs a query with variables & returns the decoded response.
+    public_only : bool, optional
+        Only public repos, as the REST ingestion requests.
+    page_size : int, optional
+        Repos per request, at most 100.
+
+    Yields
+    ------
+    dict
+        One dictionary per repo, with the keys of REPO_COLUMNS.
+
+    Raises
+    ------
+    GraphQLError
+        If a response reports errors.
+    """
+    cursor = None
+    n_repos = 0
+    while True:
+        body = transport(REPOS_QUERY, {
+            "org": org_nm,
+            "cursor": cursor,
+            "pageSize": page_size,
+            "privacy": "PUBLIC" if public_only else None,
+        })
+        if body.get("errors"):
+            raise GraphQLError(
+                f"GraphQL errors for {org_nm}: "
+                f"{[err.get('message') for err in body['errors']]}"
+                )
+        repos = body["data"]["organization"]["repositories"]
+        n_repos += len(repos["nodes"])
+        rate = body["data"].get("rateLimit") or {}
+        logging.info(
+            f"{org_nm}: {n_repos} of {repos['totalCount']} repos, "
+            f"rate limit remaining {rate.get('remaining')}"
+            )
+        for node in repos["nodes"]:
+            yield _repo_record(node, org_nm)
+        if not repos["pageInfo"]["hasNextPage"]:
+            return
+        cursor = repos["pageInfo"]["endCursor"]
+
+
+def get_org_repos(
+    org_nm:str,
+    transport:Callable[[str, dict], dict],
+    public_only:bool=True,
+    page_size:int=PAGE_SIZE,
+    ) -> list:
+    """
+    Page through an org's repos, with topics & READMEs.
+
+    Parameters
+    ----------
+    org_nm : str
+        The org login.
+    transport : Callable[[str, dict], dict]
+        Runs a query with variables & returns the decoded response.
+    public_only : bool, optional
+        Only public repos, as the REST ingestion requests.
+    page_size : int, optional
+        Repos per request, at most 100.
+
+    Returns
+    -------
+    list
+        One dictionary per repo, with the keys of REPO_COLUMNS.
+
+    Raises
+    ------
+    GraphQLError
+        If a response reports errors.
+    """
+    return list(iter_org_repos(org_nm, transport, public_only, page_size))
+
+
+def get_orgs_repos(
+    org_nms:List[str],
+    transport:Callable[[str, dict], dict],
+    public_only:bool=True,
+    page_size:int=PAGE_SIZE,
+    max_workers:int=4,
+    ):
+    """
+    Repo metadata, topics & READMEs for several orgs, paged concurrently.
+
+    Parameters
+    ----------
+    org_nms : List[str]
+        The org logins.
+    transport : Callable[[str, dict], dict]
+        Runs a query with variables & returns the decoded response.
+    public_only : bool, optional
+        Only public repos.
+    page_size : int, optional
+        Repos per request, at most 100.
+    max_workers : int, optional
+        Orgs paged through at once.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per repo with the REPO_COLUMNS, indexed by `html_url` as
+        the REST ingestion is.
+    """
+    import pandas as pd
+
+    with ThreadPoolExecutor(
+        max_workers=max(min(len(org_nms), max_workers), 1)
+        ) as executor:
+        orgs = list(executor.map(
+            lambda org_nm: get_org_repos(
+                org_nm, transport, public_only, page_size
+                ),
+            org_nms,
+            ))
+    records = [record for org in orgs for record in org]
+    repo_metadata = pd.DataFrame.from_records(records, columns=REPO_COLUMNS)
+    repo_metadata.set_index("html_url", inplace=True, drop=False)
+    return repo_metadata
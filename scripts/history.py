@@ -0,0 +1,177 @@
+"""Keep the orchestrator chat stream within a token budget."""
+from functools import lru_cache
+import logging
+
+import tiktoken
+
+from scripts.app_config import (
+    APP_LLM, HISTORY_KEEP_TURNS, HISTORY_TOKEN_BUDGET
+)
+
+TOKENS_PER_MESSAGE = 4 # approximate chat format overhead per message
+
+
+@lru_cache(maxsize=1)
+def _get_encoding(model:str) -> tiktoken.Encoding:
+    """Load the tokeniser once, on first use."""
+    return tiktoken.encoding_for_model(model)
+
+
+@lru_cache(maxsize=512)
+def _count_tokens(text:str, model:str) -> int:
+    """Count the tokens in a string, caching as messages are re-counted."""
+    return len(_get_encoding(model).encode(text))
+
+
+class HistoryManager:
+    """
+    Compact an orchestrator chat stream before it is sent to the model.
+
+    The system prompt & welcome message, plus the most recent turns, are
+    always kept. Database result dumps in older turns are swapped for the
+    compact references registered with `register_results()`. If the stream
+    still exceeds the budget, the oldest whole turns are dropped. A turn
+    starts at a user prompt and runs until the next one, so an assistant
+    tool call and its tool responses are always kept or dropped together.
+
+    Attributes
+    ----------
+    max_tokens : int
+        Token budget for the whole stream.
+    keep_turns : int
+        Number of most recent turns that are never compacted.
+    n_fixed : int
+        Number of leading messages (system prompt & welcome message) that
+        are never compacted.
+    model : str
+        Model name used to select the tiktoken encoding.
+    references : dict
+        Maps result dump content to its compact reference.
+    compacted : set
+        Compact references that have replaced a result dump in the stream.
+
+    Methods
+    -------
+    register_results(message: dict, reference: str) -> None
+        Record the compact reference for a result dump message.
+    count_tokens(messages: list) -> int
+        Approximate the prompt tokens used by a list of messages.
+    compact(stream: list) -> dict
+        Compact the stream in place and report the tokens saved.
+    """
+
+    def __init__(
+        self,
+        max_tokens:int=HISTORY_TOKEN_BUDGET,
+        keep_turns:int=HISTORY_KEEP_TURNS,
+        n_fixed:int=2,
+        model:str=APP_LLM,
+        ):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.n_fixed = n_fixed
+        self.model = model
+        self.references = {}
+        self.compacted = set()
+
+    def register_results(self, message:dict, reference:str) -> None:
+        """
+        Record the compact reference for a result dump message.
+
+        Parameters
+        ----------
+        message : dict
+            The user message containing the formatted database results.
+        reference : str
+            A short stand-in for the message, used once the message falls
+            outside the most recent turns.
+        """
+        self.references[message["content"]] = reference
+
+    def count_tokens(self, messages:list) -> int:
+        """
+        Approximate the prompt tokens used by a list of messages.
+
+        Parameters
+        ----------
+        messages : list
+            Chat messages in OpenAI format.
+
+        Returns
+        -------
+        int
+            Token count including a fixed per-message overhead.
+        """
+        return sum(
+            TOKENS_PER_MESSAGE
+            + _count_tokens(msg.get("content") or "", self.model)
+            for msg in messages
+            )
+
+    def compact(self, stream:list) -> dict:
+        """
+        Compact the stream in place.
+
+        Parameters
+        ----------
+        stream : list
+            The orchestrator chat stream. It is mutated rather than
+            replaced, as other components hold references to it.
+
+        Returns
+        -------
+        dict
+            Token counts before and after compaction, the tokens saved and
+            the number of turns dropped.
+        """
+        tokens_before = self.count_tokens(stream)
+        fixed = stream[:self.n_fixed]
+        turns = self._split_turns(stream[self.n_fixed:])
+        n_old = max(len(turns) - self.keep_turns, 0)
+        # swap result dumps in older turns for their compact references
+        for turn in turns[:n_old]:
+            for i, msg in enumerate(turn):
+                if (ref := self.references.get(msg.get("content"))):
+                    turn[i] = {**msg, "content": ref}
+                    self.compacted.add(ref)
+        # drop whole turns, oldest first, until within budget
+        n_dropped = 0
+        while (
+            n_dropped < n_old
+            and self.count_tokens(
+                fixed + [m for t in turns[n_dropped:] for m in t]
+                ) > self.max_tokens
+            ):
+            n_dropped += 1
+        compacted = fixed + [m for t in turns[n_dropped:] for m in t]
+        # forget references for results no longer in the stream
+        live_content = {msg.get("content") for msg in compacted}
+        self.references = {
+            k: v for k, v in self.references.items() if k in live_content
+            }
+        self.compacted &= live_content
+        stream[:] = compacted
+        tokens_after = self.count_tokens(stream)
+        report = {
+            "history_tokens": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "turns_dropped": n_dropped,
+        }
+        if report["tokens_saved"]:
+            logging.info(f"Compacted chat history: {report}")
+        return report
+
+    def _split_turns(self, messages:list) -> list:
+        """Group messages into turns, each starting with a user prompt."""
+        turns = []
+        for msg in messages:
+            content = msg.get("content")
+            starts_turn = (
+                msg.get("role") == "user"
+                and content not in self.references
+                and content not in self.compacted
+                )
+            if starts_turn or not turns:
+                turns.append([])
+            turns[-1].append(msg)
+        return turns
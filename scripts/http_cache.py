@@ -0,0 +1,223 @@
+"""A persistent conditional-request cache for GitHub REST fetches.
+
+Each ingest run fetches the topics & README of every repo, most of which
+are unchanged since the last run. The cache stores each GET response with
+its ETag & Last-Modified validators, then sends them on the next run as
+If-None-Match & If-Modified-Since. GitHub answers an unchanged resource
+with an empty 304, which does not count against the primary rate limit,
+and the cached body is returned in its place.
+
+The ingestion's GitHub client, from `ai_nexus_backend`, makes its requests
+internally, so the cache is installed as a transport adapter on every new
+`requests` session for the GitHub API, as `requests-cache` does, until the
+end of the `with` block:
+
+    with install_conditional_cache(GITHUB_HTTP_CACHE_PTH) as cache:
+        ...  # ingest
+    logging.info(cache.summary())
+
+Responses are cached per token, so a token never receives bodies fetched
+with another's access.
+"""
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Iterator, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+GITHUB_API_URL = "https://api.github.com/"
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """
+    A transport adapter revalidating cached GET responses.
+
+    Attributes
+    ----------
+    cache_pth : Path
+        Directory holding one body & one metadata file per cached URL.
+    hits : int
+        Conditional requests answered 304, served from the cache.
+    misses : int
+        Cacheable requests answered with a new body.
+    uncached : int
+        Requests that were not GETs, failed or carried no validators.
+    bytes_saved : int
+        Body bytes served from the cache rather than downloaded.
+
+    Methods
+    -------
+    send(request: requests.PreparedRequest, **kwargs) -> requests.Response
+        Send a request, conditionally where a cached response exists.
+    summary() -> str
+        Hit statistics, for the ingest log.
+    """
+
+    def __init__(self, cache_pth:Union[str, Path], **kwargs):
+        super().__init__(**kwargs)
+        self.cache_pth = Path(cache_pth)
+        self.cache_pth.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def _key(self, request:requests.PreparedRequest) -> str:
+        # the Accept header selects the representation, eg raw READMEs
+        accept = request.headers.get("Accept", "")
+        # tokens see different private repos, so never share a response
+        token = hashlib.sha256(
+            request.headers.get("Authorization", "").encode("utf-8")
+            ).hexdigest()
+        return hashlib.sha256(
+            f"{request.url}\n{accept}\n{token}".encode("utf-8")
+            ).hexdigest()
+
+    def _read(self, key:str) -> Union[tuple, None]:
+        try:
+            with open(self.cache_pth / f"{key}.json") as f:
+                meta = json.load(f)
+            with open(self.cache_pth / f"{key}.body", "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key:str, resp:requests.Response) -> None:
+        meta = {
+            "url": resp.url,
+            "status_code": resp.status_code,
+            "headers": dict(resp.headers),
+        }
+        # write the body first, so a metadata file always has its body
+        for suffix, data, mode in [
+            ("body", resp.content, "wb"),
+            ("json", json.dumps(meta), "w"),
+        ]:
+            pth = self.cache_pth / f"{key}.{suffix}"
+            tmp_pth = pth.with_name(f"{pth.name}.{threading.get_ident()}.tmp")
+            with open(tmp_pth, mode) as f:
+                f.write(data)
+            os.replace(tmp_pth, pth)
+
+    def _count(self, stat:str, n:int=1) -> None:
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + n)
+
+    def send(
+        self, request:requests.PreparedRequest, **kwargs
+        ) -> requests.Response:
+        """
+        Send a request, conditionally where a cached response exists.
+
+        A 304 is answered with the cached response, marked with
+        `from_cache = True`. Successful responses with an ETag or
+        Last-Modified header are cached.
+        """
+        if request.method != "GET":
+            self._count("uncached")
+            return super().send(request, **kwargs)
+        key = self._key(request)
+        cached = self._read(key)
+        if cached:
+            meta, _ = cached
+            headers = CaseInsensitiveDict(meta["headers"])
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and cached:
+            meta, body = cached
+            self._count("hits")
+            self._count("bytes_saved", len(body))
+            return self._cached_response(request, resp, meta, body)
+        if resp.status_code == 200 and (
+            "ETag" in resp.headers or "Last-Modified" in resp.headers
+            ):
+            self._count("misses")
+            self._write(key, resp)
+        else:
+            self._count("uncached")
+        return resp
+
+    @staticmethod
+    def _cached_response(
+        request:requests.PreparedRequest,
+        not_modified:requests.Response,
+        meta:dict,
+        body:bytes,
+        ) -> requests.Response:
+        """The cached response, with the 304's fresh headers."""
+        resp = requests.Response()
+        resp.status_code = meta["status_code"]
+        resp.reason = "OK"
+        resp.headers = CaseInsensitiveDict(meta["headers"])
+        # eg the current rate limit headers
+        resp.headers.update(not_modified.headers)
+        resp._content = body
+        resp.url = meta["url"]
+        resp.request = request
+        resp.connection = not_modified.connection
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.from_cache = True
+        return resp
+
+    def summary(self) -> str:
+        """Hit statistics, for the ingest log."""
+        revalidated = self.hits + self.misses
+        hit_rate = self.hits / revalidated if revalidated else 0.0
+        return (
+            f"HTTP cache: {self.hits} hits (304), {self.misses} misses, "
+            f"{self.uncached} uncached, hit rate {hit_rate:.0%}, "
+            f"{self.bytes_saved / 1024**2:.1f}MB not re-downloaded"
+        )
+
+
+@contextmanager
+def install_conditional_cache(
+    cache_pth:Union[str, Path],
+    url_prefix:str=GITHUB_API_URL,
+    ) -> Iterator[ConditionalCacheAdapter]:
+    """
+    Mount one shared cache adapter on every new `requests` session.
+
+    Covers module level calls such as `requests.get`, which create a
+    session per call. Only URLs under `url_prefix` are cached. Sessions
+    are created as before once the block exits. Installing the cache
+    again, eg in a nested block, replaces the adapter rather than
+    mounting both.
+
+    Parameters
+    ----------
+    cache_pth : Union[str, Path]
+        Directory to keep the cache in, created if needed.
+    url_prefix : str, optional
+        The API the cache applies to.
+
+    Yields
+    ------
+    ConditionalCacheAdapter
+        The installed adapter, holding the hit statistics.
+    """
+    adapter = ConditionalCacheAdapter(cache_pth)
+    installed_init = requests.sessions.Session.__init__
+    # wrap the unpatched __init__, never another cache's wrapper
+    session_init = getattr(installed_init, "_uncached_init", installed_init)
+
+    def init_with_cache(session, *args, **kwargs):
+        session_init(session, *args, **kwargs)
+        session.mount(url_prefix, adapter)
+
+    init_with_cache._uncached_init = session_init
+    requests.sessions.Session.__init__ = init_with_cache
+    try:
+        yield adapter
+    finally:
+        requests.sessions.Session.__init__ = installed_init
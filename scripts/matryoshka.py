@@ -0,0 +1,51 @@
+"""Matryoshka truncation of nomic-embed-text-v1.5 embeddings.
+
+nomic-embed-text-v1.5 is trained so that the leading 512, 256 or 128
+dimensions of an embedding are usable on their own, trading a little
+recall for a smaller, faster index. Stored vectors are truncated at build
+time with the same recipe the Nomic API applies to queries when passed a
+`dimensionality`: layer norm, truncate, then renormalise to unit length.
+
+Query & stored vectors must have the same dimensionality, so it is recorded
+in the collection's embedding spec, see `scripts.embedding_spec`.
+"""
+import numpy as np
+
+FULL_DIMENSIONALITY = 768
+MATRYOSHKA_DIMS = [768, 512, 256, 128]
+# key of the dimensionality in collection & flat index metadata
+DIMENSIONALITY_KEY = "embedding_dimensionality"
+
+
+def truncate_embeddings(embeddings, dimensionality:int) -> np.ndarray:
+    """
+    Truncate full embeddings to `dimensionality`, as the Nomic API does.
+
+    Parameters
+    ----------
+    embeddings : array-like
+        Full 768 dimension embeddings, one per row.
+    dimensionality : int
+        One of MATRYOSHKA_DIMS.
+
+    Returns
+    -------
+    np.ndarray
+        Unit-normalised float32 embeddings of shape (n, dimensionality).
+        Full dimensionality embeddings are returned unchanged.
+    """
+    if dimensionality not in MATRYOSHKA_DIMS:
+        raise ValueError(
+            f"dimensionality must be one of {MATRYOSHKA_DIMS}, "
+            f"got {dimensionality}"
+            )
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dimensionality == embeddings.shape[1]:
+        return embeddings
+    # layer norm without learned scale or bias, over the full embedding
+    mean = embeddings.mean(axis=1, keepdims=True)
+    std = embeddings.std(axis=1, keepdims=True)
+    normed = (embeddings - mean) / np.sqrt(std**2 + 1e-5)
+    truncated = normed[:, :dimensionality]
+    return truncated / np.linalg.norm(truncated, axis=1, keepdims=True)
+
@@ -1,9 +1,8 @@
 """Contains the logic for checking the moderation of user prompts."""
-from openai import Client
-from shiny import reactive
+from openai import AsyncClient
 
 
-async def check_moderation(prompt:str, openai_client:Client) -> str:
+async def check_moderation(prompt:str, openai_client:AsyncClient) -> str:
     """Check if the prompt is flagged by OpenAI's moderation tool.
 
     Awaits the response from the OpenAI moderation tool before
@@ -13,15 +12,15 @@ async def check_moderation(prompt:str, openai_client:Client) -> str:
     ----------
     prompt : str
         The user's prompt to check.
-    reactive_client : reactive.Value
-        The reactive value containing an openai.AsyncOpenAI instance.
+    openai_client : AsyncClient
+        An openai.AsyncOpenAI instance.
 
     Returns
     -------
     str
         The category violations if flagged, else None.
     """
-    response = openai_client.moderations.create(input=prompt)
+    response = await openai_client.moderations.create(input=prompt)
     content = response.results[0].to_dict()
     if content["flagged"]:
         infringements = []
@@ -1,7 +1,29 @@
 from pyprojroot import here
 
 COLLECTION_NM = "moj-github"
-EMBEDDINGS_MODEL = "nomic-embed-text"
+EMBEDDINGS_MODEL = "nomic-embed-text" # ollama tag
+# recorded with the collection & checked against app_config.EMBEDDINGS_MODEL
+EMBEDDINGS_MODEL_VERSION = "v1.5"
+DOCUMENT_PREFIX = "search_document: "
+# Matryoshka dimensionality of stored embeddings, see scripts.matryoshka
+EMBEDDINGS_DIMENSIONALITY = 768
 REPO_LLM = "gpt-4o-mini" # for ai summaries of repos
 VECTOR_STORE_PTH = here("data/nomic-embeddings")
 TEMP = 1.0
+# quantised flat indexes re-rank this many candidates per result
+QUANTISED_RERANK_FACTOR = 20
+# ETag & Last-Modified cache of GitHub REST responses, reused between ingests
+GITHUB_HTTP_CACHE_PTH = here("data/http-cache")
+# token budgets READMEs are normalised to, see scripts.readme_normalise
+SUMMARY_README_TOKENS = 2_000
+EMBED_README_TOKENS = 1_000
+# orgs ingested at once, each on its own thread
+INGEST_ORG_WORKERS = 4
+# streaming refresh, see scripts.streaming_refresh. Queues hold at most
+# this many repos between stages, bounding memory whatever the org size
+REFRESH_QUEUE_SIZE = 64
+README_FETCH_WORKERS = 8
+SUMMARY_WORKERS = 4
+# documents per ollama embed call, sent early after EMBED_BATCH_WAIT seconds
+EMBED_BATCH_SIZE = 32
+EMBED_BATCH_WAIT = 2.0
@@ -0,0 +1,236 @@
+"""Per repo steps of a data refresh, shared by the batch & streaming builds.
+
+`01_ingest_data.py` & `02_create_vector_store.py` run each step over every
+repo before starting the next, `scripts.streaming_refresh` runs them
+concurrently, a repo at a time. Both format summaries, documents & metadata
+here, so either route builds the same collection.
+"""
+import datetime as dt
+import os
+import shutil
+from typing import List, Union
+
+from scripts.embedding_spec import NOMIC_TASK_PREFIXES, build_embedding_spec
+from scripts.facet_index import FACET_INDEX_DIR
+from scripts.flat_index import FLAT_INDEX_DIR
+from scripts.pipeline_config import (
+    DOCUMENT_PREFIX, EMBEDDINGS_MODEL, EMBEDDINGS_MODEL_VERSION, REPO_LLM
+)
+from scripts.prompts import REPO_SUMMARY_PROMPT, REPO_SUMMARY_SYS_PROMPT
+from scripts.sharded_collection import collection_nms
+from scripts.string_utils import sanitise_string
+
+def org_names(secrets:dict) -> List[str]:
+    """
+    The orgs to ingest, from the .env file.
+
+    Parameters
+    ----------
+    secrets : dict
+        The .env values, listing orgs as a comma separated ORG_NMS, or as
+        ORG_NM1, ORG_NM2 & so on.
+
+    Returns
+    -------
+    List[str]
+        Org logins, in the order given.
+    """
+    if secrets.get("ORG_NMS"):
+        return [
+            org_nm.strip() for org_nm in secrets["ORG_NMS"].split(",")
+            if org_nm.strip()
+        ]
+    numbered = sorted(
+        (int(key[len("ORG_NM"):]), value) for key, value in secrets.items()
+        if key.startswith("ORG_NM") and key[len("ORG_NM"):].isdigit()
+        and value
+    )
+    if not numbered:
+        raise KeyError("No orgs configured, set ORG_NMS in .env")
+    return [value for _, value in numbered]
+
+
+def summary_system_prompt() -> dict:
+    """The system message for REPO_LLM repo summaries."""
+    return {
+        "role": "system",
+        "content": REPO_SUMMARY_SYS_PROMPT.replace("\n", " ").replace("  ", "")
+    }
+
+
+def summarise_repo(openai_client, row, normaliser=None) -> str:
+    """
+    Summarise one repo with REPO_LLM.
+
+    Parameters
+    ----------
+    openai_client : openai.OpenAI
+        A client, safe to share between threads.
+    row : Mapping
+        A repo's metadata, topics & README, eg a DataFrame row.
+    normaliser : Union[ReadmeNormaliser, None], optional
+        Condenses the README first, see `scripts.readme_normalise`.
+
+    Returns
+    -------
+    str
+        The summary.
+    """
+    repo_deets = f"""
+    Name: {row['name']},\n
+    url: {row['html_url']},\n
+    Description: {row['description']},\n
+    Is Private: {row['is_private']},\n
+    Is Archived: {row['is_archived']},\n
+    Programming Language: {row['programming_language']},\n
+    Topics: {row['topics']},\n
+    README: {_readme(row, normaliser)}
+
+    """
+    repo_content = {
+        "role": "user",
+        "content": sanitise_string(
+            REPO_SUMMARY_PROMPT.format(repo_deets=repo_deets)
+            )
+    }
+    model_resp = openai_client.chat.completions.create(
+        model=REPO_LLM,
+        messages=[summary_system_prompt(), repo_content],
+        temperature=0.0,
+    )
+    return model_resp.choices[0].message.content
+
+
+def _readme(row, normaliser=None) -> str:
+    return normaliser(row["readme"]) if normaliser else row["readme"]
+
+
+def format_document(row, normaliser=None) -> str:
+    """A repo as embedded, with DOCUMENT_PREFIX, its README normalised."""
+    document = sanitise_string(
+        f"""
+        {DOCUMENT_PREFIX}
+        Name: {row['name']},\n
+        url: {row['html_url']},\n
+        Description: {row['description']},\n
+        README: {_readme(row, normaliser)},\n
+        AI Summary: {row['ai_summary']}
+
+        """
+    )
+    return document.replace("\n", " ").replace("  ", "").strip()
+
+
+def format_metadata(row) -> dict:
+    """A repo's collection metadata, of str, int, float or bool, never None."""
+    return {
+        "is_private": bool(row["is_private"]),
+        "is_archived": bool(row["is_archived"]),
+        "programming_language": str(row["programming_language"]),
+        "updated_at": dt.datetime.strptime(
+            row["updated_at"], "%Y-%m-%dT%H:%M:%SZ"
+            ).timestamp(),
+        "org_nm": row["org_nm"],
+    }
+
+
+def document_embedding_spec(dimensionality:int) -> dict:
+    """The embedding spec of documents embedded by this pipeline."""
+    return build_embedding_spec(
+        model=f"{EMBEDDINGS_MODEL}-{EMBEDDINGS_MODEL_VERSION}",
+        dimensionality=dimensionality,
+        document_prefix=DOCUMENT_PREFIX,
+        query_task_type=next(
+            task for task, prefix in NOMIC_TASK_PREFIXES.items()
+            if prefix == DOCUMENT_PREFIX
+            ),
+        )
+
+
+def collection_name(vintage:str, built_at:dt.datetime) -> str:
+    """A name unique to each build, so builds never overwrite each other."""
+    return f"moj-github-{vintage}-{built_at.strftime('%Y%m%d%H%M%S')}"
+
+
+def verify_collection(collection, ids:list, embeddings, spec:dict) -> None:
+    """
+    Check a new collection is complete & searchable before going live.
+
+    Parameters
+    ----------
+    collection : chromadb.Collection or FlatIndex
+        The new collection.
+    ids : list
+        Every id written to it.
+    embeddings : np.ndarray
+        At least the embedding of `ids[0]`.
+    spec : dict
+        The embedding spec it must record.
+
+    Raises
+    ------
+    RuntimeError
+        If records or spec are missing, or the self-query fails.
+    """
+    if collection.count() != len(ids):
+        raise RuntimeError(
+            f"Collection holds {collection.count()} of {len(ids)} records"
+            )
+    recorded = collection.metadata or {}
+    if (missing := {k: v for k, v in spec.items() if recorded.get(k) != v}):
+        raise RuntimeError(f"Collection metadata lacks {missing}")
+    # a stored document is its own nearest neighbour
+    nearest = collection.query(
+        query_embeddings=[embeddings[0].tolist()], n_results=1
+        )["ids"][0]
+    if nearest != [ids[0]]:
+        raise RuntimeError(
+            f"Query for {ids[0]} returned {nearest}, collection is unusable"
+            )
+
+
+def retained_collections(manifest:dict, replaced:Union[dict, None]) -> set:
+    """
+    Collections to keep on switching from the `replaced` manifest.
+
+    Sessions hold the collections they opened until their next search, so
+    everything the replaced manifest served, its `previous` included, is
+    kept until the following build prunes it.
+
+    Parameters
+    ----------
+    manifest : dict
+        The new manifest.
+    replaced : Union[dict, None]
+        The manifest it replaces, if any.
+
+    Returns
+    -------
+    set
+        Names of the collections & flat index directories to keep.
+    """
+    keep = set()
+    for served in [manifest, replaced]:
+        if not served:
+            continue
+        keep |= collection_nms(served)
+        if served.get("previous"):
+            keep |= collection_nms(served["previous"])
+    return keep
+
+
+def prune_collections(chroma_client, vector_store_pth:str, keep:set) -> None:
+    """Remove collections, flat & facet indexes not named in `keep`."""
+    for old in chroma_client.list_collections():
+        if old.name not in keep:
+            chroma_client.delete_collection(old.name)
+    flat_pth = os.path.join(vector_store_pth, FLAT_INDEX_DIR)
+    if os.path.isdir(flat_pth):
+        for old in os.listdir(flat_pth):
+            if old not in keep:
+                shutil.rmtree(os.path.join(flat_pth, old))
+    facet_pth = os.path.join(vector_store_pth, FACET_INDEX_DIR)
+    if os.path.isdir(facet_pth):
+        for old in os.listdir(facet_pth):
+            if os.path.splitext(old)[0] not in keep:
+                os.remove(os.path.join(facet_pth, old))
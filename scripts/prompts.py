@@ -1,3 +1,4 @@
+from functools import lru_cache
 import inspect
 
 from scripts.custom_tools import toolbox_manual_members
@@ -50,15 +51,19 @@ Repo details: ```{repo_deets}```
 
 # orchestrator agent ------------------------------------------------------
 
-ORCHESTRATOR_SYS_PROMPT = f"""
-{COMMON_PROMPT} If the user appears to ask about GitHub repositories, use
-the ShouldExtractKeywords tool to begin the entity extraction. This process
-will query the vector store and provide you with the user's results for
-summary. {TOOLS_MISUSE_DEFENCE}
+SEARCH_DIRECTIVE = """If the user appears to ask about GitHub repositories,
+use the ShouldExtractKeywords tool to begin the entity extraction. This
+process will query the vector store and provide you with the user's results
+for summary."""
 
-If the User asks what you can do, how you can help or what tools you have,
+ORCHESTRATOR_TOOLS_GUIDANCE = """If the User asks what you can do, how you can help or what tools you have,
 then use the ShouldExplainTools tool.
 
+If the User asks how many repos there are, or how repos break down by
+organisation, programming language, archived status, topic or when they
+were last updated, use the CountRepos tool rather than searching. It counts
+every repo exactly.
+
 The vector store results are being cached in a dataframe. If the user asks
 to export or download the results, then use the ExportDataToTSV tool.
 It is your role to decide which tool to use to assist the User's query.
@@ -81,7 +86,12 @@ Email if the User has not clarified why they are Emailing. Use the
 ShouldDraftEmail tool to start the drafting logic. If the user indicates
 their intended Email is clearly irrelevant to the application, politely
 decline.
-""".replace("\n", " ").replace("  ", "")
+"""
+
+ORCHESTRATOR_SYS_PROMPT = f"""
+{COMMON_PROMPT} {SEARCH_DIRECTIVE} {TOOLS_MISUSE_DEFENCE}
+
+{ORCHESTRATOR_TOOLS_GUIDANCE}""".replace("\n", " ").replace("  ", "")
 
 # entity extraction agent -------------------------------------------------
 
@@ -115,6 +125,25 @@ User: I'm interested in repos that relate to artificial intelligence.
 Extracted keywords: ["artificial intelligence"]
 """.replace("\n", " ").replace("  ", "")
 
+# single call orchestrator -------------------------------------------------
+# Used when app_config.SINGLE_CALL_EXTRACTION is True. The orchestrator
+# extracts keywords itself rather than handing off to the extraction agent.
+
+SINGLE_CALL_SEARCH_DIRECTIVE = f"""If the user appears to ask about GitHub
+repositories, use the ExtractKeywordEntities tool to pass keywords from the
+User's prompt. This will query the vector store and provide you with the
+user's results for summary. Ignore the following stopwords:
+{", ".join(STOP_WORDS)}. Extract all clear keywords apart from the
+stopwords, ensuring that you extract every topic of interest when the User
+asks about several. For example, "Are there any repos about probation,
+sentencing or prisons" should be extracted as ["probation", "sentencing",
+"prisons"]."""
+
+SINGLE_CALL_ORCHESTRATOR_SYS_PROMPT = f"""
+{COMMON_PROMPT} {SINGLE_CALL_SEARCH_DIRECTIVE} {TOOLS_MISUSE_DEFENCE}
+
+{ORCHESTRATOR_TOOLS_GUIDANCE}""".replace("\n", " ").replace("  ", "")
+
 # response evaluation -----------------------------------------------------
 
 RESP_EVALUATION_PROMPT = """
@@ -131,41 +160,50 @@ Summarise how well the results have answered the User's query according to
 your instructions.
 """
 
-RESPONSE_TEMPLATE = """
-Organisation: {org_nm}\n
-Repo Name: {repo_nm}\n
-Repo Description: {repo_desc}\n
-Repo URL: <a href="{url}">{repo_nm}</a>\n
-Is Private: {is_private}\n
-Is Archived: {is_archived}\n
-Updated At: {updated_at}\n
-Programming Language: {programming_language}\n
-Distance: {distance}\n
-AI Summary: {model_summary}
-"""
+COMPACT_RESULTS_TEMPLATE = """[Earlier database results for the prompt
+'{user_prompt}' were removed to save space. Search terms: {search_terms}.
+Repos returned: {repo_nms}.]""".replace("\n", " ")
 
-# tool explanation agent --------------------------------------------------
+LLM_RESULT_TEMPLATE = """[{rank}] id: {repo_id}; name: {org_nm}/{repo_nm};
+distance: {distance:.3f}; summary: {short_summary}""".replace("\n", " ")
 
-toolbox_manual = ", ".join(
-    [inspect.getsource(tool) for tool in toolbox_manual_members]
-    )
+# tool explanation agent --------------------------------------------------
 
-TOOL_EXPLAINER_SYS_PROMPT = f"""
+TOOL_EXPLAINER_SYS_TEMPLATE = f"""
 {COMMON_PROMPT}
 Your specific job is to provide an overview of the functionality available
 to the agents in this application. The details of the tools available
 follow in triple backtick delimeters:
-```{toolbox_manual}```
+```{{toolbox_manual}}```
 
 Pay attention to the formatting and style options that the user may request
 in providing your summary.
-""".replace("\n", " ").replace("  ", "")
+"""
 
+
+@lru_cache(maxsize=1)
+def get_toolbox_manual() -> str:
+    """Read the tool source code for the tool explainer, once."""
+    return ", ".join(
+        [inspect.getsource(tool) for tool in toolbox_manual_members]
+        )
+
+
+@lru_cache(maxsize=1)
+def get_tool_explainer_sys_prompt() -> str:
+    """Build the tool explainer system prompt on first use."""
+    return TOOL_EXPLAINER_SYS_TEMPLATE.format(
+        toolbox_manual=get_toolbox_manual()
+        ).replace("\n", " ").replace("  ", "")
+
+# style guidance goes last, so the rest of the prompt is a stable prefix
 TOOL_EXPLAINER_PROMPT = """
 Explain the tools and resources available to the assistant in this
-application. Adhere to the following guidance: {style_guide}
+application.
 
 {TOOLS_MISUSE_DEFENCE}
+
+Adhere to the following guidance: {style_guide}
 """.replace("\n", " ").replace("  ", "")
 
 
@@ -199,3 +237,20 @@ WELCOME_MSG = """Hi! Ask me about our MoJ GitHub repos. Or ask me what I
 can do for you."""
 EXPORT_FILENM = "export.tsv"
 EXPORT_MSG = f"Please check your downloads for {EXPORT_FILENM}"
+COUNTS_UNAVAILABLE_MSG = """Sorry, repo counts are unavailable right
+now.""".replace("\n", " ")
+
+# degraded mode, see scripts.circuit_breaker ------------------------------
+
+MODERATION_UNAVAILABLE_MSG = """I can't check messages right now, so I
+can't answer yours. Please try again in a minute.""".replace("\n", " ")
+ASSISTANT_UNAVAILABLE_MSG = """Sorry, I'm unable to respond right now.
+Please try again in a minute.""".replace("\n", " ")
+SEARCH_UNAVAILABLE_MSG = """Sorry, searching the repos is unavailable
+right now. Please try again in a minute.""".replace("\n", " ")
+RAW_RESULTS_MSG = """I can't summarise the search results right now. Here
+they are, nearest first.""".replace("\n", " ")
+NO_RAW_RESULTS_MSG = """I can't summarise the search results right now,
+and no repos were close enough to show.""".replace("\n", " ")
+STREAM_INTERRUPTED_MSG = """(Sorry, my response was cut short. Please try
+again in a minute.)""".replace("\n", " ")
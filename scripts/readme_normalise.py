@@ -0,0 +1,249 @@
+"""Condense READMEs before they are summarised & embedded.
+
+READMEs go into both the summary prompt & the embedded document, and many
+are mostly badges, HTML, images, licence boilerplate & long code blocks,
+which cost summary tokens & blur the document's embedding. A
+ReadmeNormaliser strips those, condenses code blocks to their first lines,
+then truncates to a token budget, keeping the headings as an outline & as
+much of the leading prose as fits. It counts tokens before & after, for the
+ingest log:
+
+    normaliser = ReadmeNormaliser(SUMMARY_README_TOKENS)
+    readme = normaliser(row["readme"])
+    ...
+    print(f"Summary prompts: {normaliser.summary()}")
+
+Snapshots keep the raw README, so budgets can be changed & rebuilt.
+"""
+from functools import lru_cache
+import html
+import re
+import threading
+from typing import Union
+
+from scripts.pipeline_config import REPO_LLM
+
+# code blocks longer than this keep only their first CODE_BLOCK_KEEP lines
+CODE_BLOCK_LINES = 8
+CODE_BLOCK_KEEP = 3
+# share of the budget headings may take, the rest is leading prose
+HEADING_SHARE = 0.25
+
+_COMMENT_PAT = re.compile(r"<!--.*?-->", re.DOTALL)
+_FENCE_PAT = re.compile(
+    r"^(?P<fence>```|~~~)[^\n]*\n(?P<code>.*?)^(?P=fence)[ \t]*$",
+    re.DOTALL | re.MULTILINE,
+)
+# badges are images, usually linked, inline or by reference
+_LINKED_IMAGE_PAT = re.compile(
+    r"\[!\[[^\]]*\](?:\([^)]*\)|\[[^\]]*\])\](?:\([^)]*\)|\[[^\]]*\])"
+)
+_IMAGE_PAT = re.compile(r"!\[[^\]]*\](?:\([^)]*\)|\[[^\]]*\])")
+_HTML_IMAGE_PAT = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+_HTML_TAG_PAT = re.compile(r"</?[a-zA-Z][^>]*>")
+_LINK_PAT = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_LINK_DEF_PAT = re.compile(r"^\s*\[[^\]]+\]:\s*\S+.*$", re.MULTILINE)
+_TABLE_RULE_PAT = re.compile(r"^[\s|:-]*-{3,}[\s|:-]*$")
+_HEADING_PAT = re.compile(r"^(#{1,6})\s+(.*?)[\s#:]*$")
+_FENCE_LINE_PAT = re.compile(r"^\s*(```|~~~)")
+# headings of licence sections only, not titles that mention a licence
+_LICENCE_HEADING_PAT = re.compile(
+    r"^(licen[cs]e|copyright)s?(\s+(and|&)\s+(licen[cs]e|copyright)s?)?$",
+    re.IGNORECASE,
+)
+# copyright notices, eg "Copyright (c) 2024 Crown", not prose
+_COPYRIGHT_LINE_PAT = re.compile(
+    r"^\s*(©|\(c\)\s|copyright\s*(©|\(c\)|\d{4}))", re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model:str):
+    """Load the tokeniser once, on first use."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
+def _condense_code(match:re.Match) -> str:
+    lines = match.group("code").rstrip("\n").splitlines()
+    if len(lines) <= CODE_BLOCK_LINES:
+        return match.group(0)
+    kept = "\n".join(lines[:CODE_BLOCK_KEEP])
+    return f"```\n{kept}\n... ({len(lines) - CODE_BLOCK_KEEP} lines)\n```"
+
+
+def _drop_licence_sections(lines:list) -> list:
+    """
+    Drop licence sections, to the next heading as high, & copyright lines.
+
+    Only sections headed by a licence heading alone are dropped, never the
+    title, and lines in code blocks are kept as they are.
+    """
+    kept = []
+    dropping_level = None
+    in_code = False
+    for line in lines:
+        if _FENCE_LINE_PAT.match(line):
+            in_code = not in_code
+        elif not in_code and (heading := _HEADING_PAT.match(line)):
+            level = len(heading.group(1))
+            if dropping_level is not None and level <= dropping_level:
+                dropping_level = None
+            if dropping_level is None and level > 1 and (
+                _LICENCE_HEADING_PAT.match(heading.group(2))
+                ):
+                dropping_level = level
+        if dropping_level is None and (
+            in_code or not _COPYRIGHT_LINE_PAT.match(line)
+            ):
+            kept.append(line)
+    return kept
+
+
+def clean_readme(readme:str) -> str:
+    """
+    Strip badges, images, HTML & licence boilerplate from a README.
+
+    Parameters
+    ----------
+    readme : str
+        Markdown, as fetched.
+
+    Returns
+    -------
+    str
+        The README's headings, prose, lists & condensed code blocks.
+    """
+    text = _COMMENT_PAT.sub("", readme)
+    text = _FENCE_PAT.sub(_condense_code, text)
+    text = _LINKED_IMAGE_PAT.sub("", text)
+    text = _IMAGE_PAT.sub("", text)
+    text = _HTML_IMAGE_PAT.sub("", text)
+    text = _HTML_TAG_PAT.sub("", text)
+    text = _LINK_PAT.sub(r"\1", text)
+    text = _LINK_DEF_PAT.sub("", text)
+    text = html.unescape(text)
+    lines = [
+        line.rstrip() for line in text.splitlines()
+        if not _TABLE_RULE_PAT.match(line)
+    ]
+    text = "\n".join(_drop_licence_sections(lines))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def truncate_readme(readme:str, max_tokens:int, encoding) -> str:
+    """
+    Truncate a README to `max_tokens`, keeping headings & leading prose.
+
+    Headings are kept as an outline, up to HEADING_SHARE of the budget. The
+    rest of the budget goes to lines in order from the top, the last one
+    cut mid-line if need be.
+
+    Parameters
+    ----------
+    readme : str
+        A cleaned README.
+    max_tokens : int
+        The budget.
+    encoding : tiktoken.Encoding
+        Counts tokens.
+
+    Returns
+    -------
+    str
+        The README, unchanged if within the budget.
+    """
+    lines = readme.splitlines()
+    tokens = [encoding.encode(line + "\n") for line in lines]
+    if sum(len(line_tokens) for line_tokens in tokens) <= max_tokens:
+        return readme
+    is_heading = [bool(_HEADING_PAT.match(line)) for line in lines]
+    heading_budget = int(max_tokens * HEADING_SHARE)
+    headings = set()
+    for i, line_tokens in enumerate(tokens):
+        if is_heading[i] and len(line_tokens) <= heading_budget:
+            headings.add(i)
+            heading_budget -= len(line_tokens)
+    prose_budget = max_tokens - sum(len(tokens[i]) for i in headings)
+    kept = []
+    for i, line in enumerate(lines):
+        if i in headings:
+            kept.append(line)
+        elif prose_budget > 0 and not is_heading[i]:
+            if len(tokens[i]) > prose_budget:
+                line = encoding.decode(tokens[i][:prose_budget]).rstrip()
+            kept.append(line)
+            prose_budget -= len(tokens[i])
+    return "\n".join(kept)
+
+
+class ReadmeNormaliser:
+    """
+    Clean & truncate READMEs to a token budget, counting tokens saved.
+
+    Safe to share between threads.
+
+    Attributes
+    ----------
+    max_tokens : int
+        Token budget per README.
+    n_readmes : int
+        READMEs normalised.
+    n_truncated : int
+        READMEs over budget once cleaned.
+    tokens_before : int
+        Tokens in the raw READMEs.
+    tokens_after : int
+        Tokens in the normalised READMEs.
+
+    Methods
+    -------
+    __call__(readme: str) -> str
+        Normalise a README.
+    summary() -> str
+        Tokens before & after, for the ingest log.
+    """
+
+    def __init__(self, max_tokens:int, model:str=REPO_LLM, encoding=None):
+        self.max_tokens = max_tokens
+        self.n_readmes = 0
+        self.n_truncated = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._model = model
+        self._encoding = encoding
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        """The tokeniser, loaded on first use."""
+        if self._encoding is None:
+            self._encoding = _get_encoding(self._model)
+        return self._encoding
+
+    def __call__(self, readme:Union[str, None]) -> Union[str, None]:
+        """Normalise a README, passing missing READMEs through."""
+        if not isinstance(readme, str) or not readme.strip():
+            return readme
+        cleaned = clean_readme(readme)
+        normalised = truncate_readme(cleaned, self.max_tokens, self.encoding)
+        n_before = len(self.encoding.encode(readme))
+        n_after = len(self.encoding.encode(normalised))
+        with self._lock:
+            self.n_readmes += 1
+            self.n_truncated += normalised != cleaned
+            self.tokens_before += n_before
+            self.tokens_after += n_after
+        return normalised
+
+    def summary(self) -> str:
+        """Tokens before & after, for the ingest log."""
+        cut = 1 - self.tokens_after / self.tokens_before if (
+            self.tokens_before
+            ) else 0.0
+        return (
+            f"{self.n_readmes} READMEs normalised to {self.max_tokens} "
+            f"tokens, {self.tokens_before:,} tokens before, "
+            f"{self.tokens_after:,} after ({cut:.0%} cut), "
+            f"{self.n_truncated} truncated"
+        )
@@ -0,0 +1,443 @@
+"""Serve vector store retrieval as a small HTTP/JSON service.
+
+The service opens the vector store and logs in to Nomic once, then runs the
+embed -> query -> filter steps of `ChromaDBPipeline` for each request. When
+the manifest switches to a new collection, eg after a rebuild alongside the
+live one, the service moves to it without a restart. It
+backs the app in multi-worker mode (see `scripts.serve`), over a Unix domain
+socket, and can also be run standalone on a TCP port for other tools.
+
+Endpoints:
+    GET  /health       The live collection name, search, batch & breaker
+                       counts.
+    POST /query        One keyword set, see `RetrievalQuery`.
+    POST /query/batch  Many keyword sets, embedded & queried in one pass.
+
+Usage:
+    python -m scripts.retrieval_service --port 8200
+    python -m scripts.retrieval_service --socket-pth /tmp/github-chat.sock
+"""
+import argparse
+import asyncio
+from functools import lru_cache
+import logging
+import os
+import socket
+import threading
+import time
+from typing import List, Union
+
+import httpx
+from pydantic import BaseModel, ValidationError
+
+from scripts.app_config import (
+    DEFAULT_RETRIEVAL_SOCKET_PTH,
+    DEPENDENCY_TIMEOUTS,
+    RETRIEVAL_SOCKET_PTH,
+    RETRIEVAL_URL,
+)
+from scripts.circuit_breaker import DependencyUnavailable, breaker_stats
+from scripts.embedding_batcher import get_embedding_batcher
+from scripts.pipeline_config import VECTOR_STORE_PTH
+from scripts.single_flight import SingleFlight, normalise_keywords
+from scripts.vector_store_manifest import read_manifest
+
+RESULT_KEYS = ["ids", "documents", "distances", "metadatas"]
+
+
+class RetrievalQuery(BaseModel):
+    """
+    A keyword search against the live collection.
+
+    Attributes
+    ----------
+    keywords : List[str]
+        Keywords to embed, each is queried separately.
+    n_results : int
+        Results to return after merging the keyword queries.
+    distance_threshold : float
+        Results further than this are removed.
+    """
+
+    keywords: List[str]
+    n_results: int = 5
+    distance_threshold: float = 2.0
+
+
+class RetrievalBatch(BaseModel):
+    """Several keyword searches, answered in a single pass."""
+
+    queries: List[RetrievalQuery]
+
+
+class RetrievalService:
+    """
+    Answer keyword searches against the live collection.
+
+    Attributes
+    ----------
+    vector_store_pth : str
+        Path to the vector store directory.
+    pipeline : ChromaDBPipeline
+        Holds the live collection, loaded once at start up.
+    flights : SingleFlight
+        Shares one embed & query between identical concurrent searches.
+
+    Methods
+    -------
+    load() -> None
+        Open the vector store & log in to Nomic.
+    follow_manifest() -> None
+        Move to the manifest's live collection if it has switched.
+    search(queries: List[RetrievalQuery]) -> list
+        Embed, query & filter several searches in one pass.
+    app() -> Starlette
+        The ASGI app serving the endpoints.
+    """
+
+    def __init__(self, vector_store_pth:str=VECTOR_STORE_PTH):
+        self.vector_store_pth = str(vector_store_pth)
+        self.pipeline = None
+        self.flights = SingleFlight()
+        self._rejected_nm = None
+        self._switch_lock = threading.Lock()
+
+    def load(self) -> None:
+        """Open the vector store & log in to Nomic ahead of queries."""
+        from scripts.chroma_utils import ChromaDBPipeline
+        self.pipeline = ChromaDBPipeline(
+            vector_store_pth=self.vector_store_pth
+            )
+        self.pipeline.get_latest_chroma_collection()
+        self.pipeline._login_nomic()
+        logging.info(
+            f"Retrieval service loaded {self.pipeline.collection_nm}"
+            )
+
+    def follow_manifest(self) -> None:
+        """
+        Move to the manifest's live collection if it has switched.
+
+        The new collection is opened & checked before it replaces the
+        current one. A live collection rejected by the embedding spec
+        check is logged once and not retried, in favour of the manifest's
+        previous collection or, failing that, the current one.
+        """
+        from scripts.chroma_utils import ChromaDBPipeline
+
+        manifest = read_manifest(self.vector_store_pth)
+        if not manifest:
+            return
+        live_nm = manifest["collection_nm"]
+        if live_nm in (self.pipeline.collection_nm, self._rejected_nm):
+            return
+        with self._switch_lock:
+            if live_nm == self.pipeline.collection_nm:
+                return
+            pipeline = ChromaDBPipeline(vector_store_pth=self.vector_store_pth)
+            try:
+                pipeline.get_latest_chroma_collection()
+            except ValueError:
+                self._rejected_nm = live_nm
+                logging.exception(
+                    f"Not switching to {live_nm}, still serving "
+                    f"{self.pipeline.collection_nm}"
+                    )
+                return
+            if pipeline.collection_nm != live_nm:
+                # fell back to the previous collection
+                self._rejected_nm = live_nm
+            if pipeline.collection_nm == self.pipeline.collection_nm:
+                return
+            logging.info(
+                f"Switched from {self.pipeline.collection_nm} to {live_nm}"
+                )
+            self.pipeline = pipeline
+
+    def search(self, queries:List[RetrievalQuery]) -> list:
+        """
+        Embed, query & filter several searches in one pass.
+
+        All keywords are embedded in a single Nomic batch, shared with
+        concurrent requests, and queried in a single collection query, then
+        split back into their searches to be filtered as
+        `ChromaDBPipeline.filter_results` does in process.
+        Concurrent requests for the same searches, by normalised keywords,
+        parameters & collection, share one pass & each get a copy.
+
+        Parameters
+        ----------
+        queries : List[RetrievalQuery]
+            The searches to run.
+
+        Returns
+        -------
+        list
+            One dictionary per search, holding the collection name, the
+            number of results removed and the filtered results sorted by
+            distance.
+        """
+        self.follow_manifest()
+        pipeline = self.pipeline # fixed for this search if a switch follows
+        key = (pipeline.collection_nm, tuple(
+            (
+                normalise_keywords(query.keywords),
+                query.n_results,
+                query.distance_threshold,
+            )
+            for query in queries
+        ))
+        return self.flights.do(key, lambda: self._search(pipeline, queries))
+
+    def _search(self, pipeline, queries:List[RetrievalQuery]) -> list:
+        """Embed, query & filter searches against a pipeline's collection."""
+        from scripts.chroma_utils import ChromaDBPipeline
+
+        keywords = [kwd for query in queries for kwd in query.keywords]
+        if keywords:
+            # batched with the keywords of concurrent requests
+            embeddings = get_embedding_batcher().embed(keywords)
+            raw = pipeline.collection.query(
+                query_embeddings=embeddings,
+                n_results=max(query.n_results for query in queries),
+                include=["documents", "distances", "metadatas"],
+            )
+        responses = []
+        start = 0
+        for query in queries:
+            stop = start + len(query.keywords)
+            # a pipeline per search, as filtering works on instance state
+            query_pipeline = ChromaDBPipeline(
+                vector_store_pth=self.vector_store_pth
+                )
+            query_pipeline.results = {
+                key: [row[:query.n_results] for row in raw[key][start:stop]]
+                for key in RESULT_KEYS
+            } if query.keywords else {key: [] for key in RESULT_KEYS}
+            filtered = query_pipeline.filter_results(
+                dist_thresh=query.distance_threshold,
+                n_results=query.n_results,
+            )
+            responses.append({
+                "collection_nm": pipeline.collection_nm,
+                "total_removed": query_pipeline.total_removed,
+                "results": [{"id": k, **v} for k, v in filtered.items()],
+            })
+            start = stop
+        return responses
+
+    async def _health(self, request):
+        from starlette.responses import JSONResponse
+        return JSONResponse({
+            "status": "ok",
+            "collection_nm": self.pipeline.collection_nm,
+            "searches": self.flights.stats(),
+            "embedding_batches": get_embedding_batcher().stats(),
+            "breakers": breaker_stats(),
+            })
+
+    async def _respond(self, request, model):
+        from starlette.responses import JSONResponse
+        try:
+            body = model.model_validate_json(await request.body())
+        except ValidationError as e:
+            return JSONResponse({"error": str(e)}, status_code=422)
+        queries = [body] if isinstance(body, RetrievalQuery) else body.queries
+        try:
+            # chromadb & nomic block, so keep them off the event loop
+            responses = await asyncio.to_thread(self.search, queries)
+        except DependencyUnavailable as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+        except Exception as e:
+            logging.exception("Retrieval request failed")
+            return JSONResponse(
+                {"error": f"{type(e).__name__}: {e}"}, status_code=500
+                )
+        if isinstance(body, RetrievalQuery):
+            return JSONResponse(responses[0])
+        return JSONResponse({"responses": responses})
+
+    async def _query(self, request):
+        return await self._respond(request, RetrievalQuery)
+
+    async def _query_batch(self, request):
+        return await self._respond(request, RetrievalBatch)
+
+    def app(self):
+        """The ASGI app serving the endpoints."""
+        from starlette.applications import Starlette
+        from starlette.routing import Route
+        return Starlette(routes=[
+            Route("/health", self._health, methods=["GET"]),
+            Route("/query", self._query, methods=["POST"]),
+            Route("/query/batch", self._query_batch, methods=["POST"]),
+        ])
+
+
+class RetrievalClient:
+    """
+    A thin, thread-safe client for `RetrievalService`.
+
+    Attributes
+    ----------
+    url : Union[str, None]
+        Base URL of a service listening on TCP.
+    socket_pth : Union[str, None]
+        Path of a service's Unix domain socket, used in place of `url`.
+
+    Methods
+    -------
+    health() -> dict
+        The service status & live collection name.
+    query(keywords: list, n_results: int, distance_threshold: float) -> dict
+        Run one keyword search.
+    query_batch(queries: list) -> list
+        Run several keyword searches in one request.
+    """
+
+    def __init__(
+        self,
+        url:Union[str, None]=None,
+        socket_pth:Union[str, None]=None,
+        timeout:float=30.0,
+        ):
+        self.url = url
+        self.socket_pth = str(socket_pth) if socket_pth else None
+        transport = (
+            httpx.HTTPTransport(uds=self.socket_pth)
+            if self.socket_pth else None
+        )
+        self._http = httpx.Client(
+            base_url=url or "http://retrieval",
+            transport=transport,
+            timeout=timeout,
+        )
+
+    def _request(self, method:str, path:str, **kwargs) -> dict:
+        resp = self._http.request(method, path, **kwargs)
+        if resp.is_error:
+            # an httpx error, so counted by the retrieval breaker
+            raise httpx.HTTPStatusError(
+                f"Retrieval service error {resp.status_code}: "
+                f"{resp.json().get('error')}",
+                request=resp.request,
+                response=resp,
+                )
+        return resp.json()
+
+    def health(self) -> dict:
+        """The service status & live collection name."""
+        return self._request("GET", "/health")
+
+    def query(
+        self,
+        keywords:list,
+        n_results:int=5,
+        distance_threshold:float=2.0,
+        ) -> dict:
+        """
+        Run one keyword search.
+
+        Parameters
+        ----------
+        keywords : list
+            Keywords to search for, embedded by the service.
+        n_results : int, optional
+            Results to return after merging the keyword queries.
+        distance_threshold : float, optional
+            Results further than this are removed.
+
+        Returns
+        -------
+        dict
+            The collection name, number of results removed & the results
+            sorted by distance, each with id, document, distance and
+            metadata.
+        """
+        return self._request("POST", "/query", json={
+            "keywords": keywords,
+            "n_results": n_results,
+            "distance_threshold": distance_threshold,
+        })
+
+    def query_batch(self, queries:list) -> list:
+        """
+        Run several keyword searches in one request.
+
+        Parameters
+        ----------
+        queries : list
+            Dictionaries with the arguments of `query()`.
+
+        Returns
+        -------
+        list
+            One response per search, in the form returned by `query()`.
+        """
+        return self._request(
+            "POST", "/query/batch", json={"queries": queries}
+            )["responses"]
+
+
+@lru_cache(maxsize=1)
+def get_retrieval_client() -> RetrievalClient:
+    """The app's shared client, configured from the environment."""
+    return RetrievalClient(
+        url=RETRIEVAL_URL,
+        socket_pth=RETRIEVAL_SOCKET_PTH,
+        timeout=DEPENDENCY_TIMEOUTS["retrieval"],
+        )
+
+
+def wait_for_socket(
+    socket_pth:str, timeout:float=120.0, interval:float=0.2
+    ) -> None:
+    """Block until a service accepts connections on `socket_pth`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(str(socket_pth))
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"No retrieval service on {socket_pth} after {timeout}s"
+                    )
+            time.sleep(interval)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--socket-pth",
+        default=None,
+        help=f"Listen on a Unix socket, eg {DEFAULT_RETRIEVAL_SOCKET_PTH}",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--vector-store-pth", default=str(VECTOR_STORE_PTH))
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    service = RetrievalService(vector_store_pth=args.vector_store_pth)
+    service.load()
+    if args.socket_pth:
+        if os.path.exists(args.socket_pth):
+            os.remove(args.socket_pth)
+        uvicorn.run(service.app(), uds=args.socket_pth, log_level="warning")
+    else:
+        uvicorn.run(
+            service.app(),
+            host=args.host,
+            port=args.port,
+            log_level="warning",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Serve the app from several worker processes on one host.
+
+Starts one retrieval service holding the vector store, N app workers that
+query it over a local socket, and a proxy on the public port. The default
+tool explanation is prewarmed once, by the launcher, rather than by every
+worker. Shiny keeps
+each session's state in the worker that created it, including the export
+download, so the proxy is sticky, routing each client address to the same
+worker for as long as the workers are up.
+
+Usage:
+    python -m scripts.serve --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import signal
+import subprocess
+import sys
+
+from pyprojroot import here
+
+from scripts.app_config import (
+    DEFAULT_RETRIEVAL_SOCKET_PTH,
+    PREWARM_TOOL_EXPLANATION,
+    RETRIEVAL_SOCKET_ENV,
+    TOOL_EXPLANATION_PREWARMED_ENV,
+)
+from scripts.retrieval_service import wait_for_socket
+from scripts.startup import prewarm_tool_explanation
+
+
+class StickyProxy:
+    """
+    A TCP proxy routing each client address to the same app worker.
+
+    Works below HTTP, so Shiny's websockets & downloads pass through
+    unchanged. Clients behind a shared address, eg a corporate proxy, will
+    all land on one worker.
+
+    Attributes
+    ----------
+    worker_ports : list
+        Local ports of the app workers.
+
+    Methods
+    -------
+    pick_worker(client_host: str) -> int
+        The worker port for a client address.
+    serve(host: str, port: int) -> None
+        Accept connections until cancelled.
+    """
+
+    def __init__(self, worker_ports:list):
+        self.worker_ports = worker_ports
+
+    def pick_worker(self, client_host:str) -> int:
+        """The worker port for a client address, stable across calls."""
+        digest = hashlib.sha1(client_host.encode("utf-8")).digest()
+        return self.worker_ports[
+            int.from_bytes(digest[:4], "big") % len(self.worker_ports)
+        ]
+
+    @staticmethod
+    async def _pipe(reader, writer) -> None:
+        try:
+            while (data := await reader.read(65536)):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _on_connect(self, client_reader, client_writer) -> None:
+        client_host = client_writer.get_extra_info("peername")[0]
+        try:
+            worker_reader, worker_writer = await asyncio.open_connection(
+                "127.0.0.1", self.pick_worker(client_host)
+                )
+        except OSError as e:
+            logging.warning(f"Worker unavailable for {client_host}: {e}")
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, worker_writer),
+            self._pipe(worker_reader, client_writer),
+        )
+
+    async def serve(self, host:str, port:int) -> None:
+        """Accept connections on `host:port` until cancelled."""
+        server = await asyncio.start_server(self._on_connect, host, port)
+        logging.info(
+            f"Proxying {host}:{port} to workers on {self.worker_ports}"
+            )
+        async with server:
+            await server.serve_forever()
+
+
+def start_workers(
+    n_workers:int, first_port:int, socket_pth:str
+    ) -> list:
+    """Start the app workers, each pointed at the retrieval service."""
+    env = {
+        **os.environ,
+        RETRIEVAL_SOCKET_ENV: str(socket_pth),
+        TOOL_EXPLANATION_PREWARMED_ENV: "1",
+    }
+    return [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app:app",
+                "--host", "127.0.0.1",
+                "--port", str(first_port + i),
+                "--log-level", "warning",
+            ],
+            cwd=here(),
+            env=env,
+        )
+        for i in range(n_workers)
+    ]
+
+
+def _prewarm_once() -> None:
+    """Prewarm the tool explanation for every worker, logging failures."""
+    try:
+        prewarm_tool_explanation()
+    except Exception as e:
+        logging.warning(
+            f"Prewarm of tool explanation failed, generated on first use: {e}"
+            )
+
+
+def _interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--first-worker-port",
+        type=int,
+        default=8100,
+        help="Workers listen on consecutive local ports from here",
+    )
+    parser.add_argument(
+        "--socket-pth", default=DEFAULT_RETRIEVAL_SOCKET_PTH
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    procs = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "scripts.retrieval_service",
+                "--socket-pth", str(args.socket_pth),
+            ],
+            cwd=here(),
+        )
+    ]
+    try:
+        # while the retrieval service loads the vector store
+        if PREWARM_TOOL_EXPLANATION:
+            _prewarm_once()
+        wait_for_socket(args.socket_pth)
+        procs += start_workers(
+            args.workers, args.first_worker_port, args.socket_pth
+            )
+        proxy = StickyProxy([
+            args.first_worker_port + i for i in range(args.workers)
+        ])
+        # stop cleanly, terminating the workers, on SIGTERM as on Ctrl-C
+        signal.signal(signal.SIGTERM, _interrupt)
+        asyncio.run(proxy.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
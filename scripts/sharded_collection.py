@@ -0,0 +1,144 @@
+"""Per-org shards of the vector store, queried as a single collection.
+
+`02_create_vector_store.py --shard-by-org` writes one collection per org,
+listed in the manifest's `shards`, so a large org can be re-embedded
+without rebuilding the others. A ShardedCollection queries every shard in
+parallel & merges their results by distance, in the form returned by
+`chromadb.Collection.query()`, so `ChromaDBPipeline` and the retrieval
+service search shards as they do a single collection. Shards may be chroma
+collections or flat indexes, both report squared L2 distances. Shards are
+queried on one thread pool per process, shared by every ShardedCollection,
+as collections are reopened whenever the manifest switches.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict
+
+from scripts.app_config import SHARD_QUERY_WORKERS
+
+# key of the shard list in the manifest, each entry as a manifest of its own
+SHARDS_KEY = "shards"
+RESULT_FIELDS = ["documents", "distances", "metadatas"]
+
+
+def shard_name(collection_nm:str, i:int) -> str:
+    """Name of a build's i-th shard, short enough for chromadb."""
+    return f"{collection_nm}-{i}"
+
+
+def collection_nms(manifest:dict) -> set:
+    """Names of the collections & flat index directories a manifest uses."""
+    return {manifest["collection_nm"]} | {
+        shard["collection_nm"] for shard in manifest.get(SHARDS_KEY, [])
+    }
+
+
+@lru_cache(maxsize=1)
+def _shard_executor() -> ThreadPoolExecutor:
+    """The process's shard query threads, started on first use."""
+    return ThreadPoolExecutor(
+        max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard"
+        )
+
+
+def merge_results(shard_results:list, n_results:int, include:list) -> dict:
+    """
+    Merge per shard query results into the nearest `n_results` per query.
+
+    Parameters
+    ----------
+    shard_results : list
+        Each shard's query results, including distances.
+    n_results : int
+        Nearest records to keep per query.
+    include : list
+        The fields to return alongside ids.
+
+    Returns
+    -------
+    dict
+        ids plus the included fields, each a list per query.
+    """
+    keys = ["ids"] + [field for field in RESULT_FIELDS if field in include]
+    merged = {key: [] for key in keys}
+    n_queries = len(shard_results[0]["ids"]) if shard_results else 0
+    for q in range(n_queries):
+        hits = [
+            (results["distances"][q][j], results, j)
+            for results in shard_results
+            for j in range(len(results["ids"][q]))
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        for key in keys:
+            merged[key].append(
+                [results[key][q][j] for _, results, j in hits[:n_results]]
+                )
+    return merged
+
+
+class ShardedCollection:
+    """
+    Per-org collections, searched as one.
+
+    Attributes
+    ----------
+    shards : Dict[str, object]
+        Each org's collection, a chromadb collection or FlatIndex.
+    metadata : dict
+        The embedding spec, shared by every shard.
+
+    Methods
+    -------
+    count() -> int
+        Records over all shards.
+    query(query_embeddings, n_results: int, include: list) -> dict
+        Query every shard in parallel & merge the results.
+    """
+
+    def __init__(self, shards:Dict[str, object]):
+        if not shards:
+            raise ValueError("A sharded collection needs at least one shard")
+        self.shards = shards
+        self.metadata = next(iter(shards.values())).metadata
+
+    def count(self) -> int:
+        """Records over all shards."""
+        return sum(shard.count() for shard in self.shards.values())
+
+    def query(
+        self,
+        query_embeddings,
+        n_results:int=10,
+        include:list=["documents", "distances", "metadatas"],
+        ) -> dict:
+        """
+        Query every shard in parallel & merge the results by distance.
+
+        Parameters
+        ----------
+        query_embeddings : array-like
+            One or more query embeddings.
+        n_results : int, optional
+            Nearest records to return per query, over all shards.
+        include : list, optional
+            Any of "documents", "distances" & "metadatas".
+
+        Returns
+        -------
+        dict
+            ids plus the included fields, each a list per query.
+        """
+        # distances are always needed, to merge
+        shard_include = list(set(include) | {"distances"})
+        futures = [
+            _shard_executor().submit(
+                shard.query,
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, shard.count()),
+                include=shard_include,
+                )
+            for shard in self.shards.values() if shard.count()
+        ]
+        return merge_results(
+            [future.result() for future in futures], n_results, include
+            )
@@ -0,0 +1,100 @@
+"""Coalesce identical concurrent calls into one, as Go's singleflight.
+
+When many sessions ask the same question at once, each would embed the
+same keywords & query the same collection. A SingleFlight runs the first
+call for a key & has concurrent calls with the same key wait for its
+result, so a burst of identical searches costs one embedding & one query:
+
+    flights = SingleFlight()
+    results = flights.do(
+        ("collection", normalise_keywords(keywords), n_results),
+        lambda: search(keywords, n_results),
+        )
+
+Every caller gets its own deep copy of the result, as callers filter their
+results in place. Calls are only shared while in flight, results are not
+cached.
+"""
+from concurrent.futures import Future
+import copy
+import re
+import threading
+from typing import Callable, Hashable, Iterable
+
+
+def normalise_keywords(keywords:Iterable[str]) -> tuple:
+    """Keywords as a key, ignoring case, spacing, order & repeats."""
+    return tuple(sorted({
+        re.sub(r"\s+", " ", str(kwd)).strip().lower() for kwd in keywords
+    }))
+
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers with the same key.
+
+    Attributes
+    ----------
+    calls : int
+        Calls made through `do`.
+    coalesced : int
+        Calls that waited for another's result rather than running.
+
+    Methods
+    -------
+    do(key: Hashable, fn: Callable) -> object
+        Run `fn`, or wait for the in-flight call with the same key.
+    stats() -> dict
+        Call & coalesced counts, for health checks.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key:Hashable, fn:Callable):
+        """
+        Run `fn`, or wait for the in-flight call with the same key.
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies calls that would return the same result.
+        fn : Callable
+            Takes no arguments, run by the first caller for the key.
+
+        Returns
+        -------
+        object
+            A deep copy of the result, one per caller.
+
+        Raises
+        ------
+        BaseException
+            Whatever `fn` raised, in every caller sharing the call.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._flights[key]
+        # the shared result is never handed out, so never mutated
+        return copy.deepcopy(future.result())
+
+    def stats(self) -> dict:
+        """Call & coalesced counts, for health checks."""
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,331 @@
+"""Read & write repo metadata snapshots, the output of `01_ingest_data.py`.
+
+A snapshot is a directory, `data/repo-metadata-<vintage>/`, holding:
+
+* `meta.parquet`, the small columns, eg id, name, url & flags.
+* `text.parquet`, the id & the large text columns, `readme` & `ai_summary`.
+* `facets.npz`, precomputed repo counts, see `scripts.facet_index`.
+
+Both files are zstd compressed, sorted by repo id and written in small row
+groups, so a read of selected columns touches only those column chunks and
+a read of selected ids skips row groups by their id statistics. Snapshots
+written before this layout, a single `repo-metadata-<vintage>.parquet`
+file, are still read, without the split.
+
+`SnapshotWriter` writes a snapshot a batch of repos at a time, for the
+streaming refresh. Its rows are in arrival order rather than sorted, so id
+lookups skip fewer row groups, but memory is bounded by a row group.
+
+Usage, to convert a single file snapshot:
+    python -m scripts.snapshot data/repo-metadata-<vintage>.parquet
+"""
+import argparse
+import glob
+import os
+from pathlib import Path
+import re
+import shutil
+from typing import Iterable, List, Union
+
+from pyprojroot import here
+
+DATA_PTH = here("data")
+SNAPSHOT_GLOB = "repo-metadata-*"
+META_NM = "meta.parquet"
+TEXT_NM = "text.parquet"
+ID_COL = "id"
+TEXT_COLS = ["readme", "ai_summary"]
+COMPRESSION = "zstd"
+# rows per row group, the unit an id lookup reads. Text groups are smaller
+# as each row carries a README.
+ROW_GROUP_SIZE = {"meta.parquet": 4_096, "text.parquet": 128}
+VINTAGE_PAT = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}.\d{6}")
+# columns embedded & stored by 02_create_vector_store.py
+VECTOR_STORE_COLS = [
+    "id",
+    "name",
+    "html_url",
+    "description",
+    "is_private",
+    "is_archived",
+    "programming_language",
+    "updated_at",
+    "org_nm",
+    "readme",
+    "ai_summary",
+]
+
+
+def snapshot_vintage(snapshot_pth:Union[str, Path]) -> str:
+    """The vintage in a snapshot's name, eg 2024-11-01T12_00_00.000000."""
+    return VINTAGE_PAT.search(os.path.basename(str(snapshot_pth)))[0]
+
+
+def latest_snapshot_pth(data_pth:Union[str, Path]=DATA_PTH) -> str:
+    """Path of the latest snapshot, directory or single file."""
+    snapshots = [
+        pth for pth in glob.glob(os.path.join(str(data_pth), SNAPSHOT_GLOB))
+        if (os.path.isdir(pth) or pth.endswith(".parquet"))
+        and VINTAGE_PAT.search(os.path.basename(pth))
+    ]
+    if not snapshots:
+        raise FileNotFoundError(f"No repo metadata snapshots in {data_pth}")
+    return max(snapshots, key=snapshot_vintage)
+
+
+def write_snapshot(repo_metadata, snapshot_pth:Union[str, Path]) -> None:
+    """
+    Write repo metadata as a snapshot directory.
+
+    The snapshot is written to a temporary directory & moved into place,
+    so readers never see a partial snapshot.
+
+    Parameters
+    ----------
+    repo_metadata : pd.DataFrame
+        One row per repo, with an `id` column.
+    snapshot_pth : Union[str, Path]
+        The snapshot directory, named with its vintage.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    snapshot_pth = str(snapshot_pth)
+    df = repo_metadata.reset_index(drop=True).sort_values(
+        ID_COL, kind="stable"
+        )
+    text_cols = [col for col in TEXT_COLS if col in df.columns]
+    files = {
+        META_NM: [col for col in df.columns if col not in text_cols],
+        TEXT_NM: [ID_COL] + text_cols,
+    }
+    tmp_pth = f"{snapshot_pth}.tmp"
+    shutil.rmtree(tmp_pth, ignore_errors=True)
+    os.makedirs(tmp_pth)
+    for nm, cols in files.items():
+        pq.write_table(
+            pa.Table.from_pandas(df[cols], preserve_index=False),
+            os.path.join(tmp_pth, nm),
+            compression=COMPRESSION,
+            row_group_size=ROW_GROUP_SIZE[nm],
+        )
+    _write_facets(tmp_pth)
+    os.replace(tmp_pth, snapshot_pth)
+
+
+class SnapshotWriter:
+    """
+    Write a snapshot incrementally, a row group at a time.
+
+    Rows are buffered until a row group of either file is full, so only a
+    row group of READMEs is held at once. The snapshot is moved into place
+    on `close`, so readers never see a partial snapshot.
+
+    Attributes
+    ----------
+    snapshot_pth : str
+        The snapshot directory, named with its vintage.
+    n_rows : int
+        Rows written so far.
+
+    Methods
+    -------
+    write(records: List[dict]) -> None
+        Append repos, one dictionary per repo.
+    close() -> None
+        Flush buffered rows & move the snapshot into place.
+    abort() -> None
+        Discard the partial snapshot.
+    """
+
+    def __init__(self, snapshot_pth:Union[str, Path], schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.snapshot_pth = str(snapshot_pth)
+        self.n_rows = 0
+        self._tmp_pth = f"{self.snapshot_pth}.tmp"
+        shutil.rmtree(self._tmp_pth, ignore_errors=True)
+        os.makedirs(self._tmp_pth)
+        text_cols = [col for col in TEXT_COLS if col in schema.names]
+        self._schemas = {
+            nm: pa.schema([schema.field(col) for col in cols])
+            for nm, cols in [
+                (META_NM, [col for col in schema.names if col not in text_cols]),
+                (TEXT_NM, [ID_COL] + text_cols),
+            ]
+        }
+        self._writers = {
+            nm: pq.ParquetWriter(
+                os.path.join(self._tmp_pth, nm), file_schema,
+                compression=COMPRESSION,
+                )
+            for nm, file_schema in self._schemas.items()
+        }
+        self._buffers = {nm: [] for nm in self._schemas}
+
+    def _flush(self, nm:str) -> None:
+        import pyarrow as pa
+
+        if self._buffers[nm]:
+            self._writers[nm].write_table(
+                pa.Table.from_pylist(self._buffers[nm], schema=self._schemas[nm]),
+                row_group_size=ROW_GROUP_SIZE[nm],
+                )
+            self._buffers[nm] = []
+
+    def write(self, records:List[dict]) -> None:
+        """Append repos, one dictionary per repo with the schema's keys."""
+        for nm, file_schema in self._schemas.items():
+            self._buffers[nm] += [
+                {col: record.get(col) for col in file_schema.names}
+                for record in records
+            ]
+            if len(self._buffers[nm]) >= ROW_GROUP_SIZE[nm]:
+                self._flush(nm)
+        self.n_rows += len(records)
+
+    def close(self) -> None:
+        """Flush buffered rows & move the snapshot into place."""
+        for nm, writer in self._writers.items():
+            self._flush(nm)
+            writer.close()
+        _write_facets(self._tmp_pth)
+        os.replace(self._tmp_pth, self.snapshot_pth)
+
+    def abort(self) -> None:
+        """Discard the partial snapshot."""
+        for writer in self._writers.values():
+            writer.close()
+        shutil.rmtree(self._tmp_pth, ignore_errors=True)
+
+
+def _write_facets(snapshot_pth:str) -> None:
+    """Precompute a snapshot's facet index, built on load if this fails."""
+    from scripts.facet_index import write_facet_index
+
+    try:
+        write_facet_index(snapshot_pth)
+    except Exception as e:
+        # the snapshot is worth keeping without its index
+        print(f"Facet index not written, it will be built on load: {e!r}")
+
+
+def snapshot_columns(snapshot_pth:Union[str, Path, None]=None) -> List[str]:
+    """Column names of a snapshot, read from the file footers only."""
+    import pyarrow.parquet as pq
+
+    snapshot_pth = str(snapshot_pth or latest_snapshot_pth())
+    if not os.path.isdir(snapshot_pth):
+        return pq.read_schema(snapshot_pth).names
+    cols = []
+    for nm in [META_NM, TEXT_NM]:
+        cols += [
+            col for col in pq.read_schema(os.path.join(snapshot_pth, nm)).names
+            if col not in cols
+        ]
+    return cols
+
+
+def _read_parquet(file_pth:str, columns:List[str], ids:Union[set, None]):
+    """Read columns of the rows with `ids` as a pyarrow Table."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(file_pth)
+    if ids is None:
+        return pf.read(columns=columns)
+    id_idx = pf.schema_arrow.get_field_index(ID_COL)
+    row_groups = []
+    for i in range(pf.metadata.num_row_groups):
+        stats = pf.metadata.row_group(i).column(id_idx).statistics
+        # groups are sorted by id, so most fall outside the ids sought
+        if stats is None or not stats.has_min_max or any(
+            stats.min <= _id <= stats.max for _id in ids
+            ):
+            row_groups.append(i)
+    table = pf.read_row_groups(row_groups, columns=columns)
+    mask = pc.is_in(
+        table[ID_COL], value_set=pa.array(sorted(ids), type=table[ID_COL].type)
+        )
+    return table.filter(mask)
+
+
+def read_snapshot(
+    snapshot_pth:Union[str, Path, None]=None,
+    columns:Union[List[str], None]=None,
+    ids:Union[Iterable, None]=None,
+    ):
+    """
+    Read selected columns & repos of a snapshot.
+
+    Only the files holding the requested columns are opened, so reads that
+    don't need READMEs or summaries never load them.
+
+    Parameters
+    ----------
+    snapshot_pth : Union[str, Path, None], optional
+        A snapshot directory or single file. Defaults to the latest.
+    columns : Union[List[str], None], optional
+        Columns to read, `id` is always included. Defaults to all.
+    ids : Union[Iterable, None], optional
+        Repo ids to read. Defaults to all.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per repo, sorted by id for snapshot directories written
+        by `write_snapshot`, in arrival order for those of SnapshotWriter.
+    """
+    import pyarrow.parquet as pq
+
+    snapshot_pth = str(snapshot_pth or latest_snapshot_pth())
+    ids = set(ids) if ids is not None else None
+    if columns is not None:
+        columns = [ID_COL] + [col for col in columns if col != ID_COL]
+    if not os.path.isdir(snapshot_pth):
+        # single file snapshots, written before the split layout
+        return _read_parquet(snapshot_pth, columns, ids).to_pandas()
+
+    if columns is not None:
+        missing = set(columns) - set(snapshot_columns(snapshot_pth))
+        if missing:
+            raise KeyError(f"Columns not in snapshot: {sorted(missing)}")
+    table = None
+    for nm in [META_NM, TEXT_NM]:
+        file_pth = os.path.join(snapshot_pth, nm)
+        file_cols = [
+            col for col in pq.read_schema(file_pth).names
+            if col != ID_COL and (columns is None or col in columns)
+        ]
+        if not file_cols and (table is not None or columns != [ID_COL]):
+            continue
+        part = _read_parquet(file_pth, [ID_COL] + file_cols, ids)
+        if table is None:
+            table = part
+        elif table[ID_COL].equals(part[ID_COL]):
+            # both files hold the same ids in the same order, no join needed
+            for col in file_cols:
+                table = table.append_column(col, part[col])
+        else:
+            table = table.join(part, keys=ID_COL).sort_by(ID_COL)
+    df = table.to_pandas()
+    return df[columns] if columns is not None else df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a single file snapshot to a snapshot directory"
+        )
+    parser.add_argument("pth", help="A repo-metadata-<vintage>.parquet file")
+    args = parser.parse_args()
+    import pandas as pd
+
+    snapshot_pth = os.path.splitext(args.pth)[0]
+    write_snapshot(pd.read_parquet(args.pth), snapshot_pth)
+    print(f"Wrote {snapshot_pth}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Lazily initialise the app's heavy resources.
+
+Nothing here runs at import time. Resources are created on first use, or
+ahead of the first search by the background warm-up thread, so that the app
+starts quickly and health checks are answered straight away.
+"""
+from functools import lru_cache
+import logging
+import threading
+import time
+from typing import Union
+
+import dotenv
+import openai
+from pyprojroot import here
+
+from scripts.app_config import (
+    DEPENDENCY_TIMEOUTS,
+    PREWARM_TOOL_EXPLANATION,
+    RETRIEVAL_SOCKET_PTH,
+    RETRIEVAL_URL,
+    TOOL_EXPLANATION_PREWARMED,
+)
+from scripts.string_utils import get_vintage_from_str
+from scripts.vector_store_manifest import read_manifest
+
+_warm_up_thread = None
+
+
+@lru_cache(maxsize=1)
+def get_secrets() -> dict:
+    """Read the .env file once, on first use."""
+    return dotenv.dotenv_values(here(".env"))
+
+
+def get_openai_kwargs() -> dict:
+    """
+    OpenAI client arguments from the .env file.
+
+    An optional OPENAI_BASE_URL points the app at another OpenAI-compatible
+    server, such as `benchmarks.stub_server` for load testing. Requests
+    time out after the OpenAI dependency timeout, which also bounds the
+    wait between the chunks of a streamed response.
+    """
+    secrets = get_secrets()
+    return {
+        "api_key": secrets["OPENAI_KEY"],
+        "base_url": secrets.get("OPENAI_BASE_URL"),
+        "timeout": DEPENDENCY_TIMEOUTS["openai"],
+    }
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Create the shared OpenAI client once, on first use."""
+    return openai.AsyncOpenAI(**get_openai_kwargs())
+
+
+def get_data_vintage() -> str:
+    """
+    Get a formatted label for the vintage of the live collection.
+
+    Read from the vector store manifest, & formatted again only when the
+    manifest switches to another collection. Vector stores built before the
+    manifest was introduced fall back to listing the collections.
+    """
+    manifest = read_manifest()
+    return _vintage_label(manifest["collection_nm"] if manifest else None)
+
+
+@lru_cache(maxsize=1)
+def _vintage_label(collection_nm:Union[str, None]) -> str:
+    if collection_nm:
+        return get_vintage_from_str(collection_nm)
+    from scripts.chroma_utils import new_chroma_pipeline
+    return new_chroma_pipeline().get_data_vintage()
+
+
+def get_facet_index():
+    """
+    The live collection's facet index, from the vector store manifest.
+
+    Loaded on first use & again only when the manifest switches to another
+    collection's index.
+    """
+    from scripts.facet_index import live_facet_index_pth
+    return _load_facet_index(live_facet_index_pth())
+
+
+@lru_cache(maxsize=1)
+def _load_facet_index(index_pth:str):
+    from scripts.facet_index import FacetIndex
+    return FacetIndex.load(index_pth)
+
+
+def prewarm_tool_explanation() -> None:
+    """
+    Generate the default tool explanation if missing & save it.
+
+    Called by `warm_up()`, or once by `scripts.serve` for all its workers,
+    which then read the explanation from the cache file.
+    """
+    from scripts.explanation_cache import get_tool_explanation_cache
+
+    cache = get_tool_explanation_cache()
+    if cache.prewarm(openai.OpenAI(**get_openai_kwargs())):
+        cache.save()
+
+
+def warm_up() -> None:
+    """
+    Initialise heavy resources ahead of the first search.
+
+    Imports pandas, opens the vector store, loads the live collection,
+    logs in to Nomic, loads the facet index and prewarms the default tool
+    explanation. Failures are logged rather than raised, as each resource
+    is initialised again on first use. With remote retrieval, the retrieval
+    service holds the vector store & Nomic session, so these are skipped.
+    Workers started by `scripts.serve` skip the tool explanation, which the
+    launcher has already prewarmed.
+    """
+    # imported here to keep chromadb, nomic & pandas out of app start up
+    from scripts.chroma_utils import ChromaDBPipeline
+
+    pipeline = ChromaDBPipeline()
+    steps = [
+        ("pandas", lambda: pipeline.export_table),
+        ("facet index", get_facet_index),
+    ]
+    if not (RETRIEVAL_SOCKET_PTH or RETRIEVAL_URL):
+        steps = [
+            ("vector store", pipeline.get_latest_chroma_collection),
+            *steps,
+            ("nomic login", pipeline._login_nomic),
+        ]
+    if PREWARM_TOOL_EXPLANATION and not TOOL_EXPLANATION_PREWARMED:
+        steps.append(("tool explanation", prewarm_tool_explanation))
+    for label, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            logging.info(
+                f"Warmed up {label} in {time.perf_counter() - start:.2f}s"
+                )
+        except Exception as e:
+            logging.warning(
+                f"Warm up of {label} failed, loads on first use: {e}"
+                )
+
+
+def start_warm_up() -> threading.Thread:
+    """Run `warm_up()` once in a background daemon thread."""
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(
+            target=warm_up, name="warm-up", daemon=True
+            )
+        _warm_up_thread.start()
+    return _warm_up_thread
@@ -0,0 +1,526 @@
+"""Refresh repo data in one streaming pass, ingest to live collection.
+
+`make ingest-data` runs ingestion, summaries & embedding one after another,
+each over every repo, so a refresh takes the sum of the stages and holds
+every README in memory. Here each repo flows through the stages as soon as
+the previous one is done with it:
+
+    source -> README fetch workers -> summary workers -> embed batcher
+        -> collection upserts, & the snapshot as a side output
+
+Stages run on threads joined by bounded queues, so a refresh takes about as
+long as its slowest stage, and memory is bounded by the queue sizes rather
+than the number of repos. The new collection is built alongside the live
+one & switched to through the manifest, as `02_create_vector_store.py`
+does. Only the chroma backend is built, flat indexes need every embedding
+at once, build those from the snapshot with `02_create_vector_store.py`.
+
+Usage:
+    python -m scripts.streaming_refresh --backend graphql
+"""
+import argparse
+from contextlib import nullcontext
+import datetime as dt
+from itertools import chain
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Union
+
+from pyprojroot import here
+
+from scripts.embedding_spec import MODEL_KEY
+from scripts.facet_index import FACET_INDEX_KEY, store_facet_index
+from scripts.github_graphql import (
+    GITHUB_GRAPHQL_URL, MISSING_README, REPO_COLUMNS, HTTPTransport,
+    iter_org_repos
+)
+from scripts.http_cache import install_conditional_cache
+from scripts.matryoshka import MATRYOSHKA_DIMS, truncate_embeddings
+from scripts.pipeline_config import (
+    DOCUMENT_PREFIX,
+    EMBED_BATCH_SIZE,
+    EMBED_README_TOKENS,
+    EMBED_BATCH_WAIT,
+    EMBEDDINGS_DIMENSIONALITY,
+    EMBEDDINGS_MODEL,
+    GITHUB_HTTP_CACHE_PTH,
+    README_FETCH_WORKERS,
+    REFRESH_QUEUE_SIZE,
+    SUMMARY_README_TOKENS,
+    SUMMARY_WORKERS,
+    VECTOR_STORE_PTH,
+)
+from scripts.pipeline_stages import (
+    collection_name,
+    document_embedding_spec,
+    format_document,
+    format_metadata,
+    org_names,
+    prune_collections,
+    retained_collections,
+    summarise_repo,
+    verify_collection,
+)
+from scripts.readme_normalise import ReadmeNormaliser
+from scripts.snapshot import SnapshotWriter, snapshot_vintage
+from scripts.vector_store_manifest import read_manifest, write_manifest
+
+# marks the end of a stage's input, one per downstream worker
+_DONE = object()
+
+
+class Stage:
+    """
+    A step of a StreamingPipeline.
+
+    Attributes
+    ----------
+    nm : str
+        Label for the stage statistics.
+    fn : Callable
+        Takes an item, or a list of items for batching stages, & returns
+        the item for the next stage, or None to pass nothing on.
+    n_workers : int
+        Threads running `fn`.
+    batch_size : Union[int, None]
+        Items per call for a batching stage, None for one item per call.
+    batch_wait : float
+        Seconds a partial batch waits for more items before it is sent.
+    items : int
+        Items taken from the stage's queue, batches for the stage after a
+        batching stage.
+    busy_seconds : float
+        Time spent in `fn`, summed over workers.
+    """
+
+    def __init__(
+        self,
+        nm:str,
+        fn:Callable,
+        n_workers:int=1,
+        batch_size:Union[int, None]=None,
+        batch_wait:float=EMBED_BATCH_WAIT,
+        ):
+        self.nm = nm
+        self.fn = fn
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.items = 0
+        self.busy_seconds = 0.0
+
+
+class StreamingPipeline:
+    """
+    Run stages concurrently, joined by bounded queues.
+
+    A full queue blocks the stage feeding it, so a fast stage waits for a
+    slow one rather than buffering its output. The first exception in any
+    stage stops the source, the remaining items are drained unprocessed &
+    the exception is raised from `run`.
+
+    Attributes
+    ----------
+    stages : list
+        The Stage objects, in order.
+    queue_size : int
+        Capacity of each queue between stages.
+    wall_seconds : float
+        Duration of the last run.
+    peak_queued : list
+        The most items seen waiting on each stage's queue.
+
+    Methods
+    -------
+    run(source: Iterable) -> None
+        Feed the source's items through every stage.
+    summary() -> str
+        Items & busy time per stage, for the refresh log.
+    """
+
+    def __init__(self, stages:list, queue_size:int=REFRESH_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.wall_seconds = 0.0
+        self.peak_queued = [0] * len(stages)
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._error = None
+
+    def _fail(self, error:BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._failed.set()
+
+    def _put(self, i:int, item) -> None:
+        """Put an item on stage i's queue, giving up once the run fails."""
+        while not (self._failed.is_set() and item is not _DONE):
+            try:
+                self._queues[i].put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            with self._lock:
+                self.peak_queued[i] = max(
+                    self.peak_queued[i], self._queues[i].qsize()
+                    )
+            return
+
+    def _call(self, stage:Stage, i:int, arg) -> None:
+        if self._failed.is_set():
+            return
+        start = time.perf_counter()
+        try:
+            out = stage.fn(arg)
+        except BaseException as e:
+            self._fail(e)
+            return
+        finally:
+            with self._lock:
+                stage.busy_seconds += time.perf_counter() - start
+        if out is not None and i + 1 < len(self.stages):
+            self._put(i + 1, out)
+
+    def _worker(self, i:int) -> None:
+        stage = self.stages[i]
+        in_q = self._queues[i]
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                item = in_q.get(timeout=timeout)
+            except queue.Empty:
+                # a partial batch waited long enough
+                self._call(stage, i, batch)
+                batch = []
+                continue
+            if item is _DONE:
+                break
+            with self._lock:
+                stage.items += 1
+            if stage.batch_size is None:
+                self._call(stage, i, item)
+                continue
+            batch.append(item)
+            if len(batch) == 1:
+                deadline = time.monotonic() + stage.batch_wait
+            if len(batch) >= stage.batch_size:
+                self._call(stage, i, batch)
+                batch = []
+        if batch:
+            self._call(stage, i, batch)
+        self._finish(i)
+
+    def _finish(self, i:int) -> None:
+        """Count a finished worker, ending the next stage after the last."""
+        with self._lock:
+            self._running[i] -= 1
+            last = self._running[i] == 0
+        if last and i + 1 < len(self.stages):
+            for _ in range(self.stages[i + 1].n_workers):
+                self._put(i + 1, _DONE)
+
+    def _feed(self, source:Iterable) -> None:
+        try:
+            for item in source:
+                if self._failed.is_set():
+                    break
+                self._put(0, item)
+        except BaseException as e:
+            self._fail(e)
+        for _ in range(self.stages[0].n_workers):
+            self._put(0, _DONE)
+
+    def run(self, source:Iterable) -> None:
+        """
+        Feed the source's items through every stage.
+
+        Parameters
+        ----------
+        source : Iterable
+            Items for the first stage, consumed on its own thread.
+
+        Raises
+        ------
+        BaseException
+            The first exception raised by the source or a stage.
+        """
+        start = time.perf_counter()
+        self._queues = [
+            queue.Queue(maxsize=self.queue_size) for _ in self.stages
+            ]
+        self._running = [stage.n_workers for stage in self.stages]
+        threads = [
+            threading.Thread(target=self._feed, args=(source,), daemon=True)
+            ]
+        for i, stage in enumerate(self.stages):
+            threads += [
+                threading.Thread(
+                    target=self._worker,
+                    args=(i,),
+                    name=f"{stage.nm}-{n}",
+                    daemon=True,
+                    )
+                for n in range(stage.n_workers)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+
+    def summary(self) -> str:
+        """Items & busy time per stage, for the refresh log."""
+        lines = [
+            f"{stage.nm}: {stage.items} items, {stage.busy_seconds:.1f}s "
+            f"busy over {stage.n_workers} workers "
+            f"({stage.busy_seconds / stage.n_workers:.1f}s each), "
+            f"peak queue {peak}"
+            for stage, peak in zip(self.stages, self.peak_queued)
+        ]
+        sequential = sum(
+            stage.busy_seconds / stage.n_workers for stage in self.stages
+            )
+        lines.append(
+            f"refreshed in {self.wall_seconds:.1f}s, running the stages one "
+            f"after another would take {sequential:.1f}s"
+            )
+        return "\n".join(lines)
+
+
+def snapshot_schema():
+    """Columns & types of a streamed snapshot, as the GraphQL ingest's."""
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(),
+        "is_private": pa.bool_(),
+        "is_archived": pa.bool_(),
+        "topics": pa.list_(pa.string()),
+    }
+    return pa.schema([
+        (col, types.get(col, pa.string()))
+        for col in REPO_COLUMNS + ["ai_summary"]
+    ])
+
+
+def rest_source(github_pat:str, user_agent:str, org_nms:list) -> Iterable:
+    """Repos with topics from the REST API, an org at a time."""
+    from ai_nexus_backend.github_api import GithubClient
+
+    github_client = GithubClient(github_pat=github_pat, user_agent=user_agent)
+    for org_nm in org_nms:
+        org = github_client.get_org_repos(org_nm, public_only=True)
+        topics = github_client.get_all_repo_metadata(
+            html_urls=org["html_url"],
+            metadata="topics",
+        )
+        # topics are keyed by repo_url, see 01_ingest_data.py
+        org = org.join(topics.set_index("repo_url"), on="html_url")
+        for record in org.to_dict("records"):
+            yield record
+
+
+def readme_fetcher(github_pat:str, user_agent:str) -> Callable:
+    """A fetch stage adding each repo's README, a client per thread."""
+    from ai_nexus_backend.github_api import GithubClient
+    from requests import HTTPError
+
+    clients = threading.local()
+
+    def fetch_readme(record:dict) -> dict:
+        if not hasattr(clients, "github"):
+            clients.github = GithubClient(
+                github_pat=github_pat, user_agent=user_agent
+                )
+        try:
+            record["readme"] = clients.github.get_readme_content(
+                record["html_url"]
+                )
+        except HTTPError as e:
+            logging.warning(f"repo {record['html_url']} returned an error: {e}")
+            record["readme"] = MISSING_README
+        return record
+
+    return fetch_readme
+
+
+def refresh():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backend",
+        choices=["rest", "graphql"],
+        default="rest",
+        help="Fetch repo details per repo over REST or in bulk over GraphQL"
+        )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="Download every REST response, ignoring the on-disk cache"
+        )
+    parser.add_argument(
+        "--dimensionality",
+        type=int,
+        choices=MATRYOSHKA_DIMS,
+        default=EMBEDDINGS_DIMENSIONALITY,
+        help="Matryoshka dimensionality of the stored embeddings, must "
+        "match EMBEDDINGS_DIMENSIONALITY in app_config.py"
+        )
+    parser.add_argument(
+        "--fetch-workers", type=int, default=README_FETCH_WORKERS
+        )
+    parser.add_argument(
+        "--summary-workers", type=int, default=SUMMARY_WORKERS
+        )
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=REFRESH_QUEUE_SIZE,
+        help="Repos each queue between stages holds, bounding memory"
+        )
+    args = parser.parse_args()
+
+    import chromadb
+    import dotenv
+    import ollama
+    import openai
+
+    # configure -----------------------------------------------------------
+    secrets = dotenv.dotenv_values(here(".env"))
+    github_pat = secrets["GITHUB_PAT"]
+    user_agent = secrets["AGENT"]
+    org_nms = org_names(secrets)
+    openai_client = openai.OpenAI(api_key=secrets["OPENAI_KEY"])
+    ollama.pull(EMBEDDINGS_MODEL)
+
+    now = dt.datetime.today()
+    snapshot_pth = here(
+        f"data/repo-metadata-{now.isoformat().replace(':', '_')}"
+        )
+    vintage = snapshot_vintage(snapshot_pth)
+    collection_nm = collection_name(vintage, now)
+    spec = document_embedding_spec(args.dimensionality)
+    chroma_client = chromadb.PersistentClient(path=str(VECTOR_STORE_PTH))
+    collection = chroma_client.create_collection(
+        name=collection_nm, metadata=spec
+        )
+    snapshot = SnapshotWriter(snapshot_pth, snapshot_schema())
+    # ids are kept to check the collection, the first embedding to query it
+    ids = []
+    first_embeddings = []
+
+    # READMEs are condensed for the prompt & document, the snapshot keeps
+    # them whole
+    summary_normaliser = ReadmeNormaliser(SUMMARY_README_TOKENS)
+    embed_normaliser = ReadmeNormaliser(EMBED_README_TOKENS)
+
+    # stages --------------------------------------------------------------
+    def summarise(record:dict) -> dict:
+        record["ai_summary"] = summarise_repo(
+            openai_client, record, normaliser=summary_normaliser
+            )
+        return record
+
+    def embed(records:list) -> tuple:
+        documents = [
+            format_document(record, normaliser=embed_normaliser)
+            for record in records
+        ]
+        ollama_response = ollama.embed(model=EMBEDDINGS_MODEL, input=documents)
+        # truncate & renormalise as the Nomic API does for query embeddings
+        embeddings = truncate_embeddings(
+            ollama_response.embeddings, args.dimensionality
+            )
+        return records, documents, embeddings
+
+    def upsert(batch:tuple) -> None:
+        records, documents, embeddings = batch
+        batch_ids = [str(record["id"]) for record in records]
+        collection.add(
+            ids=batch_ids,
+            metadatas=[format_metadata(record) for record in records],
+            documents=[doc.replace(DOCUMENT_PREFIX, "") for doc in documents],
+            embeddings=embeddings.tolist(),
+            )
+        snapshot.write(records)
+        ids.extend(batch_ids)
+        if not first_embeddings:
+            first_embeddings.append(embeddings[0])
+
+    stages = []
+    http_cache = nullcontext()
+    if args.backend == "graphql":
+        # READMEs arrive with the metadata, 100 repos per request
+        transport = HTTPTransport(
+            github_pat,
+            user_agent,
+            url=secrets.get("GITHUB_GRAPHQL_URL") or GITHUB_GRAPHQL_URL,
+        )
+        source = chain.from_iterable(
+            iter_org_repos(org_nm, transport) for org_nm in org_nms
+            )
+    else:
+        if not args.no_http_cache:
+            http_cache = install_conditional_cache(GITHUB_HTTP_CACHE_PTH)
+        source = rest_source(github_pat, user_agent, org_nms)
+        stages.append(Stage(
+            "fetch", readme_fetcher(github_pat, user_agent),
+            n_workers=args.fetch_workers,
+            ))
+    stages += [
+        Stage("summarise", summarise, n_workers=args.summary_workers),
+        Stage("embed", embed, batch_size=args.batch_size),
+        # one writer, chroma & parquet writes are not concurrent
+        Stage("upsert", upsert),
+    ]
+    pipeline = StreamingPipeline(stages, queue_size=args.queue_size)
+
+    # run & switch over ---------------------------------------------------
+    try:
+        with http_cache as cache_adapter:
+            pipeline.run(source)
+        if not ids:
+            raise RuntimeError("No repos were ingested")
+        verify_collection(collection, ids, first_embeddings, spec)
+        # the snapshot is only published with a verified collection
+        snapshot.close()
+    except BaseException:
+        snapshot.abort()
+        chroma_client.delete_collection(collection_nm)
+        raise
+    print(pipeline.summary())
+    print(f"Summary prompts: {summary_normaliser.summary()}")
+    print(f"Embedded documents: {embed_normaliser.summary()}")
+    if cache_adapter:
+        print(cache_adapter.summary())
+    manifest = {
+        "collection_nm": collection_nm,
+        "vintage": vintage,
+        "n_records": len(ids),
+        "built_at": now.isoformat(),
+        "backend": "chroma",
+        **spec,
+    }
+    previous = read_manifest(VECTOR_STORE_PTH)
+    # counts of the repos just ingested, for CountRepos
+    if (facet_pth := store_facet_index(snapshot_pth, collection_nm)):
+        manifest[FACET_INDEX_KEY] = facet_pth
+    write_manifest(manifest, vector_store_pth=VECTOR_STORE_PTH)
+    print(
+        f"Wrote {snapshot_pth} & switched to {collection_nm}, embedded with "
+        f"{spec[MODEL_KEY]} at {args.dimensionality} dimensions"
+        )
+    # sessions may still be searching the collection just replaced, so it
+    # is kept until the next build
+    keep = retained_collections(manifest, previous)
+    prune_collections(chroma_client, VECTOR_STORE_PTH, keep)
+
+
+if __name__ == "__main__":
+    refresh()
@@ -1,25 +1,41 @@
 import datetime as dt
+import math
 import re
+from typing import Union
 import warnings
 
-from scripts.prompts import RESP_EVALUATION_PROMPT, RESPONSE_TEMPLATE
+from scripts.prompts import (
+    COMPACT_RESULTS_TEMPLATE, LLM_RESULT_TEMPLATE, RESP_EVALUATION_PROMPT
+)
+
+
+def shorten_text(some_str:Union[str, None], max_words:int) -> str:
+    # missing summaries arrive as None, or NaN from a pandas frame
+    if some_str is None or (
+        isinstance(some_str, float) and math.isnan(some_str)
+        ):
+        return ""
+    words = str(some_str).split()
+    if len(words) <= max_words:
+        return " ".join(words)
+    return " ".join(words[:max_words]) + "..."
 
 
 def format_results(
     db_result:dict,
-    template:str=RESPONSE_TEMPLATE
+    rank:int,
+    max_words:int,
+    template:str=LLM_RESULT_TEMPLATE
     ) -> str:
     return template.format(
-        org_nm = db_result.get("org_nm"),
+        rank=rank,
+        repo_id=db_result.get("repo_id"),
+        org_nm=db_result.get("org_nm"),
         repo_nm=db_result.get("repo_nm"),
-        repo_desc=db_result.get("repo_desc"),
-        url=db_result.get("html_url"),
-        is_private=db_result.get("is_private"),
-        is_archived=db_result.get("is_archived"),
-        updated_at=db_result.get("updated_at"),
-        programming_language=db_result.get("programming_language"),
         distance=db_result.get("distance"),
-        model_summary=db_result.get("model_summary"),
+        short_summary=shorten_text(
+            db_result.get("model_summary"), max_words=max_words
+            ),
         )
 
 def format_evaluation_response(
@@ -30,6 +46,19 @@ def format_evaluation_response(
     return template.format(results=res, user_prompt=usr_prompt)
 
 
+def format_compact_reference(
+    usr_prompt:str,
+    search_terms:list,
+    repo_nms:list,
+    template:str=COMPACT_RESULTS_TEMPLATE
+    ) -> str:
+    return template.format(
+        user_prompt=usr_prompt,
+        search_terms=", ".join(search_terms),
+        repo_nms=", ".join(str(nm) for nm in repo_nms) or "None",
+        )
+
+
 def remove_invisible_unicode(some_str:str, debug:bool = False) -> str:
     warnings.simplefilter("always", UserWarning)
     hidden_pattern = re.compile(r"[\U000E0000-\U000E007F]")
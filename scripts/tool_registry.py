@@ -0,0 +1,101 @@
+"""Dispatch orchestrator tool calls to registered handlers."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Type
+
+from pydantic import BaseModel
+
+from scripts.string_utils import sanitise_string
+
+
+class ToolRegistry:
+    """
+    Map tool names to handlers & execute the tool calls in a response.
+
+    Handlers are registered against the pydantic model describing the
+    tool's arguments. Tool call arguments are validated against the model
+    before the handler is called. Handlers run concurrently, apart from
+    exclusive handlers, which run alone after all preceding tool calls
+    have finished. Use exclusive for tools that reset shared state, such
+    as wiping the chat.
+
+    Attributes
+    ----------
+    handlers : dict
+        Maps tool name to a tuple of (argument model, handler, exclusive).
+
+    Methods
+    -------
+    register(model: Type[BaseModel], exclusive: bool) -> Callable
+        Decorator registering a handler for the tool named after `model`.
+    dispatch(tool_calls: list, **context) -> None
+        Validate & execute the tool calls from one model response.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(
+        self, model:Type[BaseModel], exclusive:bool=False
+        ) -> Callable:
+        """
+        Register a handler for the tool named after `model`.
+
+        Parameters
+        ----------
+        model : Type[BaseModel]
+            The pydantic model used to build the tool's schema.
+        exclusive : bool, optional
+            If True, the handler never runs alongside other tool calls.
+
+        Returns
+        -------
+        Callable
+            A decorator for an async handler accepting the validated
+            model instance and any context passed to `dispatch()`.
+        """
+        def decorator(handler:Callable[..., Awaitable]) -> Callable:
+            self.handlers[model.__name__] = (model, handler, exclusive)
+            return handler
+        return decorator
+
+    async def dispatch(self, tool_calls:List, **context) -> None:
+        """
+        Validate & execute the tool calls from one model response.
+
+        Parameters
+        ----------
+        tool_calls : List
+            `ChatCompletionMessageToolCall` objects, in the order the model
+            returned them.
+        **context
+            Passed to every handler, eg the sanitised prompt.
+        """
+        # validate every call before any handler runs
+        validated = []
+        for tool_call in tool_calls:
+            function_nm = sanitise_string(tool_call.function.name)
+            if function_nm not in self.handlers:
+                logging.warning(f"No handler registered for {function_nm}")
+                continue
+            model, handler, exclusive = self.handlers[function_nm]
+            # pydantic defence, raises if arguments violate the schema
+            tool_args = model.model_validate_json(tool_call.function.arguments)
+            logging.info(f"Tool call: {function_nm}({tool_args})")
+            validated.append((handler, tool_args, exclusive))
+
+        batch = []
+        for handler, tool_args, exclusive in validated:
+            if exclusive:
+                await self._run_batch(batch)
+                batch = []
+                await handler(tool_args, **context)
+            else:
+                batch.append(handler(tool_args, **context))
+        await self._run_batch(batch)
+
+    @staticmethod
+    async def _run_batch(batch:list) -> None:
+        """Await independent tool calls concurrently."""
+        if batch:
+            await asyncio.gather(*batch)
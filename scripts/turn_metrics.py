@@ -0,0 +1,180 @@
+"""Utilities for measuring the model calls made within a single chat turn."""
+import inspect
+import logging
+import time
+from typing import Callable, Union
+
+from scripts.circuit_breaker import breaker_stats
+
+
+class TurnMetrics:
+    """
+    Count and time the model calls made while responding to one prompt.
+
+    Attributes
+    ----------
+    calls : list
+        One dictionary per model call, holding the agent label and the
+        call latency in seconds.
+    started_at : float
+        `time.perf_counter()` value recorded when the turn began.
+    first_token_latency : Union[float, None]
+        Seconds from the start of the turn until the first streamed text
+        chunk was received.
+    history_tokens : Union[int, None]
+        Approximate tokens in the orchestrator stream after compaction.
+    tokens_saved : int
+        Tokens removed from the orchestrator stream by compaction.
+    usage : list
+        One dictionary per model call that reported token usage, holding
+        the agent label, prompt tokens and prompt tokens served from the
+        provider's prompt cache.
+    fallbacks : list
+        One dictionary per step that fell back because a dependency was
+        unavailable, holding the step and the reason.
+
+    Methods
+    -------
+    timed_call(agent: str, func: Callable, **params)
+        Execute a model call and record its latency against `agent`.
+    mark_first_token(at: float) -> None
+        Record when the first streamed text chunk arrived.
+    record_compaction(report: dict) -> None
+        Record a `HistoryManager.compact()` report.
+    record_usage(agent: str, usage: CompletionUsage) -> None
+        Record prompt & cached token counts for a model call.
+    record_fallback(step: str, reason: str) -> None
+        Record a step that fell back as a dependency was unavailable.
+    summary() -> dict
+        Return the call count, per-agent counts and latencies for the turn.
+    log() -> dict
+        Write the turn summary to the application log.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.started_at = time.perf_counter()
+        self.first_token_latency = None
+        self.history_tokens = None
+        self.tokens_saved = 0
+        self.usage = []
+        self.fallbacks = []
+
+    async def timed_call(self, agent:str, func:Callable, **params):
+        """
+        Execute a model call and record its latency.
+
+        Parameters
+        ----------
+        agent : str
+            A label for the agent making the call, eg "orchestrator".
+        func : Callable
+            The client method to call, eg
+            `openai_client.chat.completions.create`. Coroutines are
+            awaited. For streamed completions, the latency recorded is the
+            time taken to open the stream and token usage is recorded
+            once the stream ends, see `StreamedCompletion`.
+        **params
+            Keyword arguments passed through to `func`.
+
+        Returns
+        -------
+        Any
+            The response returned by `func`.
+        """
+        start = time.perf_counter()
+        response = func(**params)
+        if inspect.isawaitable(response):
+            response = await response
+        self.calls.append(
+            {"agent": agent, "latency": time.perf_counter() - start}
+            )
+        # streamed responses carry usage in their final chunk instead
+        if (usage := getattr(response, "usage", None)):
+            self.record_usage(agent, usage)
+        return response
+
+    def mark_first_token(self, at:Union[float, None]) -> None:
+        """Record the first streamed text chunk, if not already recorded."""
+        if at is not None and self.first_token_latency is None:
+            self.first_token_latency = round(at - self.started_at, 3)
+
+    def record_compaction(self, report:dict) -> None:
+        """Record the history size & tokens saved by compaction."""
+        self.history_tokens = report["history_tokens"]
+        self.tokens_saved += report["tokens_saved"]
+
+    def record_usage(self, agent:str, usage) -> None:
+        """
+        Record prompt & cached token counts for a model call.
+
+        Parameters
+        ----------
+        agent : str
+            A label for the agent that made the call.
+        usage : CompletionUsage
+            The `usage` of a chat completion or of a stream's final chunk.
+        """
+        details = usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        self.usage.append({
+            "agent": agent,
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_tokens": cached_tokens,
+            })
+        logging.info(
+            f"Prompt cache for {agent}: {cached_tokens} of "
+            f"{usage.prompt_tokens} prompt tokens cached"
+            )
+
+    def record_fallback(self, step:str, reason:str) -> None:
+        """
+        Record a step that fell back as a dependency was unavailable.
+
+        Parameters
+        ----------
+        step : str
+            The step, eg "summary".
+        reason : str
+            The `DependencyUnavailable.reason`, eg "timeout".
+        """
+        self.fallbacks.append({"step": step, "reason": reason})
+        logging.warning(f"Fell back at {step}, dependency {reason}")
+
+    def summary(self) -> dict:
+        """
+        Summarise the model calls made during the turn.
+
+        Returns
+        -------
+        dict
+            Total call count, per-agent call counts, summed model latency,
+            time to first streamed token and wall-clock latency for the
+            whole turn, in seconds. Also the chat history size and tokens
+            saved by compaction, plus prompt tokens & cached prompt tokens
+            for calls that have reported usage so far. Also the turn's
+            fallbacks and the state & counts of the process's circuit
+            breakers.
+        """
+        per_agent = {}
+        for call in self.calls:
+            per_agent[call["agent"]] = per_agent.get(call["agent"], 0) + 1
+        return {
+            "n_calls": len(self.calls),
+            "calls_per_agent": per_agent,
+            "model_latency": round(sum(c["latency"] for c in self.calls), 3),
+            "first_token_latency": self.first_token_latency,
+            "turn_latency": round(time.perf_counter() - self.started_at, 3),
+            "history_tokens": self.history_tokens,
+            "tokens_saved": self.tokens_saved,
+            "prompt_tokens": sum(u["prompt_tokens"] for u in self.usage),
+            "cached_tokens": sum(u["cached_tokens"] for u in self.usage),
+            "fallbacks": self.fallbacks,
+            "breakers": breaker_stats(),
+        }
+
+    def log(self) -> dict:
+        """Write the turn summary to the application log & return it."""
+        summary = self.summary()
+        logging.info(f"Turn metrics: {summary}")
+        return summary
@@ -0,0 +1,66 @@
+"""Read & write the manifest describing the live vector store collection.
+
+The manifest is a small JSON file written alongside the vector store by
+`02_create_vector_store.py`. Reading it lets the app label the data vintage
+and select the live collection without opening the vector store.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Union
+
+from scripts.pipeline_config import VECTOR_STORE_PTH
+
+MANIFEST_NM = "manifest.json"
+
+
+def read_manifest(
+    vector_store_pth:Union[str, Path]=VECTOR_STORE_PTH,
+    ) -> Union[dict, None]:
+    """
+    Read the vector store manifest.
+
+    Parameters
+    ----------
+    vector_store_pth : Union[str, Path], optional
+        Path to the vector store directory.
+
+    Returns
+    -------
+    Union[dict, None]
+        The manifest contents, or None if no manifest has been written.
+    """
+    pth = Path(vector_store_pth) / MANIFEST_NM
+    if not pth.exists():
+        return None
+    with open(pth) as f:
+        return json.load(f)
+
+
+def write_manifest(
+    manifest:dict,
+    vector_store_pth:Union[str, Path]=VECTOR_STORE_PTH,
+    ) -> None:
+    """
+    Write the vector store manifest atomically.
+
+    The manifest is written to a temporary file and moved into place, so
+    readers never see a partially written file.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest contents. Must include `collection_nm`. A `backend`
+        of "flat" must also give the `index_dir`, relative to the vector
+        store directory. An optional `previous` entry, with the same keys,
+        names the collection to fall back to while migrating embedding
+        models. An optional `facet_index` gives the path of the
+        collection's facet index, relative to the vector store directory.
+    vector_store_pth : Union[str, Path], optional
+        Path to the vector store directory.
+    """
+    pth = Path(vector_store_pth) / MANIFEST_NM
+    tmp_pth = pth.with_suffix(".json.tmp")
+    with open(tmp_pth, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_pth, pth)
@@ -0,0 +1,63 @@
+"""Breakers count dependency failures only, & streams cannot stall."""
+import asyncio
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+from scripts.chat_utils import StreamedCompletion
+from scripts.circuit_breaker import CircuitBreaker, DependencyUnavailable
+from scripts.prompts import STREAM_INTERRUPTED_MSG
+
+
+def fail(error):
+    raise error
+
+
+def test_dependency_errors_open_the_breaker():
+    breaker = CircuitBreaker("test", timeout=1.0, failure_threshold=2)
+    for error in [TimeoutError(), ConnectionError()]:
+        with pytest.raises(DependencyUnavailable):
+            breaker.call(fail, error)
+    assert breaker.stats()["state"] == "open"
+    assert breaker.stats()["timeouts"] == 1
+    with pytest.raises(DependencyUnavailable, match="open"):
+        breaker.call(lambda: "never called")
+
+
+def test_our_errors_are_raised_as_they_are():
+    breaker = CircuitBreaker("test", timeout=1.0, failure_threshold=1)
+    with pytest.raises(KeyError):
+        breaker.call(fail, KeyError("keywords"))
+    with pytest.raises(ValueError):
+        asyncio.run(breaker.call_async(fail, ValueError("invalid")))
+    assert breaker.stats()["state"] == "closed"
+    assert breaker.stats()["failures"] == 0
+
+
+def chunk(content):
+    return ChatCompletionChunk.model_validate({
+        "id": "1",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "stub",
+        "choices": [{"index": 0, "delta": {"content": content}}],
+    })
+
+
+async def stalled_stream():
+    yield chunk("Hello")
+    yield chunk(" there")
+    await asyncio.sleep(60)
+    yield chunk(" never sent")
+
+
+def test_a_stalled_stream_is_cut_short():
+    async def respond():
+        completion = await StreamedCompletion(
+            stalled_stream(), chunk_timeout=0.05
+            ).start()
+        return completion, [text async for text in completion.text_chunks()]
+
+    completion, texts = asyncio.run(respond())
+    assert texts == ["Hello", " there", f" {STREAM_INTERRUPTED_MSG}"]
+    assert completion.interrupted
@@ -0,0 +1,77 @@
+"""Sessions follow manifest switches & builds keep what they replace."""
+from scripts.chroma_utils import ChromaDBPipeline
+from scripts.pipeline_stages import retained_collections
+from scripts.vector_store_manifest import write_manifest
+
+COLLECTION_NMS = [
+    "moj-github-2026-09-01T00_00_00.000000-1",
+    "moj-github-2026-10-01T00_00_00.000000-1",
+]
+
+
+class NamedCollection:
+    """A collection that answers every query with its own name."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def query(self, query_embeddings, n_results):
+        return {
+            "ids": [[self.name]],
+            "documents": [["Name: repo, url: https://github.com/org/repo"]],
+            "distances": [[0.1]],
+            "metadatas": [[{"org_nm": "org", "updated_at": 1_700_000_000.0}]],
+        }
+
+
+def test_sessions_follow_a_manifest_switch(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        ChromaDBPipeline,
+        "_checked_collection",
+        lambda self, entry: NamedCollection(entry["collection_nm"]),
+        )
+    monkeypatch.setattr(
+        ChromaDBPipeline,
+        "embed_keywords",
+        lambda self, keywords, model=None: {"embeddings": [[1.0, 0.0]]},
+        )
+    pipeline = ChromaDBPipeline(
+        vector_store_pth=tmp_path, nomic_api_key="unused"
+        )
+    old_nm, new_nm = COLLECTION_NMS
+
+    def search():
+        return list(pipeline.execute_pipeline(
+            keywords=["data"],
+            n_results=1,
+            distance_threshold=1.0,
+            sanitised_prompt="Find data repos",
+        )["results"])
+
+    write_manifest({"collection_nm": old_nm}, vector_store_pth=tmp_path)
+    assert search() == [old_nm]
+    write_manifest({"collection_nm": new_nm}, vector_store_pth=tmp_path)
+    assert search() == [new_nm]
+    assert pipeline.collection_nm == new_nm
+
+
+def test_builds_keep_the_collections_they_replace():
+    replaced = {
+        "collection_nm": "live",
+        "shards": [{"collection_nm": "live-0"}, {"collection_nm": "live-1"}],
+        "previous": {"collection_nm": "migrating"},
+    }
+    assert retained_collections({"collection_nm": "new"}, replaced) == {
+        "new", "live", "live-0", "live-1", "migrating"
+    }
+    assert retained_collections({"collection_nm": "new"}, None) == {"new"}
+
+
+def test_the_vintage_label_follows_a_manifest_switch(monkeypatch):
+    from scripts import startup
+
+    manifest = {"collection_nm": COLLECTION_NMS[0]}
+    monkeypatch.setattr(startup, "read_manifest", lambda: manifest)
+    assert startup.get_data_vintage().endswith("1 September, 2026 at 00:00")
+    manifest["collection_nm"] = COLLECTION_NMS[1]
+    assert startup.get_data_vintage().endswith("1 October, 2026 at 00:00")
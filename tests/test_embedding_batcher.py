@@ -0,0 +1,80 @@
+"""Concurrent searches share batches, repeats hit the cache."""
+import threading
+
+import pytest
+
+from scripts.circuit_breaker import CircuitBreaker, DependencyUnavailable
+from scripts.embedding_batcher import EmbeddingBatcher
+
+WAIT = 5.0 # seconds, long enough never to be reached by a passing test
+
+
+class CountingEmbed:
+    """Embeds each text as its length, recording every batch."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def __call__(self, texts):
+        if self.fail:
+            raise ConnectionError("nomic down")
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_requests_share_one_batch():
+    embed_fn = CountingEmbed()
+    # a window no passing test reaches, so the batch fills to max size
+    batcher = EmbeddingBatcher(
+        embed_fn, window_ms=WAIT * 1000, max_batch_size=6
+        )
+    requests = [["nlp", "llm"], ["llm", "graphs"], ["maps", "nlp"]]
+    results = [None] * len(requests)
+
+    def search(i):
+        results[i] = batcher.embed(requests[i])
+
+    threads = [
+        threading.Thread(target=search, args=(i,))
+        for i in range(len(requests))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT)
+
+    assert len(embed_fn.batches) == 1
+    assert sorted(embed_fn.batches[0]) == ["graphs", "llm", "maps", "nlp"]
+    assert results == [
+        [[float(len(t))] for t in texts] for texts in requests
+    ]
+    assert batcher.stats()["requests"] == 3
+    assert batcher.stats()["texts"] == 4
+
+
+def test_repeated_texts_are_served_from_the_cache():
+    embed_fn = CountingEmbed()
+    batcher = EmbeddingBatcher(embed_fn, window_ms=0)
+    batcher.embed(["nlp", "llm"])
+    assert batcher.embed(["nlp", "nlp"]) == [[3.0], [3.0]]
+    assert batcher.embed(["llm", "graphs"]) == [[3.0], [6.0]]
+    assert embed_fn.batches == [["nlp", "llm"], ["graphs"]]
+    # a text repeated within a request is one cache hit
+    assert batcher.stats()["cache_hits"] == 2
+
+
+def test_cached_texts_are_served_while_the_breaker_is_open():
+    embed_fn = CountingEmbed()
+    breaker = CircuitBreaker("nomic", timeout=WAIT, failure_threshold=1)
+    batcher = EmbeddingBatcher(embed_fn, window_ms=0, breaker=breaker)
+    batcher.embed(["nlp"])
+    embed_fn.fail = True
+
+    with pytest.raises(DependencyUnavailable):
+        batcher.embed(["llm"])
+    assert breaker.stats()["state"] == "open"
+    with pytest.raises(DependencyUnavailable, match="open"):
+        batcher.embed(["graphs"])
+    assert batcher.embed(["nlp"]) == [[3.0]]
+    assert embed_fn.batches == [["nlp"]]
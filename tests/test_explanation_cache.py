@@ -0,0 +1,49 @@
+"""Tool explanations are prewarmed once & saved across processes."""
+from types import SimpleNamespace
+
+from scripts.explanation_cache import ToolExplanationCache
+
+
+class ExplainerClient:
+    """A client whose every completion is a complete explanation."""
+
+    def __init__(self):
+        self.n_calls = 0
+        self.chat = SimpleNamespace(
+            completions=SimpleNamespace(create=self.create)
+            )
+
+    def create(self, **params):
+        self.n_calls += 1
+        message = SimpleNamespace(content="I can search repos.")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason="stop", message=message)]
+            )
+
+
+def test_the_default_explanation_is_generated_once(tmp_path):
+    cache = ToolExplanationCache("manual", cache_pth=tmp_path / "cache.json")
+    client = ExplainerClient()
+    assert cache.prewarm(client)
+    assert not cache.prewarm(client)
+    assert client.n_calls == 1
+
+
+def test_saves_keep_other_processes_explanations(tmp_path):
+    cache_pth = tmp_path / "cache.json"
+    workers = [
+        ToolExplanationCache("manual", cache_pth=cache_pth) for _ in range(2)
+        ]
+    workers[0].set("brief", "Search, count & email.")
+    workers[0].save()
+    workers[1].set("as a pirate", "Arr, I search repos.")
+    workers[1].save()
+
+    restarted = ToolExplanationCache("manual", cache_pth=cache_pth)
+    restarted.load()
+    assert restarted.get("Brief.") == "Search, count & email."
+    assert restarted.get("as a pirate") == "Arr, I search repos."
+    # explanations of another toolbox manual are not served
+    changed = ToolExplanationCache("new manual", cache_pth=cache_pth)
+    changed.load()
+    assert changed.get("brief") is None
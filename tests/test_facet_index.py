@@ -0,0 +1,38 @@
+"""Repo counts from the facet index, including repos without dates."""
+import pandas as pd
+
+from scripts.facet_index import UNKNOWN, FacetIndex
+
+NOW = 1_760_000_000 # 2025-10-09
+
+
+def repos():
+    return pd.DataFrame({
+        "org_nm": [
+            "ministryofjustice", "ministryofjustice", "moj-analytical-services"
+        ],
+        "programming_language": ["Python", None, "R"],
+        "is_archived": [False, True, False],
+        "updated_at": ["2020-01-01T00:00:00Z", None, "2025-05-01T00:00:00Z"],
+        "topics": [["data"], [], ["data", "r"]],
+    })
+
+
+def test_counts_group_and_filter():
+    index = FacetIndex.from_frame(repos())
+    assert index.query(programming_language="python")["count"] == 1
+    assert index.query(group_by="programming_language")["groups"] == [
+        ("Python", 1), ("R", 1), (UNKNOWN, 1)
+    ]
+    assert index.query(topic="DATA", group_by="org_nm")["groups"] == [
+        ("ministryofjustice", 1), ("moj-analytical-services", 1)
+    ]
+
+
+def test_repos_without_a_date_are_unknown_years_and_never_recent():
+    index = FacetIndex.from_frame(repos())
+    assert index.query(group_by="updated_year", now=NOW) == {
+        "count": 3, "groups": [("2020", 1), ("2025", 1), (UNKNOWN, 1)]
+    }
+    assert index.query(not_updated_within_days=365, now=NOW)["count"] == 1
+    assert index.query(updated_within_days=365, now=NOW)["count"] == 1
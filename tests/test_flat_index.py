@@ -0,0 +1,35 @@
+"""Flat indexes read results' records by their row groups."""
+import numpy as np
+
+from scripts.flat_index import RECORD_GROUP_ROWS, FlatIndex, write_flat_index
+
+N_RECORDS = 1_000
+
+
+def test_results_carry_their_own_records(tmp_path):
+    embeddings = np.random.default_rng(42).normal(size=(N_RECORDS, 16))
+    write_flat_index(
+        tmp_path,
+        ids=[str(i) for i in range(N_RECORDS)],
+        embeddings=embeddings,
+        documents=[f"Name: repo-{i}" for i in range(N_RECORDS)],
+        metadatas=[
+            {"org_nm": f"org-{i % 3}", "updated_at": float(i)}
+            for i in range(N_RECORDS)
+        ],
+    )
+    index = FlatIndex(tmp_path)
+    assert index._records.num_row_groups == -(-N_RECORDS // RECORD_GROUP_ROWS)
+
+    queried = [5, 700, 999]
+    results = index.query(embeddings[queried], n_results=3)
+    # a stored record is its own nearest neighbour
+    assert [ids[0] for ids in results["ids"]] == [str(i) for i in queried]
+    for ids, documents, metadatas in zip(
+        results["ids"], results["documents"], results["metadatas"]
+        ):
+        for _id, document, metadata in zip(ids, documents, metadatas):
+            assert document == f"Name: repo-{_id}"
+            assert metadata == {
+                "org_nm": f"org-{int(_id) % 3}", "updated_at": float(_id)
+            }
@@ -0,0 +1,93 @@
+"""GraphQL ingestion against the stub endpoint & recorded responses."""
+from types import SimpleNamespace
+
+import pytest
+from starlette.testclient import TestClient
+
+from benchmarks import stub_server
+from scripts import github_graphql
+from scripts.facet_index import FACET_COLS
+from scripts.github_graphql import (
+    MISSING_README, README_PTHS, REPO_COLUMNS, HTTPTransport, ReplayTransport,
+    get_orgs_repos
+)
+from scripts.snapshot import TEXT_COLS, VECTOR_STORE_COLS
+
+ORG_NMS = ["ministryofjustice", "moj-analytical-services"]
+N_REPOS = 25
+PAGE_SIZE = 10
+
+
+@pytest.fixture
+def stub_transport(tmp_path, monkeypatch):
+    """An HTTPTransport posting to the stub server, recording responses."""
+    monkeypatch.setattr(stub_server.StubConfig, "latency", 0)
+    monkeypatch.setattr(stub_server.StubConfig, "repos_per_org", N_REPOS)
+    transport = HTTPTransport(
+        "pat", "agent", url="/graphql", record_pth=tmp_path / "org.jsonl"
+        )
+    transport._session = TestClient(stub_server.app)
+    return transport
+
+
+def test_orgs_are_paged_into_the_rest_frame(stub_transport):
+    repos = get_orgs_repos(ORG_NMS, stub_transport, page_size=PAGE_SIZE)
+
+    # 3 pages of 10, 10 & 5 repos per org
+    assert stub_transport.n_requests == 6
+    assert len(repos) == len(ORG_NMS) * N_REPOS
+    assert repos["html_url"].is_unique
+    assert (repos.index == repos["html_url"]).all()
+    # the columns the REST ingestion produces, & later steps read
+    assert list(repos.columns) == REPO_COLUMNS
+    assert set(VECTOR_STORE_COLS) | set(FACET_COLS) <= (
+        set(REPO_COLUMNS) | set(TEXT_COLS)
+        )
+    readmes = repos.set_index("name")["readme"].groupby(level=0).first()
+    # stub READMEs are under the first or second path, or missing
+    assert readmes["repo-00001"].startswith("# repo-00001")
+    assert readmes["repo-00002"].startswith("# repo-00002")
+    assert readmes["repo-00010"] == MISSING_README
+
+
+def test_recorded_responses_replay(stub_transport, tmp_path):
+    recorded = get_orgs_repos(ORG_NMS, stub_transport, page_size=PAGE_SIZE)
+    replay = ReplayTransport(tmp_path / "org.jsonl")
+    replayed = get_orgs_repos(ORG_NMS, replay, page_size=PAGE_SIZE)
+    assert replay.n_requests == stub_transport.n_requests
+    assert replayed.sort_index().equals(recorded.sort_index())
+
+
+def test_readmes_fall_back_through_the_paths():
+    node = stub_server.stub_repo("ministryofjustice", 1)
+    del node["readme1"]
+    last = len(README_PTHS) - 1
+    node[f"readme{last}"] = {"text": f"From {README_PTHS[last]}"}
+    node["readme0"] = None
+    record = github_graphql._repo_record(node, "ministryofjustice")
+    assert record["readme"] == f"From {README_PTHS[last]}"
+
+
+def test_timed_out_pages_are_retried_at_half_the_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(github_graphql.time, "sleep", lambda seconds: None)
+    page_sizes = []
+
+    def post(url, json, timeout):
+        page_sizes.append(json["variables"]["pageSize"])
+        if json["variables"]["pageSize"] > 25:
+            return SimpleNamespace(status_code=502)
+        return SimpleNamespace(
+            status_code=200,
+            raise_for_status=lambda: None,
+            json=lambda: {"data": {"page": len(page_sizes)}},
+            )
+
+    transport = HTTPTransport("pat", "agent", record_pth=tmp_path / "r.jsonl")
+    transport._session = SimpleNamespace(post=post)
+    variables = {"org": "ministryofjustice", "cursor": None, "pageSize": 100}
+    assert transport("query", variables) == {"data": {"page": 3}}
+    assert page_sizes == [100, 50, 25]
+    # recorded under the variables asked for, as a replay asks for them
+    assert ReplayTransport(tmp_path / "r.jsonl")("query", variables) == {
+        "data": {"page": 3}
+    }
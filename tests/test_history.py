@@ -0,0 +1,67 @@
+"""History compaction keeps the fixed prefix & recent turns within budget."""
+from scripts import history
+from scripts.history import HistoryManager
+
+
+def count_words(text, model):
+    """Stand in for tiktoken, one token per word."""
+    return len(text.split())
+
+
+def make_stream(n_turns, words_per_reply=50):
+    stream = [
+        {"role": "system", "content": "system prompt"},
+        {"role": "assistant", "content": "welcome message"},
+    ]
+    for i in range(n_turns):
+        stream += [
+            {"role": "user", "content": f"question {i}"},
+            {"role": "assistant", "content": " ".join(["word"] * words_per_reply)},
+        ]
+    return stream
+
+
+def test_compaction_keeps_prefix_and_recent_turns_under_budget(monkeypatch):
+    monkeypatch.setattr(history, "_count_tokens", count_words)
+    manager = HistoryManager(max_tokens=150, keep_turns=2)
+    stream = make_stream(n_turns=6)
+    fixed, recent = stream[:2], stream[-4:]
+    stream_id = id(stream)
+
+    report = manager.compact(stream)
+
+    assert id(stream) == stream_id # mutated in place
+    assert stream[:2] == fixed
+    assert stream[-4:] == recent
+    assert manager.count_tokens(stream) <= manager.max_tokens
+    assert report["history_tokens"] == manager.count_tokens(stream)
+    assert report["turns_dropped"] == (len(make_stream(6)) - len(stream)) // 2
+    assert report["tokens_saved"] > 0
+
+
+def test_recent_turns_are_kept_even_over_budget(monkeypatch):
+    monkeypatch.setattr(history, "_count_tokens", count_words)
+    manager = HistoryManager(max_tokens=10, keep_turns=2)
+    stream = make_stream(n_turns=4)
+
+    report = manager.compact(stream)
+
+    assert stream == make_stream(4)[:2] + make_stream(4)[-4:]
+    assert report["turns_dropped"] == 2
+
+
+def test_older_result_dumps_are_swapped_for_references(monkeypatch):
+    monkeypatch.setattr(history, "_count_tokens", count_words)
+    manager = HistoryManager(max_tokens=10_000, keep_turns=1)
+    stream = make_stream(n_turns=2)
+    dump = {"role": "user", "content": " ".join(["result"] * 200)}
+    manager.register_results(dump, "[results for question 0]")
+    stream.insert(3, dump)
+
+    report = manager.compact(stream)
+
+    assert report["turns_dropped"] == 0
+    assert stream[3]["content"] == "[results for question 0]"
+    assert report["tokens_saved"] == 200 - 4
+    # the reference doesn't start a turn, so it stays with question 0
+    assert len(stream) == 2 + 5
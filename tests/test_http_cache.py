@@ -0,0 +1,69 @@
+"""The REST cache revalidates per token & uninstalls after its block."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+import requests
+
+from scripts.http_cache import install_conditional_cache
+
+
+class ReadmeHandler(BaseHTTPRequestHandler):
+    """Serves each token its own README, answering 304 to a fresh ETag."""
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "")
+        etag = f'"{token}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"README for {token}".encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReadmeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url, token):
+    return requests.get(url, headers={"Authorization": token})
+
+
+def test_responses_are_cached_per_token(tmp_path, api_url):
+    url = f"{api_url}repos/org/repo/readme"
+    with install_conditional_cache(tmp_path, url_prefix=api_url) as cache:
+        assert get(url, "token-a").text == "README for token-a"
+        resp = get(url, "token-b")
+        assert resp.text == "README for token-b"
+        assert not getattr(resp, "from_cache", False)
+        resp = get(url, "token-a")
+        assert resp.text == "README for token-a"
+        assert resp.from_cache
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_is_uninstalled_and_never_stacked(tmp_path, api_url):
+    session_init = requests.sessions.Session.__init__
+    with install_conditional_cache(tmp_path / "outer", api_url) as outer:
+        with install_conditional_cache(tmp_path / "inner", api_url) as inner:
+            get(api_url, "token")
+        get(api_url, "token")
+    get(api_url, "token")
+    assert requests.sessions.Session.__init__ is session_init
+    # the inner block replaced the outer adapter, then restored it
+    assert (inner.misses, outer.misses) == (1, 1)
+    assert outer.hits == inner.hits == 0
@@ -0,0 +1,45 @@
+"""Licence boilerplate is dropped from READMEs, & nothing else."""
+from scripts.readme_normalise import clean_readme
+
+
+def test_titles_mentioning_a_licence_are_kept():
+    readme = (
+        "# Apply for a licence\n\n"
+        "Service for applying for an alcohol licence.\n\n"
+        "## Setup\n\nRun `make`.\n"
+    )
+    assert clean_readme(readme) == readme.strip()
+
+
+def test_licence_sections_are_dropped_to_the_next_heading():
+    readme = (
+        "# Service\n\nDoes things.\n\n"
+        "## Licence\n\nMIT, see LICENCE.\n\n"
+        "### Third party\n\nAlso MIT.\n\n"
+        "## Licence checks\n\nWe check licences.\n"
+    )
+    assert clean_readme(readme) == (
+        "# Service\n\nDoes things.\n\n"
+        "## Licence checks\n\nWe check licences."
+    )
+
+
+def test_copyright_notices_are_dropped_but_prose_kept():
+    readme = (
+        "# Service\n\n"
+        "Copyright (c) 2024 Crown\n"
+        "© Crown copyright\n"
+        "Copyright law applies to the documents we hold.\n"
+    )
+    assert clean_readme(readme) == (
+        "# Service\n\nCopyright law applies to the documents we hold."
+    )
+
+
+def test_code_blocks_are_not_read_as_headings():
+    readme = (
+        "# Service\n\n"
+        "```sh\n# licence\npip install service\n```\n\n"
+        "Then run it.\n"
+    )
+    assert clean_readme(readme) == readme.strip()
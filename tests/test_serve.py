@@ -0,0 +1,37 @@
+"""The multi-worker launcher prewarms the tool explanation once."""
+from scripts import serve, startup
+from scripts.app_config import TOOL_EXPLANATION_PREWARMED_ENV
+
+
+def test_workers_are_told_to_skip_the_prewarm(monkeypatch):
+    envs = []
+    monkeypatch.setattr(
+        serve.subprocess, "Popen", lambda cmd, cwd, env: envs.append(env)
+        )
+    serve.start_workers(3, 8100, "/tmp/test.sock")
+    assert len(envs) == 3
+    assert all(env[TOOL_EXPLANATION_PREWARMED_ENV] == "1" for env in envs)
+
+
+def test_launcher_prewarm_failures_are_logged(monkeypatch, caplog):
+    def fail():
+        raise ConnectionError("openai down")
+
+    monkeypatch.setattr(serve, "prewarm_tool_explanation", fail)
+    serve._prewarm_once()
+    assert "openai down" in caplog.text
+
+
+def test_prewarmed_workers_skip_the_tool_explanation(monkeypatch):
+    calls = []
+    monkeypatch.setattr(startup, "RETRIEVAL_SOCKET_PTH", "/tmp/test.sock")
+    monkeypatch.setattr(startup, "get_facet_index", lambda: None)
+    monkeypatch.setattr(
+        startup, "prewarm_tool_explanation", lambda: calls.append(1)
+        )
+    monkeypatch.setattr(startup, "TOOL_EXPLANATION_PREWARMED", True)
+    startup.warm_up()
+    assert calls == []
+    monkeypatch.setattr(startup, "TOOL_EXPLANATION_PREWARMED", False)
+    startup.warm_up()
+    assert calls == [1]
@@ -0,0 +1,72 @@
+"""Shard results merge into the nearest `n_results` over all shards."""
+from scripts.sharded_collection import ShardedCollection, merge_results
+
+
+class ListShard:
+    """A shard holding (id, distance) records for any query."""
+
+    metadata = {"hnsw:space": "l2"}
+
+    def __init__(self, records):
+        self.records = records
+        self.n_results = []
+
+    def count(self):
+        return len(self.records)
+
+    def query(self, query_embeddings, n_results, include):
+        self.n_results.append(n_results)
+        nearest = sorted(self.records, key=lambda r: r[1])[:n_results]
+        n = len(query_embeddings)
+        return {
+            "ids": [[i for i, _ in nearest] for _ in range(n)],
+            "distances": [[d for _, d in nearest] for _ in range(n)],
+            "documents": [[f"doc {i}" for i, _ in nearest] for _ in range(n)],
+            "metadatas": [[{"id": i} for i, _ in nearest] for _ in range(n)],
+        }
+
+
+def test_merge_orders_by_distance_and_keeps_n_results():
+    shard_a = {
+        "ids": [["a1", "a2"], ["a3"]],
+        "distances": [[0.1, 0.4], [0.2]],
+        "documents": [["A1", "A2"], ["A3"]],
+    }
+    shard_b = {
+        "ids": [["b1", "b2"], ["b3", "b4"]],
+        "distances": [[0.2, 0.3], [0.05, 0.5]],
+        "documents": [["B1", "B2"], ["B3", "B4"]],
+    }
+    merged = merge_results(
+        [shard_a, shard_b], n_results=3, include=["documents", "distances"]
+        )
+    assert merged["ids"] == [["a1", "b1", "b2"], ["b3", "a3", "b4"]]
+    assert merged["distances"] == [[0.1, 0.2, 0.3], [0.05, 0.2, 0.5]]
+    assert merged["documents"] == [["A1", "B1", "B2"], ["B3", "A3", "B4"]]
+    assert "metadatas" not in merged
+
+
+def test_merge_of_no_shards_is_empty():
+    assert merge_results([], n_results=3, include=["documents"]) == {
+        "ids": [], "documents": []
+        }
+
+
+def test_sharded_query_matches_one_collection():
+    shards = {
+        "org-a": ListShard([("a1", 0.3), ("a2", 0.1)]),
+        "org-b": ListShard([("b1", 0.2)]),
+        "org-c": ListShard([]),
+    }
+    collection = ShardedCollection(shards)
+    results = collection.query(
+        [[0.0, 1.0], [1.0, 0.0]], n_results=2, include=["metadatas"]
+        )
+    assert collection.count() == 3
+    assert results["ids"] == [["a2", "b1"], ["a2", "b1"]]
+    assert results["metadatas"][0] == [{"id": "a2"}, {"id": "b1"}]
+    assert set(results) == {"ids", "metadatas"}
+    # no shard is asked for more than it holds, empty shards aren't queried
+    assert shards["org-a"].n_results == [2]
+    assert shards["org-b"].n_results == [1]
+    assert shards["org-c"].n_results == []
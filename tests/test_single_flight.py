@@ -0,0 +1,88 @@
+"""Identical concurrent searches share one embed & one collection query."""
+import threading
+import time
+
+from scripts import chroma_utils
+from scripts.chroma_utils import ChromaDBPipeline
+
+WAIT = 5.0 # seconds, long enough never to be reached by a passing test
+
+
+class CountingCollection:
+    """A collection that counts its queries & returns two repos."""
+
+    def __init__(self):
+        self.n_queries = 0
+
+    def query(self, query_embeddings, n_results):
+        self.n_queries += 1
+        n = len(query_embeddings)
+        return {
+            "ids": [["1", "2"] for _ in range(n)],
+            "documents": [[
+                f"Name: repo-{i}, url: https://github.com/org/repo-{i}, "
+                f"Description: Repo {i} README: A README,AI Summary: Repo {i}"
+                for i in [1, 2]
+            ] for _ in range(n)],
+            "distances": [[0.1, 0.2] for _ in range(n)],
+            "metadatas": [[
+                {"org_nm": "org", "updated_at": 1_700_000_000.0}
+                for _ in [1, 2]
+            ] for _ in range(n)],
+        }
+
+
+def test_identical_concurrent_searches_embed_and_query_once(monkeypatch):
+    flights = chroma_utils.SingleFlight()
+    monkeypatch.setattr(chroma_utils, "_search_flights", flights)
+    collection = CountingCollection()
+    embeds = []
+
+    def embed_keywords(self, keywords, model=None):
+        embeds.append(keywords)
+        # hold the embed until the other search has joined this flight
+        deadline = time.monotonic() + WAIT
+        while flights.coalesced < 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return {"embeddings": [[1.0, 0.0] for _ in keywords]}
+
+    monkeypatch.setattr(ChromaDBPipeline, "embed_keywords", embed_keywords)
+
+    pipelines = []
+    for _ in range(2):
+        # one pipeline per session, on the same collection
+        pipeline = ChromaDBPipeline(
+            vector_store_pth="unused", nomic_api_key="unused"
+            )
+        pipeline.collection = collection
+        pipeline.collection_nm = "moj-github-test"
+        pipelines.append(pipeline)
+    responses = [None, None]
+
+    def search(i, keywords):
+        responses[i] = pipelines[i].execute_pipeline(
+            keywords=keywords,
+            n_results=2,
+            distance_threshold=1.0,
+            sanitised_prompt="Find data repos",
+        )
+
+    threads = [
+        threading.Thread(target=search, args=(0, ["data", "Python"])),
+        threading.Thread(target=search, args=(1, ["python", "data "])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT)
+
+    assert len(embeds) == 1
+    assert collection.n_queries == 1
+    assert flights.stats() == {"calls": 2, "coalesced": 1}
+    for response in responses:
+        assert list(response["results"]) == ["1", "2"]
+        assert [res["repo_nm"] for res in response["ui_results"]] == [
+            "repo-1", "repo-2"
+        ]
+    # each search gets its own copy of the shared results
+    assert responses[0]["results"] is not responses[1]["results"]
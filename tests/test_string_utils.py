@@ -0,0 +1,14 @@
+"""Missing summaries shorten to nothing rather than "None" or "nan"."""
+import pytest
+
+from scripts.string_utils import shorten_text
+
+
+@pytest.mark.parametrize("missing", [None, float("nan")])
+def test_missing_text_is_empty(missing):
+    assert shorten_text(missing, max_words=5) == ""
+
+
+def test_text_is_cut_to_max_words():
+    assert shorten_text("one  two\nthree", max_words=5) == "one two three"
+    assert shorten_text("one two three", max_words=2) == "one two..."
@@ -0,0 +1,82 @@
+"""Tool calls are validated up front & exclusive handlers run alone."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from scripts.tool_registry import ToolRegistry
+
+
+class Search(BaseModel):
+    query: str
+
+
+class WipeChat(BaseModel):
+    confirm: bool
+
+
+def tool_call(name, arguments):
+    return SimpleNamespace(
+        function=SimpleNamespace(name=name, arguments=arguments)
+        )
+
+
+def make_registry(events):
+    registry = ToolRegistry()
+
+    @registry.register(Search)
+    async def search(args, **context):
+        events.append(f"start {args.query}")
+        await asyncio.sleep(0.01)
+        events.append(f"end {args.query}")
+
+    @registry.register(WipeChat, exclusive=True)
+    async def wipe_chat(args, **context):
+        events.append("wipe")
+
+    return registry
+
+
+def test_invalid_arguments_are_rejected_before_any_handler_runs():
+    events = []
+    registry = make_registry(events)
+    calls = [
+        tool_call("Search", '{"query": "nlp"}'),
+        tool_call("WipeChat", '{"confirm": "not a bool"}'),
+    ]
+    with pytest.raises(ValidationError):
+        asyncio.run(registry.dispatch(calls))
+    assert events == []
+
+
+def test_exclusive_handler_runs_alone():
+    events = []
+    registry = make_registry(events)
+    calls = [
+        tool_call("Search", '{"query": "a"}'),
+        tool_call("Search", '{"query": "b"}'),
+        tool_call("WipeChat", '{"confirm": true}'),
+        tool_call("Search", '{"query": "c"}'),
+    ]
+    asyncio.run(registry.dispatch(calls))
+    # the searches before the wipe overlap, then finish before it starts
+    assert events[:2] == ["start a", "start b"]
+    assert set(events[2:4]) == {"end a", "end b"}
+    assert events[4:] == ["wipe", "start c", "end c"]
+
+
+def test_unknown_tools_are_skipped_and_context_is_passed():
+    seen = []
+    registry = ToolRegistry()
+
+    @registry.register(Search)
+    async def search(args, prompt):
+        seen.append((args.query, prompt))
+
+    calls = [
+        tool_call("Unknown", "{}"),
+        tool_call("Search", '{"query": "nlp"}'),
+    ]
+    asyncio.run(registry.dispatch(calls, prompt="find nlp repos"))
+    assert seen == [("nlp", "find nlp repos")]